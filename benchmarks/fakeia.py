@@ -0,0 +1,237 @@
+"""A local stand-in for the archive.org scrape and metadata APIs, serving synthetic collections"""
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import json
+import re
+import zlib
+import threading
+
+import numpy as np
+
+SCRAPE_PATH = "/services/search/v1/scrape"
+METADATA_PATH = "/metadata/"
+MIN_COUNT = 100  # smallest page the real scrape API allows
+
+LANGUAGES = ["chi", "eng", "jpn", "kor", "fre", "ger", "spa", "rus"]
+SUBJECTS = ["video", "bilibili", "anime", "music", "game", "vlog", "news", "tech"]
+SUB_COLLECTIONS = [f"sub_{i}" for i in range(5)]
+MEDIATYPES = ["movies", "texts", "audio", "image", "collection"]
+MEDIATYPE_WEIGHTS = [0.8, 0.1, 0.05, 0.045, 0.005]
+FILE_FORMATS = ["MPEG4", "h.264", "Ogg Video", "JPEG Thumb", "JSON", "Metadata"]
+
+
+def format_timestamp(moment: datetime, style: int) -> str:
+    """Dates come in several shapes on archive.org"""
+    if style == 0:
+        return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+    if style == 1:
+        return moment.strftime("%Y-%m-%d %H:%M:%S")
+    return moment.strftime("%Y-%m-%d")
+
+
+def generate_collection(collection_id: str, size: int, seed: int = 356) -> list[dict]:
+    """Synthetic items of a collection, oldest first.
+
+    Mimics what the scrape API returns for real collections: fields
+    missing on a share of the items, fields that hold a scalar on some
+    items and a list on others, and dates in several formats.
+    """
+    rng = np.random.default_rng(seed)
+    start = datetime(2012, 1, 1, tzinfo=timezone.utc)
+    offsets = np.sort(rng.integers(0, 12 * 365 * 86400, size))
+    mediatypes = rng.choice(MEDIATYPES, size, p=MEDIATYPE_WEIGHTS)
+    date_styles = rng.choice(3, size, p=[0.7, 0.2, 0.1])
+    language_counts = rng.choice(3, size, p=[0.1, 0.7, 0.2])
+    subject_counts = rng.choice(4, size, p=[0.1, 0.4, 0.3, 0.2])
+    sub_collection = rng.random(size) < 0.4
+    downloads = rng.zipf(1.8, size).clip(max=10**7)
+    item_sizes = rng.lognormal(18, 2, size).astype(np.int64)
+    public_delays = rng.integers(0, 3600, size)
+    has_creator = rng.random(size) < 0.9
+    has_notes = rng.random(size) < 0.2
+    year_styles = rng.choice(3, size)
+
+    items = []
+    for i in range(size):
+        added = start + timedelta(seconds=int(offsets[i]))
+        item = {
+            "identifier": f"{collection_id}_{i:08d}",
+            "mediatype": str(mediatypes[i]),
+            "addeddate": format_timestamp(added, 0),
+            "publicdate": format_timestamp(
+                added + timedelta(seconds=int(public_delays[i])), date_styles[i]
+            ),
+            "collection": (
+                [collection_id, f"{collection_id}_{SUB_COLLECTIONS[i % 5]}"]
+                if sub_collection[i]
+                else collection_id
+            ),
+            "downloads": int(downloads[i]),
+            "item_size": int(item_sizes[i]),
+            "title": f"Item {i} of {collection_id}",
+            # year only, year-month or a full date
+            "date": added.strftime(["%Y", "%Y-%m", "%Y-%m-%d"][year_styles[i]]),
+        }
+        if language_counts[i] == 1:
+            item["language"] = LANGUAGES[i % len(LANGUAGES)]
+        elif language_counts[i] == 2:
+            item["language"] = [LANGUAGES[i % len(LANGUAGES)], "eng"]
+        if subject_counts[i] == 1:
+            item["subject"] = SUBJECTS[i % len(SUBJECTS)]
+        elif subject_counts[i] > 1:
+            item["subject"] = [
+                SUBJECTS[(i + k) % len(SUBJECTS)] for k in range(subject_counts[i])
+            ]
+        if has_creator[i]:
+            item["creator"] = f"uploader{i % 997}"
+        if has_notes[i]:
+            item["notes"] = "re-uploaded"
+        items.append(item)
+    return items
+
+
+def generate_item_metadata(identifier: str) -> dict:
+    """Synthetic Metadata API response of an item, the same for every call"""
+    rng = np.random.default_rng(zlib.crc32(identifier.encode()))
+    files = []
+    for i in range(int(rng.integers(2, 8))):
+        files.append(
+            {
+                "name": f"{identifier}_{i}",
+                "source": "original" if i < 2 else "derivative",
+                "format": FILE_FORMATS[int(rng.integers(len(FILE_FORMATS)))],
+                "size": str(int(rng.lognormal(14, 2))),
+            }
+        )
+    return {"metadata": {"identifier": identifier}, "files": files}
+
+
+class FakeCollection:
+    """Items of one collection indexed by addeddate for range queries"""
+
+    def __init__(self, items: list[dict]):
+        self.items = sorted(items, key=lambda item: item["addeddate"])
+        self.dates = [item["addeddate"] for item in self.items]
+
+    def select(self, start: str, end: str) -> list[dict]:
+        low = 0 if start == "*" else bisect_left(self.dates, start)
+        # day bounds are inclusive, so compare against the whole day
+        high = len(self.items) if end == "*" else bisect_right(self.dates, end + "\uffff")
+        return self.items[low:high]
+
+
+QUERY_COLLECTION = re.compile(r"collection:(\S+)")
+QUERY_RANGE = re.compile(r"addeddate:\[(\S+) TO (\S+)\]")
+
+
+class FakeScrapeHandler(BaseHTTPRequestHandler):
+    collections: dict[str, FakeCollection] = {}
+    throttle_every = 0  # answer every nth request with a 429 when set
+    requests_seen = 0
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.startswith(METADATA_PATH):
+            self.send_json(generate_item_metadata(url.path[len(METADATA_PATH) :]))
+            return
+        if url.path != SCRAPE_PATH:
+            self.send_json({"error": f"unknown path {url.path}"}, 404)
+            return
+        type(self).requests_seen += 1
+        if self.throttle_every and self.requests_seen % self.throttle_every == 0:
+            self.send_json({"error": "rate limit exceeded"}, 429, {"Retry-After": "1"})
+            return
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        self.send_json(self.scrape(params))
+
+    do_GET = do_POST
+
+    def scrape(self, params: dict) -> dict:
+        query = params.get("q", "")
+        match = QUERY_COLLECTION.search(query)
+        collection = self.collections.get(match.group(1).strip("()\"")) if match else None
+        if collection is None:
+            return {"items": [], "count": 0, "total": 0}
+
+        # resumed shard queries carry two ranges, keep their intersection
+        start, end = "*", "*"
+        for low, high in QUERY_RANGE.findall(query):
+            if low != "*":
+                start = low if start == "*" else max(start, low)
+            if high != "*":
+                end = high if end == "*" else min(end, high)
+        results = collection.select(start, end)
+        if params.get("total_only") == "true":
+            return {"total": len(results)}
+
+        if "addeddate desc" in params.get("sorts", ""):
+            results = results[::-1]
+        count = max(int(params.get("count", 10000)), MIN_COUNT)
+        offset = int(params.get("cursor") or 0)
+        page = results[offset : offset + count]
+        fields = params.get("fields", "identifier").split(",")
+        if "*" not in fields:
+            page = [
+                {field: item[field] for field in fields if field in item} for item in page
+            ]
+        response = {"items": page, "count": len(page), "total": len(results)}
+        if offset + count < len(results):
+            response["cursor"] = str(offset + count)
+        return response
+
+    def send_json(self, body: dict, status: int = 200, headers: dict | None = None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeArchive:
+    """Serves synthetic collections on localhost until stopped"""
+
+    def __init__(self, collections: dict[str, list[dict]], throttle_every: int = 0):
+        handler = type(
+            "Handler",
+            (FakeScrapeHandler,),
+            {
+                "collections": {
+                    key: FakeCollection(items) for key, items in collections.items()
+                },
+                "throttle_every": throttle_every,
+            },
+        )
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def host(self) -> str:
+        return "{}:{}".format(*self.server.server_address)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def point_session(session, host: str):
+    """Send the search requests of an ia.ArchiveSession to host over plain http.
+
+    ArchiveSession appends .archive.org to any configured host, so the
+    attributes ia.Search builds its URLs from are overridden instead.
+    """
+    session.host = host
+    session.protocol = "http:"
+    session.secure = False
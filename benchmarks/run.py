@@ -0,0 +1,249 @@
+"""Time and memory-profile the collection pipeline on synthetic collections.
+
+Everything runs offline: collections are generated locally and served by
+a fake of the archive.org scrape and metadata APIs, and the cache goes to a temporary
+directory. Run from the repository root:
+
+    PYTHONPATH=src python benchmarks/run.py --sizes 10000 100000
+    PYTHONPATH=src python benchmarks/run.py --sizes 10000 --update-baselines
+
+Results are compared against benchmarks/baselines.json and the exit code
+is 1 when a stage got slower or hungrier than its baseline allows.
+"""
+
+from pathlib import Path
+import argparse
+import gc
+import json
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from fakeia import FakeArchive, generate_collection, point_session
+from ia_collection_analyzer import iahelper, itemhelper
+from ia_collection_analyzer.cachehelper import CacheStore
+from ia_collection_analyzer.constdatas import CACHE_MAX_BYTES, REQUIRED_METADATA
+from ia_collection_analyzer.iahelper import get_collection_frame
+from ia_collection_analyzer.itemhelper import get_items_metadata
+from ia_collection_analyzer.pdhelper import clean_collection, normalize_list_columns
+from ia_collection_analyzer.plothelper import (
+    build_list_index,
+    category_crosstab,
+    numeric_metrics,
+)
+from ia_collection_analyzer.queryhelper import (
+    cleaned_fields,
+    open_collection,
+    plan_query,
+    query_crosstab,
+    query_metrics,
+)
+from ia_collection_analyzer.rolluphelper import (
+    build_rollup,
+    plan_rollup,
+    rollup_crosstab,
+    rollup_metrics,
+)
+from ia_collection_analyzer.transformhelper import (
+    TransformPipeline,
+    TransformResult,
+    TransformStep,
+)
+
+BASELINES = Path(__file__).with_name("baselines.json")
+COLLECTION_ID = "benchmark_collection"
+# differences below these are noise, whatever the relative change
+MIN_SECONDS = 0.1
+MIN_PEAK_MIB = 1.0
+# item metadata is fetched one request per item, only time a slice of them
+ENRICH_ITEMS = 2000
+
+
+def transform(items_pd: pd.DataFrame):
+    """The computations behind transform_data, replayed by a transform pipeline"""
+    value_counts = items_pd["creator"].value_counts()
+    mapping = {str(value): "Others" for value in value_counts.index[10:]}
+    pipeline = TransformPipeline()
+    pipeline.set_step("creator", TransformStep("Value Mapping", {"mapping": mapping}))
+    pipeline.set_step("date", TransformStep("Date Quarter", {}))
+    pipeline.set_step("title", TransformStep("String Prefix", {"prefix_len": 10}))
+    pipeline.set_step("downloads", TransformStep("Numeric Bins", {"num_bins": 5}))
+    for column in pipeline.steps:
+        pipeline.evaluate(
+            column, "benchmark", lambda: TransformResult(items_pd[column], None)
+        )
+
+
+def plot(items_pd: pd.DataFrame):
+    """The aggregations behind plot_data"""
+    for column in ("language", "subject", "collection"):
+        category_crosstab(items_pd["addedyear"], build_list_index(items_pd[column]))
+    numeric_metrics(items_pd["mediatype"], items_pd["item_size"])
+    numeric_metrics(items_pd["addedyear"], items_pd["downloads"])
+
+
+def lazy_plot(calendar_columns: dict):
+    """The aggregations of plot, queried from the cache file instead.
+
+    Arrow allocates outside of the Python heap, so tracemalloc doesn't see
+    its memory.
+    """
+    dataset = open_collection(COLLECTION_ID)
+    kept = cleaned_fields(COLLECTION_ID)
+    for column in ("language", "subject", "collection"):
+        query_crosstab(
+            plan_query(
+                dataset, REQUIRED_METADATA, "addedyear", column, calendar_columns, kept=kept
+            )
+        )
+    for x, y in (("mediatype", "item_size"), ("addedyear", "downloads")):
+        query_metrics(
+            plan_query(dataset, REQUIRED_METADATA, x, y, calendar_columns, kept=kept)
+        )
+
+
+def rollup_plot(rollup):
+    """The aggregations of plot, answered from the rollup cells instead.
+
+    plot_data needs medians and computes the metrics from the rows, these
+    are the metrics without them, as the Overview charts use.
+    """
+    for column in ("language", "subject", "collection"):
+        query = plan_rollup(rollup, REQUIRED_METADATA, "addedyear", column)
+        if query is not None:
+            rollup_crosstab(query)
+    for x, y in (("mediatype", "item_size"), ("addedyear", "downloads")):
+        rollup_metrics(plan_rollup(rollup, REQUIRED_METADATA, x, y, with_median=False))
+
+
+def measure(fn, setup=None) -> dict:
+    """Wall time of one call, then the traced peak memory of another.
+
+    setup, if given, returns fresh arguments for every call and is not measured.
+    """
+    args = setup() if setup else ()
+    gc.collect()
+    start = time.perf_counter()
+    fn(*args)
+    seconds = time.perf_counter() - start
+
+    args = setup() if setup else ()
+    gc.collect()
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": round(seconds, 3), "peak_mib": round(peak / 1024**2, 1)}
+
+
+def run_size(size: int, throttle_every: int = 0) -> dict:
+    items = generate_collection(COLLECTION_ID, size)
+    results = {}
+    with FakeArchive(
+        {COLLECTION_ID: items}, throttle_every
+    ) as fake, tempfile.TemporaryDirectory() as cache:
+        point_session(iahelper.ia_session, fake.host)
+        iahelper.CACHE_DIR = Path(cache)
+        iahelper.collection_store = CacheStore(Path(cache), CACHE_MAX_BYTES)
+
+        # a progress hook, as the app passes one, also keeps tqdm quiet
+        results["fetch"] = measure(
+            lambda: get_collection_frame(
+                COLLECTION_ID, lambda add, total: None, full_resync=True
+            )
+        )
+        results["cache_load"] = measure(lambda: get_collection_frame(COLLECTION_ID))
+
+        # both modify the frame they are given, start from a fresh load each time
+        def load():
+            return (get_collection_frame(COLLECTION_ID),)
+
+        results["normalize_list_columns"] = measure(normalize_list_columns, load)
+        results["clean"] = measure(clean_collection, load)
+
+        items_pd, info = clean_collection(get_collection_frame(COLLECTION_ID))
+        results["transform"] = measure(transform, lambda: (items_pd,))
+        results["plot"] = measure(plot, lambda: (items_pd,))
+        results["lazy_plot"] = measure(lazy_plot, lambda: (info["calendar_columns"],))
+        results["rollup_build"] = measure(
+            build_rollup, lambda: (items_pd, info["calendar_columns"])
+        )
+        rollup = build_rollup(items_pd, info["calendar_columns"])
+        results["rollup_plot"] = measure(rollup_plot, lambda: (rollup,))
+
+        itemhelper.ITEM_CACHE_DIR = Path(cache) / "item"
+        identifiers = items_pd["identifier"].head(ENRICH_ITEMS).tolist()
+
+        def cold_item_cache():
+            shutil.rmtree(itemhelper.ITEM_CACHE_DIR, ignore_errors=True)
+            return (identifiers, lambda add, total: None)
+
+        results["enrich"] = measure(get_items_metadata, cold_item_cache)
+        results["enrich_cached"] = measure(lambda: get_items_metadata(identifiers))
+    return results
+
+
+def compare(results: dict, baselines: dict, tolerance: float) -> list[str]:
+    """Stages that exceed their baseline by more than tolerance"""
+    regressions = []
+    for size, stages in results.items():
+        for stage, result in stages.items():
+            baseline = baselines.get(size, {}).get(stage)
+            if baseline is None:
+                continue
+            for metric, floor in (("seconds", MIN_SECONDS), ("peak_mib", MIN_PEAK_MIB)):
+                limit = max(baseline[metric] * (1 + tolerance), baseline[metric] + floor)
+                if result[metric] > limit:
+                    regressions.append(
+                        f"{stage} @ {size}: {metric} {result[metric]} > {baseline[metric]}"
+                    )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="allowed relative slowdown"
+    )
+    parser.add_argument(
+        "--throttle-every",
+        type=int,
+        default=0,
+        help="answer every nth request with a 429, to exercise retries",
+    )
+    parser.add_argument(
+        "--update-baselines", action="store_true", help="store these results as baselines"
+    )
+    args = parser.parse_args()
+
+    baselines = json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+    results = {}
+    for size in args.sizes:
+        print(f"Benchmarking {size} items...")
+        results[str(size)] = run_size(size, args.throttle_every)
+        for stage, result in results[str(size)].items():
+            baseline = baselines.get(str(size), {}).get(stage, {})
+            print(
+                f"  {stage:<24} {result['seconds']:>8.3f}s {result['peak_mib']:>8.1f} MiB"
+                f"   baseline {baseline.get('seconds', '-')}s {baseline.get('peak_mib', '-')} MiB"
+            )
+
+    if args.update_baselines:
+        baselines.update(results)
+        BASELINES.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        print(f"Baselines written to {BASELINES}")
+        return
+
+    regressions = compare(results, baselines, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
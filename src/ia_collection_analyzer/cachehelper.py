@@ -0,0 +1,252 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Hashable
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ia_collection_analyzer.constdatas import (
+    CACHE_ACCESS_FLUSH_INTERVAL,
+    CACHE_COMPRESSION,
+    CACHE_SCHEMA_VERSION,
+    COLLECTION_TTL,
+)
+
+
+def write_table_atomic(filename: Path, table: pa.Table):
+    """Write a compressed Parquet file, never leaving a partial one at filename"""
+    tmp_filename = filename.with_name(f".{filename.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        pq.write_table(table, tmp_filename, compression=CACHE_COMPRESSION)
+        os.replace(tmp_filename, filename)
+    finally:
+        tmp_filename.unlink(missing_ok=True)
+
+
+def write_json_atomic(filename: Path, data: dict):
+    tmp_filename = filename.with_name(f".{filename.name}.tmp")
+    with open(tmp_filename, "w") as tmp_file:
+        json.dump(data, tmp_file, indent=2)
+    os.replace(tmp_filename, filename)
+
+
+def file_digest(filename: Path) -> str:
+    with open(filename, "rb") as file:
+        return hashlib.file_digest(file, "sha1").hexdigest()
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache, bounded by the size of its values in bytes.
+
+    sizeof measures the values put without an explicit size. A value larger
+    than max_bytes on its own isn't kept, unless keep_newest is set: then
+    the newest value always stays, even when it is over budget alone.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        sizeof: Callable[[object], int] | None = None,
+        keep_newest: bool = False,
+    ):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.keep_newest = keep_newest
+        self.entries: OrderedDict[Hashable, tuple[object, int]] = OrderedDict()
+        self.size = 0
+        self.lock = threading.RLock()
+
+    def get(self, key: Hashable):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def put(self, key: Hashable, value, nbytes: int | None = None):
+        if nbytes is None:
+            nbytes = self.sizeof(value)
+        with self.lock:
+            self.discard(key)
+            if nbytes > self.max_bytes and not self.keep_newest:
+                return
+            self.entries[key] = (value, nbytes)
+            self.size += nbytes
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], object]):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def discard(self, key: Hashable):
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class CacheStore:
+    """Compressed Parquet tables indexed by a JSON manifest.
+
+    Files are named after the digest of their content and only show up
+    under that name once completely written. The manifest records, for
+    every key, the file, its size, the schema version, the item count,
+    the fetch time, the last access and free-form metadata. Entries whose
+    file went missing or doesn't match the manifest are dropped on read,
+    and the least recently used ones are evicted beyond max_bytes.
+    Checkpoint directories (*.partial) next to the tables are deleted once
+    they haven't been written to for checkpoint_ttl.
+    """
+
+    def __init__(self, root: Path, max_bytes: int, checkpoint_ttl: float = COLLECTION_TTL):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.checkpoint_ttl = checkpoint_ttl
+        self.manifest_filename = self.root / "manifest.json"
+        self.lock = threading.RLock()
+        self.entries = self.load_manifest()
+        self.flushed_at = time.time()
+        self.sweep()
+
+    def load_manifest(self) -> dict:
+        try:
+            with open(self.manifest_filename, "r") as manifest_file:
+                manifest = json.load(manifest_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Cache manifest unreadable, starting over: {e}")
+            return {}
+        if manifest.get("schema_version") != CACHE_SCHEMA_VERSION:
+            return {}
+        return manifest["entries"]
+
+    def write_manifest(self):
+        self.flushed_at = time.time()
+        write_json_atomic(
+            self.manifest_filename,
+            {"schema_version": CACHE_SCHEMA_VERSION, "entries": self.entries},
+        )
+
+    def sweep(self):
+        """Delete table files no entry points to, e.g. left by a crash, the
+        JSON caches from before the store and abandoned checkpoints"""
+        with self.lock:
+            referenced = {entry["file"] for entry in self.entries.values()}
+            for filename in self.root.glob("*.parquet"):
+                if filename.name not in referenced:
+                    filename.unlink()
+            for filename in self.root.glob(".*.tmp"):
+                filename.unlink()
+            # <sha1>.json and <sha1>.meta.json
+            for filename in self.root.glob("*.json"):
+                if filename != self.manifest_filename:
+                    filename.unlink()
+            # every save replaces the checkpoint manifest, touching the directory
+            for dirname in self.root.glob("*.partial"):
+                if time.time() - dirname.stat().st_mtime >= self.checkpoint_ttl:
+                    shutil.rmtree(dirname, ignore_errors=True)
+
+    def path(self, entry: dict) -> Path:
+        return self.root / entry["file"]
+
+    def validate(self, entry: dict) -> bool:
+        filename = self.path(entry)
+        try:
+            if filename.stat().st_size != entry["size"]:
+                return False
+            # the footer is small and read last, a torn file fails here
+            return pq.read_metadata(filename).num_rows == entry["count"]
+        except (OSError, pa.ArrowInvalid):
+            return False
+
+    def get(self, key: str) -> dict | None:
+        """The manifest entry of key if its file is intact, expired or not"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry["schema_version"] != CACHE_SCHEMA_VERSION or not self.validate(entry):
+                print(f"Cache entry {key} is corrupt, dropping it")
+                self.remove(key)
+                return None
+            # written with the next change, or once the access times are old enough
+            entry["last_access"] = time.time()
+            if entry["last_access"] - self.flushed_at >= CACHE_ACCESS_FLUSH_INTERVAL:
+                self.write_manifest()
+            return dict(entry)
+
+    def put(
+        self, key: str, table: pa.Table, meta: dict | None = None, fetched_at: float | None = None
+    ) -> dict:
+        """Store table under key, replacing the previous version"""
+        tmp_filename = self.root / f".{uuid.uuid4().hex}.parquet.tmp"
+        try:
+            pq.write_table(table, tmp_filename, compression=CACHE_COMPRESSION)
+            filename = self.root / f"{file_digest(tmp_filename)}.parquet"
+            os.replace(tmp_filename, filename)
+        finally:
+            tmp_filename.unlink(missing_ok=True)
+        with self.lock:
+            previous = self.entries.get(key)
+            self.entries[key] = entry = {
+                "file": filename.name,
+                "size": filename.stat().st_size,
+                "schema_version": CACHE_SCHEMA_VERSION,
+                "count": table.num_rows,
+                "fetched_at": fetched_at or time.time(),
+                "last_access": time.time(),
+                "meta": meta or {},
+            }
+            if previous is not None:
+                self.release(previous["file"])
+            self.evict(keep=key)
+            self.write_manifest()
+            return dict(entry)
+
+    def remove(self, key: str):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.release(entry["file"])
+                self.write_manifest()
+
+    def release(self, file: str):
+        """Delete a table file once no entry points to it anymore"""
+        if all(entry["file"] != file for entry in self.entries.values()):
+            (self.root / file).unlink(missing_ok=True)
+
+    def size(self) -> int:
+        with self.lock:
+            return sum(
+                entry["size"]
+                for entry in {entry["file"]: entry for entry in self.entries.values()}.values()
+            )
+
+    def evict(self, keep: str | None = None):
+        """Remove least recently used entries until the files fit in max_bytes"""
+        with self.lock:
+            by_last_access = sorted(self.entries, key=lambda k: self.entries[k]["last_access"])
+            for key in by_last_access:
+                if self.size() <= self.max_bytes:
+                    break
+                if key != keep:
+                    entry = self.entries.pop(key)
+                    self.release(entry["file"])
@@ -6,6 +6,68 @@ ITEM_CACHE_DIR =  CACHE_DIR / "item"
 
 # Cache configuration 
 COLLECTION_TTL = 30 * 24 * 3600  # 30 * 24 hours in seconds
+ITEM_TTL = 7 * 24 * 3600  # per-item metadata summaries in ITEM_CACHE_DIR
+CACHE_MAX_BYTES = 5 * 1024 * 1024 * 1024  # least recently used entries go beyond this
+CACHE_COMPRESSION = "zstd"
+# reads only update last access times in memory, written at most this often
+CACHE_ACCESS_FLUSH_INTERVAL = 300
+# bumped whenever the layout of the cached tables changes, older entries are dropped
+CACHE_SCHEMA_VERSION = 1
+# expired caches are refreshed with items newer than this field's max value
+HWM_FIELD = "addeddate"
+
+# Fetch configuration
+FETCH_WORKERS = 4  # concurrent search cursors for large collections
+FETCH_JOB_WORKERS = 2  # collections downloaded in the background at once
+FETCH_MAX_CONCURRENCY = 8  # in-flight IA requests the limiter may ramp up to
+FETCH_RETRIES = 5  # times a failed search resumes from its checkpoint
+BACKOFF_BASE = 2.0  # seconds, doubled on every retry
+BACKOFF_MAX = 120.0
+ITEM_FETCH_WORKERS = 8  # item metadata requests in flight for one enrichment
+ITEM_RETRIES = 3
+SHARD_SIZE = 20000  # target items per addeddate shard
+FIELD_SAMPLE_SIZE = 1000  # items sampled to decide which fields to fetch
+MIN_FIELD_FILL = 0.5  # fields filled in fewer sampled items are not fetched
+CHECKPOINT_SIZE = 10000  # items appended to the on-disk checkpoint at a time
+
+# Rollups built when a collection is loaded, stored next to its cache.
+# Cells are keyed by year and month of the dates with these calendar
+# prefixes ("" is the date column of clean_collection) and by
+# CATEGORICAL_METADATA, and hold count/sum/min/max of the measures
+ROLLUP_PREFIXES = ["", "added"]
+ROLLUP_MEASURES = ["item_size", "downloads"]
+
+# clean_collection drops the columns filled in for less than COLUMN_MIN_FILL
+# of the items, then the items filled in for less than ROW_MIN_FILL of the
+# columns left
+COLUMN_MIN_FILL = 0.8
+ROW_MIN_FILL = 0.7
+
+# Memory bound of the per-session plot aggregation cache
+AGGREGATION_CACHE_BYTES = 64 * 1024 * 1024
+# Memory bound of the per-session cache of transformed columns
+TRANSFORM_CACHE_BYTES = 256 * 1024 * 1024
+# Memory bound of the cleaned datasets shared by all sessions of the server
+DATASET_MEMORY_BUDGET = 2 * 1024 * 1024 * 1024
+# Filtered collections with more rows than this are analyzed on a sample first
+SAMPLE_THRESHOLD = 100000
+SAMPLE_SIZE = 20000  # rows of a stratified sample, spread over strata by size
+SAMPLE_MIN_STRATUM = 30  # rows sampled at least from every stratum
+CONFIDENCE_Z = 1.96  # 95% confidence intervals
+AGGREGATION_JOB_WORKERS = 2  # exact aggregations refined in the background at once
+# Sketches of the filtered rows of a column, built once per filter for Value Mapping
+HLL_PRECISION = 14  # 2**14 registers, about 0.8% error on distinct counts
+CMS_WIDTH = 2**16  # counts overestimated by at most e / CMS_WIDTH of the rows
+CMS_DEPTH = 4  # ...with probability 1 - e**-CMS_DEPTH
+# Payload bounds of the charts and tables plot_data sends to the browser
+CHART_TOP_K = 20  # categories charted, the others are summed into one
+CHART_MAX_POINTS = 1000  # points of a charted series, downsampled beyond this
+TABLE_PAGE_ROWS = 100  # rows of a result table sent at a time
+# Stage timings kept in memory for the Performance panel
+PERF_LOG_SIZE = 2000
+# Share of HTTP responses whose full record is logged, all are counted
+TELEMETRY_SAMPLE_RATE = 0.01
+TELEMETRY_MAX_SAMPLES = 1000
 
 # Required metadata fields
 REQUIRED_METADATA = [
@@ -14,4 +76,26 @@ REQUIRED_METADATA = [
     "identifier",
     "mediatype",
     # "uploader", # IA removed this field automatically.
-]
\ No newline at end of file
+]
+
+# Low-cardinality fields stored dictionary-encoded and loaded as categoricals
+CATEGORICAL_METADATA = [
+    "mediatype",
+    "language",
+    "collection",
+]
+
+# Date fields parsed to datetimes when a collection is loaded
+DATE_METADATA = [
+    "addeddate",
+    "publicdate",
+]
+
+# Date fields that get {prefix}year/month/day/quarter/week columns on load
+CALENDAR_PREFIXES = {
+    "addeddate": "added",
+    "publicdate": "public",
+}
+
+# String columns with at most this share of distinct values become categoricals
+CATEGORY_MAX_RATIO = 0.5
@@ -0,0 +1,67 @@
+from typing import Callable, Hashable
+
+import pandas as pd
+
+from ia_collection_analyzer.cachehelper import LRUCache
+from ia_collection_analyzer.constdatas import DATASET_MEMORY_BUDGET
+from ia_collection_analyzer.pdhelper import normalize_list_columns
+from ia_collection_analyzer.plothelper import build_list_index
+
+
+class DatasetRegistry(LRUCache):
+    """Process-wide LRU of cleaned datasets, bounded by their memory size.
+
+    Streamlit imports this module once per server process, so every browser
+    session sees the same registry and shares the frames in it. Datasets
+    must be treated as read-only; derive new frames instead of mutating.
+    The newest dataset is always kept, even when over budget alone.
+    """
+
+    def __init__(self, max_bytes: int):
+        super().__init__(max_bytes, keep_newest=True)
+
+    def put_latest(self, key: Hashable, dataset: dict, nbytes: int):
+        """Register the dataset of a (collection id, cache version) key and drop
+        the other versions of the collection, stale once its cache changed"""
+        with self.lock:
+            for stale in [other for other in self.entries if other[0] == key[0]]:
+                self.discard(stale)
+            self.put(key, dataset, nbytes)
+
+    def build_once(self, dataset: dict, group: str, name: Hashable, build: Callable):
+        """dataset[group][name], built the first time it is asked for.
+
+        The dataset is shared by every session, so it is only extended
+        under the registry lock.
+        """
+        with self.lock:
+            entries = dataset.setdefault(group, {})
+            if name not in entries:
+                entries[name] = build()
+            return entries[name]
+
+
+def with_field(dataset: dict, field: str, values: pd.DataFrame) -> dict:
+    """Copy of a dataset with a field fetched later (identifier and field
+    columns), profiled and indexed like the fields loaded with the collection.
+
+    Datasets are shared, the original is left as it is.
+    """
+    values = normalize_list_columns(values).drop_duplicates("identifier")
+    kind = values.attrs["column_profile"][field]
+    items_pd = dataset["items_pd"]
+    extended = items_pd.assign(
+        **{field: items_pd["identifier"].map(values.set_index("identifier")[field])}
+    )
+    extended.attrs = {
+        **items_pd.attrs,
+        "column_profile": {**items_pd.attrs.get("column_profile", {}), field: kind},
+    }
+    list_indexes = dict(dataset["list_indexes"])
+    if kind == "list":
+        list_indexes[field] = build_list_index(extended[field])
+    # the rollup doesn't have the field, plots of it are answered from the rows
+    return {**dataset, "items_pd": extended, "list_indexes": list_indexes}
+
+
+dataset_registry = DatasetRegistry(DATASET_MEMORY_BUDGET)
@@ -1,38 +1,128 @@
-import time
-
-import streamlit as st
-
-from ia_collection_analyzer.iahelper import get_collection_items_metadata
-
-
-def fetch_metadata(collection_id):
-    progress_message_text = "Getting count and estimating time..."
-    progress_message = st.markdown(progress_message_text)
-    progress_bar = st.progress(0)
-    items_processed = 0
-    start_time = time.time()
-
-    def progress_hook(add, total):
-        nonlocal items_processed
-        nonlocal progress_message_text
-        items_processed += add
-        progress = 0 if total == 0 else items_processed / total
-        current_time = time.time()
-        elapsed_time = current_time - start_time
-
-        last_progress_message = (
-            f"`{items_processed}/{total}` processed, "
-            f"`{progress*100:.2f}%` done, "
-            f"`{items_processed/(elapsed_time):.2f}`/s, "
-            f"Elapsed: `{elapsed_time:.2f}`s, "
-            f"ETA: `{' ∞ ' if progress == 0 else f'{(elapsed_time / progress) * (1 - progress):.2f}'}`s, "
-            f"Total: `{' ∞ ' if progress == 0 else f'{elapsed_time / progress:.2f}'}`s"
+import threading
+
+from ia_collection_analyzer.constdatas import COLUMN_MIN_FILL
+from ia_collection_analyzer.datasethelper import dataset_registry
+from ia_collection_analyzer.iahelper import (
+    backfill_field,
+    get_backfilled_fields,
+    get_cache_version,
+    get_collection_frame,
+)
+from ia_collection_analyzer.itemhelper import get_items_metadata
+from ia_collection_analyzer.jobhelper import FetchJob, job_manager
+from ia_collection_analyzer.pdhelper import clean_collection
+from ia_collection_analyzer.perfhelper import trace
+from ia_collection_analyzer.plothelper import build_list_indexes, frame_bytes
+from ia_collection_analyzer.rolluphelper import load_rollup
+
+
+def format_progress(status: dict) -> str:
+    """Progress line of a fetch job status"""
+    items_processed = status["processed"]
+    total = status["total"]
+    elapsed_time = status["elapsed"]
+    if elapsed_time == 0:
+        return "Getting count and estimating time..."
+    progress = 0 if total == 0 else min(items_processed / total, 1)
+
+    return (
+        f"`{items_processed}/{total}` processed, "
+        f"`{progress*100:.2f}%` done, "
+        f"`{items_processed/(elapsed_time):.2f}`/s, "
+        f"Elapsed: `{elapsed_time:.2f}`s, "
+        f"ETA: `{' ∞ ' if progress == 0 else f'{(elapsed_time / progress) * (1 - progress):.2f}'}`s, "
+        f"Total: `{' ∞ ' if progress == 0 else f'{elapsed_time / progress:.2f}'}`s"
+    )
+
+
+def get_cached_dataset(collection_id):
+    """Key of the registered dataset of a collection, if its cache is still fresh"""
+    key = (collection_id, get_cache_version(collection_id))
+    if key[1] is None or dataset_registry.get(key) is None:
+        return None
+    return key
+
+
+# start_fetch looks at both jobs of a collection before submitting one
+fetch_lock = threading.Lock()
+
+
+def build_dataset(
+    job: FetchJob, collection_id, full_resync=False, min_fill=COLUMN_MIN_FILL
+):
+    """Fetch, clean and register a collection, returns its dataset key"""
+    with trace(collection_id):
+        job.set_message("Getting count and estimating time...")
+        # columns under 80% filled are dropped while cleaning, so don't even load them
+        items_pd = get_collection_frame(collection_id, job.progress_hook, full_resync, min_fill)
+        progress_message = format_progress(job.status())
+        if items_pd.empty:
+            return None
+
+        items_pd, info = clean_collection(
+            items_pd, job.set_message, keep=get_backfilled_fields(collection_id)
         )
-        progress_message.markdown(last_progress_message)
-        progress_bar.progress(progress)
-        progress_message_text = last_progress_message
+        key = (collection_id, get_cache_version(collection_id))
+        job.set_message("rolling up headline aggregations...")
+        # rebuilt whenever the cache changes, e.g. on refresh
+        rollup = load_rollup(collection_id, key[1], items_pd, info["calendar_columns"])
+        job.set_message(
+            "Data transformation and cleaning complete!"
+            f" Compact column types saved {info['saved_bytes'] / 1024**2:.1f} MiB."
+        )
+        dataset = {
+            "items_pd": items_pd,
+            "list_indexes": build_list_indexes(items_pd, items_pd.attrs["column_profile"]),
+            "calendar_columns": info["calendar_columns"],
+            "rollup": rollup,
+            "progress_message": progress_message,
+        }
+        dataset_registry.put_latest(key, dataset, frame_bytes(items_pd))
+        return key
+
+
+def start_fetch(collection_id, full_resync=False) -> FetchJob | None:
+    """Fetch a collection in the background, or join the fetch already running.
+
+    Jobs are keyed by (collection_id, full_resync). Both write the same
+    files, so a fetch joins a running full resync, which gets the new items
+    too, and a full resync isn't started while a fetch runs: None then.
+    """
+    with fetch_lock:
+        resync = job_manager.get((collection_id, True))
+        if resync is not None and not resync.done():
+            return resync
+        fetch = job_manager.get((collection_id, False))
+        if full_resync and fetch is not None and not fetch.done():
+            return None
+        return job_manager.submit(
+            (collection_id, full_resync), build_dataset, collection_id, full_resync
+        )
+
+
+def fetch_field(job: FetchJob, collection_id, field):
+    """Fetch a field skipped at fetch time, returns its identifier and field columns"""
+    with trace(collection_id):
+        job.set_message(f"Fetching {field}...")
+        return backfill_field(collection_id, field, job.progress_hook)
+
+
+def start_field_fetch(collection_id, field) -> FetchJob:
+    """Fetch a field in the background, or join the fetch already running"""
+    return job_manager.submit(
+        ("field", collection_id, field), fetch_field, collection_id, field
+    )
+
+
+def fetch_item_details(job: FetchJob, collection_id, identifiers):
+    """Fetch the per-item metadata summaries of a collection, returns them as a frame"""
+    with trace(collection_id):
+        job.set_message("Fetching the metadata of every item...")
+        return get_items_metadata(identifiers, job.progress_hook)
 
-    items = get_collection_items_metadata(collection_id, progress_hook)
-    progress_bar.progress(100)
 
-    return items, progress_message_text
+def start_item_fetch(collection_id, identifiers) -> FetchJob:
+    """Fetch item details in the background, or join the fetch already running"""
+    return job_manager.submit(
+        ("items", collection_id), fetch_item_details, collection_id, identifiers
+    )
@@ -1,99 +1,672 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from datetime import date, timedelta
+from itertools import islice
 from pathlib import Path
 import json
 import logging
+import math
 import os
+import shutil
+import threading
 import time
 import hashlib
 import random
+import re
 
 import requests
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import internetarchive as ia
 from tqdm import tqdm
+from urllib3.util.retry import Retry
+from ia_collection_analyzer.cachehelper import (
+    CacheStore,
+    write_json_atomic,
+    write_table_atomic,
+)
 from ia_collection_analyzer.constdatas import (
+    BACKOFF_MAX,
     CACHE_DIR,
+    CACHE_MAX_BYTES,
+    CATEGORICAL_METADATA,
+    CHECKPOINT_SIZE,
     COLLECTION_TTL,
+    FETCH_MAX_CONCURRENCY,
+    FETCH_RETRIES,
+    FETCH_WORKERS,
+    FIELD_SAMPLE_SIZE,
+    HWM_FIELD,
+    MIN_FIELD_FILL,
     REQUIRED_METADATA,
+    SHARD_SIZE,
+)
+from ia_collection_analyzer.pdhelper import (
+    concat_tables,
+    drop_duplicate_rows,
+    frame_to_table,
+    table_to_frame,
+)
+from ia_collection_analyzer.perfhelper import stage
+from ia_collection_analyzer.telemetryhelper import request_telemetry
+from ia_collection_analyzer.throttlehelper import (
+    THROTTLE_STATUSES,
+    AdaptiveLimiter,
+    backoff_delay,
+    is_throttled,
+    retry_after_seconds,
 )
 
 
 CACHE_DIR.mkdir(exist_ok=True)
 
 logger = logging.getLogger(__name__)
-ia_session = ia.ArchiveSession()
 
+# requests are retried by urllib3 first, honoring Retry-After, with jitter
+# so that shard workers throttled together don't come back together
+SEARCH_RETRY = Retry(
+    total=5,
+    connect=5,
+    read=5,
+    redirect=False,
+    status_forcelist=sorted(THROTTLE_STATUSES),
+    allowed_methods=["POST", "HEAD", "GET", "OPTIONS"],
+    backoff_factor=1,
+    backoff_jitter=1,
+    backoff_max=BACKOFF_MAX,
+    respect_retry_after_header=True,
+)
+# shared by every fetch of the process, so concurrent jobs share the budget
+search_limiter = AdaptiveLimiter(FETCH_WORKERS, FETCH_MAX_CONCURRENCY)
+
+
+class ThrottledSession(ia.ArchiveSession):
+    """ArchiveSession sending its requests through search_limiter.
+
+    Its retrying adapter is mounted once, when the session is created.
+    ia.Search mounts a new one for every search, which isn't thread-safe
+    across shard workers and would drop the pooled connections.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("http_adapter_kwargs", {"max_retries": SEARCH_RETRY})
+        self.adapter_mounted = False
+        super().__init__(*args, **kwargs)
+        self.adapter_mounted = True
+
+    def mount_http_adapter(self, *args, **kwargs):
+        if not self.adapter_mounted:
+            super().mount_http_adapter(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        with search_limiter.slot():
+            try:
+                response = super().send(request, **kwargs)
+            except requests.RequestException as e:
+                search_limiter.record_throttle(
+                    retry_after_seconds(getattr(e, "response", None))
+                )
+                raise
+        if is_throttled(response):
+            search_limiter.record_throttle(retry_after_seconds(response))
+        else:
+            search_limiter.record_success()
+        return response
 
-def print_request(r: requests.Response, *args, **kwargs):
-    for _r in r.history:
-        print("Resp (history): ", _r.request.method, _r.status_code, _r.reason, _r.url)
-    print(f"Resp: {r.request.method} {r.status_code} {r.reason} {r.url}")
-    if r.raw._connection and r.raw._connection.sock:
-        print(
-            f"Conn: {r.raw._connection.sock.getsockname()} -> {r.raw._connection.sock.getpeername()[0]}"
-        )
 
+ia_session = ThrottledSession()
+ia_session.hooks["response"].append(request_telemetry.response_hook)
 
-ia_session.hooks["response"].append(print_request)
+collection_store = CacheStore(CACHE_DIR, CACHE_MAX_BYTES)
+
+
+def get_cache_key(collection_id) -> str:
+    return f"collection_{collection_id}"
 
 
 def get_cache_filename(key: str = str(random.random() * random.random())) -> Path:
+    """Base name of the files of key that live outside the store, like checkpoints"""
     path = CACHE_DIR
     key = hashlib.sha1(key.encode()).hexdigest()
-    return path / f"{key}.json"
+    return path / f"{key}.parquet"
 
 
-def is_cache_valid(filename, ttl: float | int) -> bool:
-    if not os.path.exists(filename):
-        return False
+def is_cache_fresh(entry: dict | None, ttl: float | int = COLLECTION_TTL) -> bool:
+    return entry is not None and (time.time() - entry["fetched_at"]) < ttl
 
-    file_mtime = os.path.getmtime(filename)
-    return (time.time() - file_mtime) < ttl
 
+def write_collection_cache(cache_filename: Path, table: pa.Table):
+    with stage("cache write", table):
+        write_table_atomic(cache_filename, table)
 
-def get_collection(collection_id, progress_hook=None) -> list:
-    cache_key = f"collection_{collection_id}"
-    cache_filename = get_cache_filename(key=cache_key)
 
-    if is_cache_valid(cache_filename, COLLECTION_TTL):
-        logger.info(f"Using cache for {collection_id}")
-        with open(cache_filename, "r") as cache_file:
-            collection = json.load(cache_file)
-            if progress_hook:
-                progress_hook(len(collection), len(collection))
-    else:
-        logger.info(f"Fetching collection {collection_id}")
+def read_collection_table(
+    cache_filename: Path, columns: list[str] | None = None
+) -> pa.Table:
+    present = pq.read_schema(cache_filename).names
+    if columns is not None:
+        columns = [col for col in present if col in columns]
+    with stage("cache read") as current:
+        table = pq.read_table(
+            cache_filename,
+            columns=columns,
+            read_dictionary=[col for col in CATEGORICAL_METADATA if col in present],
+        )
+        current.record(table)
+    return table
+
+
+def read_collection_cache(
+    cache_filename: Path, columns: list[str] | None = None
+) -> pd.DataFrame:
+    table = read_collection_table(cache_filename, columns)
+    with stage("dataframe construction", table):
+        return table_to_frame(table)
+
+
+def high_water_mark(table: pa.Table, field: str = HWM_FIELD) -> str | None:
+    # IA dates are ISO-like strings, so the lexical max is the latest one
+    if field not in table.column_names:
+        return None
+    return pc.max(table.column(field)).as_py()
+
+
+def merge_collections(table: pa.Table, new_table: pa.Table) -> pa.Table:
+    # newer copies win, and stay in front to keep the "addeddate desc" order
+    return drop_duplicate_rows(concat_tables([new_table, table]))
+
+
+class Checkpoint:
+    """Pages of an unfinished fetch, appended to disk as they arrive.
+
+    The manifest keeps, per search query, how many items were saved, the
+    addeddate of the last one, the identifiers saved with that addeddate and
+    whether the query finished, so a later fetch can resume from there.
+    """
+
+    def __init__(self, cache_filename: Path, tag: str = "fetch"):
+        self.path = cache_filename.with_suffix(f".{tag}.partial")
+        self.lock = threading.Lock()
+        self.manifest = {"started_at": time.time(), "queries": {}, "parts": []}
+        manifest_filename = self.path / "manifest.json"
+        if os.path.exists(manifest_filename):
+            with open(manifest_filename, "r") as manifest_file:
+                manifest = json.load(manifest_file)
+            if time.time() - manifest["started_at"] < COLLECTION_TTL:
+                self.manifest = manifest
+
+    @property
+    def resuming(self) -> bool:
+        return bool(self.manifest["parts"])
+
+    def state(self, query: str) -> dict:
+        with self.lock:
+            return dict(self.manifest["queries"].get(query, {}))
+
+    def save(self, query: str, items: list[dict], done: bool = False):
+        with self.lock:
+            self.path.mkdir(exist_ok=True)
+            state = self.manifest["queries"].setdefault(query, {"count": 0})
+            if items:
+                part = f"part-{len(self.manifest['parts']):05d}.parquet"
+                # each chunk is typed and normalized on its own, so only
+                # one chunk of raw result dicts is ever held in memory
+                with stage("page conversion", items):
+                    table = frame_to_table(pd.DataFrame(items))
+                write_collection_cache(self.path / part, table)
+                self.manifest["parts"].append(part)
+                state["count"] += len(items)
+                last = items[-1].get(HWM_FIELD)
+                if last:
+                    # a resumed search starts at last again, skipping these
+                    ties = [
+                        item.get("identifier")
+                        for item in items
+                        if item.get(HWM_FIELD) == last
+                    ]
+                    if last == state.get("last"):
+                        ties = state.get("last_ids", []) + ties
+                    state["last"], state["last_ids"] = last, ties
+            state["done"] = done
+            self.write_manifest()
+
+    def write_manifest(self):
+        self.path.mkdir(exist_ok=True)
+        write_json_atomic(self.path / "manifest.json", self.manifest)
+
+    def load_table(self) -> pa.Table | None:
+        tables = [
+            read_collection_table(self.path / part) for part in self.manifest["parts"]
+        ]
+        if not tables:
+            return None
+        return drop_duplicate_rows(concat_tables(tables))
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.manifest = {"started_at": time.time(), "queries": {}, "parts": []}
+
+
+def escape_query_value(value: str) -> str:
+    """value with the characters special to Lucene queries escaped"""
+    return re.sub(r'([+\-!(){}\[\]^"~*?:\\/&|\s])', r"\\\1", value)
+
+
+def fetch_search(
+    query: str,
+    checkpoint: Checkpoint,
+    progress_hook=None,
+    fields=None,
+    retries: int = FETCH_RETRIES,
+) -> int | None:
+    """Stream the results of query into checkpoint, return how many were fetched.
+
+    When paging fails, the search is retried up to retries times after a
+    jittered backoff, continuing from the last checkpointed item.
+    """
+    state = checkpoint.state(query)
+    if state.get("done"):
+        if progress_hook:
+            progress_hook(state["count"], state["count"])
+        return state["count"]
+    resumed = state.get("count", 0)
+    fetched = resumed
+    total_items = None
+    attempt = 0
+    with stage("search paging") as current:
+        current.record(query=query)
+        while True:
+            search_query = query
+            state = checkpoint.state(query)
+            last, saved = state.get("last"), set(state.get("last_ids", []))
+            if last:
+                # results come newest first, so continue from the last saved item
+                search_query = f"{query} AND {HWM_FIELD}:[* TO {escape_query_value(last)}]"
+            batch = []
+            try:
+                search = ia.Search(
+                    ia_session,
+                    query=search_query,
+                    sorts=["addeddate desc"],
+                    fields=fields or ["*"],
+                )
+                if total_items is None:
+                    # the resumed query leaves out the items saved before
+                    unresumed = search
+                    if search_query != query:
+                        unresumed = ia.Search(ia_session, query=query)
+                    if unresumed.num_found is None:
+                        raise ValueError(f"no total items for {query}")
+                    total_items = int(unresumed.num_found)
+                    if progress_hook:
+                        progress_hook(0, total_items)
+                        if resumed:
+                            progress_hook(resumed, total_items)
+                # the UI reports progress itself, only draw a bar on the console
+                for result in tqdm(
+                    search,
+                    desc=f"Fetching {query}",
+                    total=total_items,
+                    disable=progress_hook is not None,
+                ):
+                    if "error" in result and "identifier" not in result:
+                        # ia.Search yields the error body before raising on it
+                        raise ValueError(result["error"])
+                    if result.get(HWM_FIELD) == last and result.get("identifier") in saved:
+                        continue
+                    batch.append(result)
+                    fetched += 1
+                    if progress_hook:
+                        progress_hook(1, total_items)
+                    if len(batch) >= CHECKPOINT_SIZE:
+                        checkpoint.save(query, batch)
+                        batch = []
+                break
+            except (requests.RequestException, ValueError) as e:
+                checkpoint.save(query, batch)
+                attempt += 1
+                if attempt > retries:
+                    print(f"Fetching {query} stopped after {fetched} items: {e}")
+                    current.record(rows=fetched - resumed, retries=retries, interrupted=True)
+                    return None
+                delay = backoff_delay(attempt, retry_after_seconds(getattr(e, "response", None)))
+                print(
+                    f"Fetching {query} failed after {fetched} items: {e},"
+                    f" retry {attempt}/{retries} in {delay:.1f}s"
+                )
+                time.sleep(delay)
+        current.record(rows=fetched - resumed, retries=attempt)
+    checkpoint.save(query, batch, done=True)
+
+    return fetched
+
+
+def get_date_bounds(query: str, field: str = HWM_FIELD) -> tuple[str, str] | None:
+    bounds = []
+    for order in ("asc", "desc"):
         search = ia.Search(
             ia_session,
-            query="collection:" + collection_id,
-            sorts=["addeddate desc"],
-            fields=["*"],
+            query=query,
+            sorts=[f"{field} {order}"],
+            fields=[field],
+            params={"count": 100},  # smallest page the scrape API allows
+        )
+        first = next(iter(search), None)
+        if not first or not first.get(field):
+            return None
+        bounds.append(first[field])
+    return bounds[0], bounds[1]
+
+
+def plan_shards(
+    first_date: str, last_date: str, num_found: int, shard_size: int = SHARD_SIZE
+) -> list[tuple[str, str]]:
+    """Split [first_date, last_date] into day ranges of ~shard_size items, newest first"""
+    first_day = date.fromisoformat(first_date[:10])
+    last_day = date.fromisoformat(last_date[:10])
+    span = (last_day - first_day).days
+    num_shards = max(1, min(math.ceil(num_found / shard_size), span))
+    boundaries = [
+        first_day + timedelta(days=round(i * span / num_shards))
+        for i in range(num_shards + 1)
+    ]
+    # ranges are inclusive on both ends, the shared boundary days are
+    # deduplicated on identifier after fetching
+    shards = [
+        (start.isoformat(), end.isoformat())
+        for start, end in zip(boundaries, boundaries[1:])
+    ]
+    return shards[::-1] or [(first_day.isoformat(), last_day.isoformat())]
+
+
+def fetch_search_sharded(
+    query: str,
+    checkpoint: Checkpoint,
+    progress_hook=None,
+    workers: int = FETCH_WORKERS,
+    fields=None,
+) -> int | None:
+    try:
+        total_items = int(
+            ia.Search(ia_session, query=query).num_found
+        )
+    except TypeError:
+        total_items = 0
+    # a resumed fetch must reuse its shard queries to find their checkpoints
+    shards = checkpoint.manifest.get("shards")
+    if shards is None:
+        bounds = (
+            get_date_bounds(query) if total_items > SHARD_SIZE and workers > 1 else None
         )
-        collection = []
-        total_items = search.num_found
-        try:
-            total_items = int(search.num_found)
-        except TypeError:
-            total_items = 0
-            print(
-                f"Failed to get total items for {collection_id}: search.num_found={search.num_found}"
+        if bounds is None:
+            return fetch_search(query, checkpoint, progress_hook, fields)
+        shards = plan_shards(*bounds, total_items)
+        checkpoint.manifest["shards"] = shards
+    logger.info(f"Fetching {query} in {len(shards)} shards with {workers} workers")
+    if progress_hook:
+        progress_hook(0, total_items)
+
+    # workers only count, progress_hook is called from this thread
+    fetched = 0
+    lock = threading.Lock()
+
+    def shard_progress(add, total):
+        nonlocal fetched
+        with lock:
+            fetched += add
+
+    reported = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # each shard gets a copy of the context, so its stages keep the trace
+        futures = [
+            executor.submit(
+                copy_context().run,
+                fetch_search,
+                f"{query} AND {HWM_FIELD}:[{start} TO {end}]",
+                checkpoint,
+                shard_progress,
+                fields,
             )
-            return []
-        if progress_hook:
-            progress_hook(0, total_items)
-        for result in tqdm(
-            search, desc=f"Fetching {collection_id}", total=search.num_found
-        ):
-            collection.append(result)
-            if progress_hook:
-                progress_hook(1, total_items)
-        
-        if len(collection) == 0:
+            for start, end in shards
+        ]
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            with lock:
+                delta, reported = fetched - reported, fetched
+            if progress_hook and delta:
+                progress_hook(delta, total_items)
+
+    results = [future.result() for future in futures]
+    if any(result is None for result in results):
+        return None
+    return sum(results)
+
+
+def sample_fields(
+    query: str, sample_size: int = FIELD_SAMPLE_SIZE, min_fill: float = MIN_FIELD_FILL
+) -> tuple[list[str], list[str]]:
+    """Return the well populated fields and all fields seen in a sample of query"""
+    search = ia.Search(
+        ia_session,
+        query=query,
+        fields=["*"],
+        params={"count": sample_size},
+    )
+    fill = {}
+    sample = list(islice(search, sample_size))
+    for item in sample:
+        for field in item:
+            fill[field] = fill.get(field, 0) + 1
+
+    fields = [
+        field for field, filled in fill.items() if filled >= min_fill * len(sample)
+    ]
+    return project_fields(fields), sorted(fill)
+
+
+def project_fields(fields: list[str]) -> list[str]:
+    return REQUIRED_METADATA + [field for field in fields if field not in REQUIRED_METADATA]
+
+
+def get_collection_frame(
+    collection_id,
+    progress_hook=None,
+    full_resync=False,
+    min_fill=0.0,
+    workers=FETCH_WORKERS,
+    fields=None,
+) -> pd.DataFrame:
+    cache_key = get_cache_key(collection_id)
+    entry = collection_store.get(cache_key)
+
+    cache_hit = not full_resync and is_cache_fresh(entry)
+    if cache_hit:
+        logger.info(f"Using cache for {collection_id}")
+    else:
+        refreshed = refresh_collection_cache(
+            collection_id, progress_hook, full_resync, workers, fields
+        )
+        request_telemetry.emit(collection_id)
+        entry = collection_store.get(cache_key)
+        if not refreshed or entry is None:
+            return pd.DataFrame()
+
+    # only read the columns that are populated enough to survive cleaning
+    columns = None
+    if min_fill > 0 and "fill" in entry["meta"]:
+        columns = filled_fields(entry, min_fill)
+    frame = read_collection_cache(collection_store.path(entry), columns)
+    if progress_hook and cache_hit:
+        progress_hook(len(frame), len(frame))
+    return frame
+
+
+def filled_fields(entry: dict, min_fill: float) -> list[str]:
+    """Required fields, and the cached fields filled in for at least min_fill
+    of the items or backfilled"""
+    meta = entry["meta"]
+    backfilled = meta.get("backfilled", [])
+    return REQUIRED_METADATA + [
+        col
+        for col, filled in meta["fill"].items()
+        if col not in REQUIRED_METADATA
+        and (filled >= min_fill * entry["count"] or col in backfilled)
+    ]
+
+
+def refresh_collection_cache(
+    collection_id,
+    progress_hook=None,
+    full_resync=False,
+    workers=FETCH_WORKERS,
+    fields=None,
+) -> bool:
+    query = "collection:" + collection_id
+    cache_key = get_cache_key(collection_id)
+    cache_filename = get_cache_filename(key=cache_key)
+    entry = collection_store.get(cache_key)
+    meta = entry["meta"] if entry is not None else {}
+    available_fields = meta.get("available_fields", [])
+    # fields asked for by name are kept however sparse, refreshes included
+    backfilled = meta.get("backfilled", [])
+    if not full_resync and meta.get("hwm"):
+        # expired cache: only ask for items added since the last fetch.
+        # Day granularity keeps the query free of escaping; the overlap is
+        # deduplicated on identifier by merge_collections.
+        logger.info(f"Refreshing collection {collection_id} since {meta['hwm']}")
+        fields = meta.get("fields")
+        checkpoint = Checkpoint(cache_filename, tag="refresh")
+        fetched = fetch_search(
+            f"{query} AND {HWM_FIELD}:[{meta['hwm'][:10]} TO *]",
+            checkpoint,
+            progress_hook,
+            fields,
+        )
+        if fetched is None:
+            print(f"Failed to refresh {collection_id}, using stale cache")
+            return True
+        table = read_collection_table(collection_store.path(entry))
+        new_table = checkpoint.load_table()
+        if new_table is not None:
+            table = merge_collections(table, new_table)
+    else:
+        checkpoint = Checkpoint(cache_filename)
+        if fields is not None:
+            fields = project_fields(fields)
+            if checkpoint.manifest.get("fields", fields) != fields:
+                checkpoint.clear()
+        elif "fields" in checkpoint.manifest:
+            fields = checkpoint.manifest["fields"]
+            available_fields = checkpoint.manifest["available_fields"]
+        else:
+            # most fields are too sparse to survive cleaning, don't download them
+            fields, available_fields = sample_fields(query)
+            fields += [field for field in backfilled if field not in fields]
+        if checkpoint.resuming:
+            logger.info(f"Resuming collection {collection_id} from checkpoint")
+        else:
+            logger.info(f"Fetching collection {collection_id}")
+        if fields:
+            backfilled = [field for field in backfilled if field in fields]
+        checkpoint.manifest["fields"] = fields
+        checkpoint.manifest["available_fields"] = available_fields
+
+        if fetch_search_sharded(query, checkpoint, progress_hook, workers, fields) is None:
+            print(f"Failed to fetch {collection_id}, progress kept for the next try")
+            return False
+        table = checkpoint.load_table()
+        if table is None:
+            checkpoint.clear()
             print(f"Failed to get any items for {collection_id}")
-            return []
+            return False
+
+    with stage("cache write", table):
+        collection_store.put(
+            cache_key,
+            table,
+            {
+                "hwm": high_water_mark(table) or meta.get("hwm"),
+                "fill": {
+                    col: len(table) - table.column(col).null_count
+                    for col in table.column_names
+                },
+                "fields": fields,
+                "available_fields": available_fields,
+                "backfilled": backfilled,
+            },
+        )
+    checkpoint.clear()
+    return True
 
-        with open(cache_filename, "w") as cache_file:
-            json.dump(collection, cache_file, indent=2)
 
-    return collection
+def get_cache_version(collection_id) -> str | None:
+    """Return the file of a still fresh collection cache, None if it needs fetching"""
+    entry = collection_store.get(get_cache_key(collection_id))
+    if not is_cache_fresh(entry):
+        return None
+    # files are named after their content, so any change gives a new version
+    return entry["file"]
+
+
+def get_collection_fields(collection_id) -> tuple[list[str], list[str]]:
+    """Return the fetched and the fetchable fields of a cached collection"""
+    entry = collection_store.get(get_cache_key(collection_id))
+    meta = entry["meta"] if entry is not None else {}
+    fields = meta.get("fields") or list(meta.get("fill", {}))
+    return fields, meta.get("available_fields", [])
+
+
+def get_backfilled_fields(collection_id) -> list[str]:
+    """Return the fields fetched on request, kept whatever their fill"""
+    entry = collection_store.get(get_cache_key(collection_id))
+    return entry["meta"].get("backfilled", []) if entry is not None else []
+
+
+def backfill_field(
+    collection_id, field: str, progress_hook=None, workers=FETCH_WORKERS
+) -> pd.DataFrame:
+    """Fetch a single field for a cached collection and add it to the cache"""
+    cache_key = get_cache_key(collection_id)
+    entry = collection_store.get(cache_key)
+    if entry is None:
+        print(f"Failed to backfill {field}, {collection_id} is not cached")
+        return pd.DataFrame(columns=["identifier", field])
+    query = "collection:" + collection_id
+    checkpoint = Checkpoint(get_cache_filename(key=cache_key), tag=f"backfill-{field}")
+    fetched = fetch_search_sharded(
+        query, checkpoint, progress_hook, workers, ["identifier", field]
+    )
+    request_telemetry.emit(collection_id)
+    values = checkpoint.load_table()
+    if fetched is None or values is None:
+        print(f"Failed to backfill {field} for {collection_id}")
+        return pd.DataFrame(columns=["identifier", field])
+
+    values = table_to_frame(values).set_index("identifier")[field]
+    frame = read_collection_cache(collection_store.path(entry))
+    frame[field] = frame["identifier"].map(values)
+    meta = entry["meta"]
+    meta["fill"][field] = int(frame[field].notna().sum())
+    if meta.get("fields") and field not in meta["fields"]:
+        meta["fields"].append(field)
+    backfilled = meta.setdefault("backfilled", [])
+    if field not in backfilled:
+        backfilled.append(field)
+    # the items are as old as before, only one field is newer
+    collection_store.put(cache_key, frame_to_table(frame), meta, entry["fetched_at"])
+    checkpoint.clear()
+    return frame[["identifier", field]]
+
+
+def get_collection(collection_id, progress_hook=None, full_resync=False) -> list:
+    frame = get_collection_frame(collection_id, progress_hook, full_resync)
+    return [
+        {key: value for key, value in item.items() if value is not None and value == value}
+        for item in frame.to_dict("records")
+    ]
 
 
 def get_collection_items(collection_id) -> list:
@@ -106,8 +679,10 @@ def get_item_metadata(item_id) -> dict:
     return metadata
 
 
-def get_collection_items_metadata(collection_id, progress_hook=None) -> list[dict]:
-    metadatas = get_collection(collection_id, progress_hook)
+def get_collection_items_metadata(
+    collection_id, progress_hook=None, full_resync=False
+) -> list[dict]:
+    metadatas = get_collection(collection_id, progress_hook, full_resync)
     return metadatas
 
 
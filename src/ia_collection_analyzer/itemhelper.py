@@ -0,0 +1,162 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+from pathlib import Path
+import hashlib
+import json
+import logging
+import time
+
+import pandas as pd
+import requests
+
+from ia_collection_analyzer.cachehelper import write_json_atomic
+from ia_collection_analyzer.constdatas import (
+    ITEM_CACHE_DIR,
+    ITEM_FETCH_WORKERS,
+    ITEM_RETRIES,
+    ITEM_TTL,
+)
+from ia_collection_analyzer.iahelper import ia_session
+from ia_collection_analyzer.perfhelper import stage
+from ia_collection_analyzer.telemetryhelper import request_telemetry
+from ia_collection_analyzer.throttlehelper import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+# columns only the full metadata of an item has, summarized from its file list
+ITEM_FIELDS = [
+    "files_count",
+    "files_size",
+    "original_files",
+    "original_size",
+    "largest_file",
+    "formats",
+]
+
+
+def file_size(file: dict) -> int:
+    size = file.get("size", "")
+    return int(size) if str(size).isdigit() else 0
+
+
+def summarize_item(metadata: dict) -> dict:
+    """The ITEM_FIELDS of a Metadata API response"""
+    files = metadata.get("files", [])
+    sizes = [file_size(file) for file in files]
+    originals = [file for file in files if file.get("source") == "original"]
+    return {
+        "files_count": len(files),
+        "files_size": sum(sizes),
+        "original_files": len(originals),
+        "original_size": sum(file_size(file) for file in originals),
+        "largest_file": max(sizes, default=0),
+        "formats": sorted({file["format"] for file in files if file.get("format")}),
+    }
+
+
+def get_item_cache_filename(identifier: str) -> Path:
+    # spread over subdirectories, a collection can have hundreds of thousands of items
+    bucket = hashlib.sha1(identifier.encode()).hexdigest()[:2]
+    return ITEM_CACHE_DIR / bucket / f"{identifier}.json"
+
+
+def read_item_cache(identifier: str, ttl: int = ITEM_TTL) -> dict | None:
+    """Cached summary of an item, None if missing, expired or unreadable"""
+    try:
+        with open(get_item_cache_filename(identifier)) as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+    if time.time() - cache.get("fetched_at", 0) > ttl:
+        return None
+    return cache.get("summary")
+
+
+def write_item_cache(identifier: str, summary: dict):
+    filename = get_item_cache_filename(identifier)
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    write_json_atomic(filename, {"fetched_at": time.time(), "summary": summary})
+
+
+def fetch_item_summary(identifier: str, retries: int = ITEM_RETRIES) -> dict:
+    """Fetch, summarize and cache the metadata of one item"""
+    for attempt in range(retries + 1):
+        try:
+            summary = summarize_item(ia_session.get_metadata(identifier))
+            break
+        except (requests.RequestException, ValueError):
+            if attempt == retries:
+                raise
+            time.sleep(backoff_delay(attempt + 1))
+    write_item_cache(identifier, summary)
+    return summary
+
+
+def get_items_metadata(
+    identifiers: list[str],
+    progress_hook=None,
+    workers: int = ITEM_FETCH_WORKERS,
+    ttl: int = ITEM_TTL,
+) -> pd.DataFrame:
+    """ITEM_FIELDS of items, one row per identifier.
+
+    Items cached within ttl are not fetched again, the others are fetched
+    workers at a time. Items that still fail after retries are left out.
+    """
+    identifiers = list(dict.fromkeys(identifiers))
+    summaries = {}
+    missing = []
+    with stage("item cache read") as current:
+        for identifier in identifiers:
+            summary = read_item_cache(identifier, ttl)
+            if summary is None:
+                missing.append(identifier)
+            else:
+                summaries[identifier] = summary
+        current.record(rows=len(summaries))
+    if progress_hook:
+        progress_hook(len(summaries), len(identifiers))
+    logger.info(f"{len(summaries)} items cached, fetching {len(missing)}")
+
+    failed = 0
+    with stage("item metadata fetch") as current, ThreadPoolExecutor(
+        max_workers=workers
+    ) as executor:
+        futures = {
+            executor.submit(copy_context().run, fetch_item_summary, identifier): identifier
+            for identifier in missing
+        }
+        for future in as_completed(futures):
+            try:
+                summaries[futures[future]] = future.result()
+            except (requests.RequestException, ValueError) as e:
+                failed += 1
+                logger.info(f"Skipping {futures[future]}: {e}")
+            if progress_hook:
+                progress_hook(1, len(identifiers))
+        current.record(rows=len(missing) - failed, failed=failed)
+    if missing:
+        request_telemetry.emit("item metadata")
+    if failed:
+        print(f"Failed to fetch the metadata of {failed} items")
+
+    return pd.DataFrame(
+        [
+            {"identifier": identifier, **summaries[identifier]}
+            for identifier in identifiers
+            if identifier in summaries
+        ],
+        columns=["identifier"] + ITEM_FIELDS,
+    )
+
+
+def join_items_metadata(frame: pd.DataFrame, items: pd.DataFrame) -> pd.DataFrame:
+    """frame with the ITEM_FIELDS of its items, keeping its index and rows"""
+    joined = frame.join(items.set_index("identifier"), on="identifier")
+    joined.attrs = dict(frame.attrs)
+    if "column_profile" in frame.attrs:
+        joined.attrs["column_profile"] = {
+            **frame.attrs["column_profile"],
+            **{field: "list" if field == "formats" else "scalar" for field in ITEM_FIELDS},
+        }
+    return joined
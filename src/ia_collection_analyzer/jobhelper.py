@@ -0,0 +1,120 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Hashable
+import logging
+import threading
+import time
+
+from ia_collection_analyzer.constdatas import AGGREGATION_JOB_WORKERS, FETCH_JOB_WORKERS
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class FetchJob:
+    """A download running in the background, polled by the UI for progress"""
+
+    def __init__(self, key: Hashable):
+        self.key = key
+        self.state = PENDING
+        self.processed = 0
+        self.total = 0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self.lock = threading.Lock()
+
+    def progress_hook(self, add: int, total: int):
+        with self.lock:
+            self.processed += add
+            self.total = total
+
+    def set_message(self, message: str):
+        with self.lock:
+            self.message = message
+
+    def done(self) -> bool:
+        return self.state in (DONE, FAILED)
+
+    def wait(self, timeout: float | None = None):
+        """Block until the job finished and return its result"""
+        self.future.result(timeout)
+        return self.result
+
+    def status(self) -> dict:
+        with self.lock:
+            started_at = self.started_at or time.time()
+            finished_at = self.finished_at or time.time()
+            return {
+                "key": self.key,
+                "state": self.state,
+                "processed": self.processed,
+                "total": self.total,
+                "message": self.message,
+                "error": self.error,
+                "elapsed": finished_at - started_at if self.started_at else 0.0,
+            }
+
+
+class JobManager:
+    """Runs jobs on a small thread pool, one job per key at a time.
+
+    Submitting a key whose job is still pending or running returns that
+    job, so every session asking for the same collection shares one
+    download. Finished jobs are kept until the key is submitted again.
+    """
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = "fetch-job"):
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix=thread_name_prefix)
+        self.jobs: dict[Hashable, FetchJob] = {}
+        self.lock = threading.Lock()
+
+    def submit(self, key: Hashable, fn: Callable, *args, **kwargs) -> FetchJob:
+        """Run fn(job, *args, **kwargs) in the background, or join the running job"""
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None and not job.done():
+                return job
+            job = FetchJob(key)
+            self.jobs[key] = job
+            job.future = self.executor.submit(self._run, job, fn, args, kwargs)
+            return job
+
+    def _run(self, job: FetchJob, fn: Callable, args: tuple, kwargs: dict):
+        with job.lock:
+            job.state = RUNNING
+            job.started_at = time.time()
+        try:
+            result = fn(job, *args, **kwargs)
+        except Exception as e:
+            logger.exception(f"Job {job.key} failed")
+            with job.lock:
+                job.error = f"{type(e).__name__}: {e}"
+                job.state = FAILED
+                job.finished_at = time.time()
+            return
+        with job.lock:
+            job.result = result
+            job.state = DONE
+            job.finished_at = time.time()
+
+    def get(self, key: Hashable) -> FetchJob | None:
+        with self.lock:
+            return self.jobs.get(key)
+
+    def discard(self, key: Hashable):
+        """Forget a job once its result was picked up, it keeps running if not done"""
+        with self.lock:
+            self.jobs.pop(key, None)
+
+
+job_manager = JobManager(FETCH_JOB_WORKERS)
+# exact aggregations refined behind sampled estimates, apart from the downloads
+aggregation_jobs = JobManager(AGGREGATION_JOB_WORKERS, "aggregation-job")
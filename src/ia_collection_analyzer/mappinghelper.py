@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from ia_collection_analyzer.plothelper import ListIndex, factorize
+
+# example rows shown per mapping in the preview of a Value Mapping
+PREVIEW_PER_MAPPING = 5
+
+
+def compile_mapping(mapping_table: list[dict]) -> dict[str, object]:
+    """{source: target} of a mapping table, sources are str() of the values"""
+    return {
+        str(source): mapping["target"]
+        for mapping in mapping_table
+        for source in mapping["sources"]
+    }
+
+
+def column_codes(series: pd.Series) -> tuple[np.ndarray, pd.Index]:
+    """Codes of the values of a scalar column, -1 where missing"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.cat.categories
+    return factorize(series)
+
+
+def remap_codes(categories: pd.Index, mapping: dict) -> tuple[np.ndarray, pd.Index]:
+    """New code of every category once mapped, and the mapped categories"""
+    mapped = [mapping.get(str(value), value) for value in categories]
+    remap, mapped_categories = factorize(pd.Series(mapped, dtype=object))
+    return remap, mapped_categories
+
+
+def map_codes(codes: np.ndarray, remap: np.ndarray) -> np.ndarray:
+    # a trailing -1 keeps missing values missing
+    return np.append(remap, -1)[codes]
+
+
+def map_column(series: pd.Series, mapping: dict) -> pd.Series:
+    """Map the values of a scalar column, as a categorical, in one pass"""
+    codes, categories = column_codes(series)
+    remap, mapped_categories = remap_codes(categories, mapping)
+    mapped = pd.Categorical.from_codes(
+        map_codes(codes, remap), dtype=pd.CategoricalDtype(mapped_categories)
+    )
+    return pd.Series(mapped, index=series.index, name=series.name)
+
+
+def map_list_index(index: ListIndex, mapping: dict) -> ListIndex:
+    """Map the elements of an indexed list column"""
+    remap, categories = remap_codes(index.categories, mapping)
+    return ListIndex(index.rows, remap[index.codes], categories, index.length)
+
+
+def list_index_to_column(index: ListIndex, like: pd.Series) -> pd.Series:
+    """The list column of an index, missing where like is missing"""
+    # rows are sorted, so every row is one slice of the elements
+    offsets = np.zeros(index.length + 1, dtype=np.int64)
+    np.cumsum(np.bincount(index.rows, minlength=index.length), out=offsets[1:])
+    categories = index.categories.to_numpy(dtype=object)
+    try:
+        # arrow builds the python lists in C
+        elements = pa.DictionaryArray.from_arrays(
+            pa.array(index.codes, type=pa.int64()), pa.array(categories)
+        ).dictionary_decode()
+        lists = pa.LargeListArray.from_arrays(pa.array(offsets), elements).to_pylist()
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # elements of mixed types
+        values = categories[index.codes]
+        lists = [
+            values[start:end].tolist()
+            for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())
+        ]
+    column = pd.Series(lists, index=like.index, name=like.name, dtype=object)
+    column[like.isna().to_numpy()] = None
+    return column
+
+
+def code_value_counts(codes: np.ndarray, categories: pd.Index) -> pd.Series:
+    """value_counts from codes, without the values that don't occur"""
+    counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+    value_counts = pd.Series(counts, index=categories)
+    return value_counts[value_counts > 0].sort_values(ascending=False)
+
+
+def mapping_preview(
+    series: pd.Series,
+    mapped: pd.Series,
+    codes: np.ndarray,
+    categories: pd.Index,
+    mapping_table: list[dict],
+    rows: np.ndarray | None = None,
+) -> pd.DataFrame:
+    """A few rows of every mapping and one unmapped row, before and after.
+
+    codes are the value codes of series, or the element codes of an
+    indexed list column found at rows. Every example is found by one
+    first-occurrence lookup over the codes.
+    """
+    present, first = np.unique(codes, return_index=True)
+    first = first[present >= 0]
+    present = present[present >= 0]
+    if rows is not None:
+        first = rows[first]
+    first_row = dict(zip(categories[present].map(str), first))
+
+    positions = []
+    mapped_sources = set()
+    for mapping in mapping_table:
+        sources = [str(source) for source in mapping["sources"]]
+        mapped_sources.update(sources)
+        found = [first_row[source] for source in sources if source in first_row]
+        positions.extend(found[:PREVIEW_PER_MAPPING])
+    unmapped = [row for value, row in first_row.items() if value not in mapped_sources]
+    positions.extend(unmapped[:1])
+
+    positions = list(dict.fromkeys(positions))
+    return pd.DataFrame(
+        {
+            "Original": series.iloc[positions],
+            "Transformed": mapped.iloc[positions],
+        }
+    )
@@ -1,23 +1,268 @@
-def normalize_list_columns(df):
-    normalized_cols = []
-    for col in df.columns:
-        # Sample values to check types (more efficient than checking all)
-        sample = df[col].dropna().head(1000)
-
-        # Check if column contains mix of lists and single values
-        has_list = any(isinstance(x, list) for x in sample)
-        has_single = any(isinstance(x, (str, int, float)) for x in sample)
-
-        if has_list and has_single:
-            df[col] = df[col].apply(
-                lambda x: [x]
-                if isinstance(x, (str, int, float))
-                else x
-                if isinstance(x, list)
-                else None
-            )
-            normalized_cols.append(col)
+import gc
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from ia_collection_analyzer.constdatas import (
+    CALENDAR_PREFIXES,
+    CATEGORICAL_METADATA,
+    CATEGORY_MAX_RATIO,
+    COLUMN_MIN_FILL,
+    DATE_METADATA,
+    ROW_MIN_FILL,
+)
+from ia_collection_analyzer.perfhelper import stage
+
+# strptime format of IA date strings, by string length
+DATE_FORMATS = {4: "%Y", 7: "%Y-%m", 10: "%Y-%m-%d"}
+
+
+# python types a scalar metadata value can have
+SCALAR_TYPES = [str, int, float, bool]
+
+
+def profile_column(series: pd.Series) -> str:
+    """Classify a column as "empty", "scalar", "list" or "mixed" (lists and scalars)"""
+    if series.dtype != object:
+        # numeric, datetime, categorical... pandas already guarantees scalars
+        return "scalar" if series.notna().any() else "empty"
+    # map(type) runs the builtin over the whole column in one C-level loop
+    types = series.map(type, na_action="ignore").value_counts()
+    if types.empty:
+        return "empty"
+    if list not in types.index:
+        return "scalar"
+    return "list" if len(types) == 1 else "mixed"
+
+
+def profile_columns(df: pd.DataFrame) -> dict[str, str]:
+    return {col: profile_column(df[col]) for col in df.columns}
+
+
+def wrap_scalars(values: np.ndarray) -> np.ndarray:
+    # building lists is cheap, the cyclic GC passes they trigger are not
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return np.fromiter(map(list, zip(values)), dtype=object, count=len(values))
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def normalize_list_column(series: pd.Series) -> pd.Series:
+    types = series.map(type, na_action="ignore")
+    is_list = (types == list).to_numpy()
+    is_scalar = types.isin(SCALAR_TYPES).to_numpy()
+    values = series.to_numpy(dtype=object, copy=True)
+    values[is_scalar] = wrap_scalars(values[is_scalar])
+    # anything that is neither a list nor a scalar (e.g. dicts) is dropped
+    values[series.notna().to_numpy() & ~is_list & ~is_scalar] = None
+    return pd.Series(values, index=series.index, name=series.name, dtype=object)
+
+
+def normalize_list_columns(df, profile: dict[str, str] | None = None):
+    """Wrap the scalars of mixed list/scalar columns into one-element lists.
+
+    The column type profile is stored in df.attrs["column_profile"], with
+    normalized columns marked as "list", so later stages don't rescan.
+    """
+    if profile is None:
+        profile = profile_columns(df)
+    normalized_cols = [col for col, kind in profile.items() if kind == "mixed"]
+    for col in normalized_cols:
+        df[col] = normalize_list_column(df[col])
 
     if normalized_cols:
         print(f"Normalized mixed single/list values in columns: {normalized_cols}")
+    df.attrs["column_profile"] = {
+        col: "list" if kind == "mixed" else kind for col, kind in profile.items()
+    }
+    return df
+
+
+def parse_datetimes(series: pd.Series) -> pd.Series:
+    # mixes of naive and "Z" suffixed timestamps only parse as UTC
+    parsed = pd.to_datetime(series, format="ISO8601", utc=True, errors="coerce")
+    return parsed.dt.tz_convert(None)
+
+
+def parse_dates(series: pd.Series) -> pd.Series:
+    """Parse heterogeneous IA dates ("2012", "2012-08", ISO timestamps) once.
+
+    Every distinct value is parsed a single time, with an explicit format
+    for each length bucket so pandas never falls back to guessing per
+    element. Unparseable values become NaT.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series.map(str, na_action="ignore"))
+    uniques = pd.Series(uniques, dtype=object).map(str)
+
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype="datetime64[ns]")
+    lengths = uniques.str.len()
+    bucketed = np.zeros(len(uniques), dtype=bool)
+    for length, date_format in DATE_FORMATS.items():
+        mask = (lengths == length).to_numpy()
+        if mask.any():
+            parsed[mask] = pd.to_datetime(
+                uniques[mask], format=date_format, errors="coerce"
+            )
+            bucketed |= mask
+    if (~bucketed).any():
+        parsed[~bucketed] = parse_datetimes(uniques[~bucketed])
+
+    # code -1 (missing) picks the trailing NaT
+    values = np.append(parsed.to_numpy(), np.datetime64("NaT", "ns"))[codes]
+    return pd.Series(values, index=series.index, name=series.name)
+
+
+def add_calendar_columns(df: pd.DataFrame, column: str, prefix: str = "") -> pd.DataFrame:
+    """Add compact {prefix}year/month/day/quarter/week columns derived from column"""
+    dates = parse_dates(df[column])
+    df[f"{prefix}year"] = dates.dt.year.astype("Int16")
+    df[f"{prefix}month"] = dates.dt.month.astype("Int8")
+    df[f"{prefix}day"] = dates.dt.day.astype("Int8")
+    df[f"{prefix}quarter"] = dates.dt.quarter.astype("Int8")
+    df[f"{prefix}week"] = dates.dt.isocalendar().week.astype("Int8")
     return df
+
+
+def optimize_dtypes(
+    df: pd.DataFrame,
+    max_unique_ratio: float = CATEGORY_MAX_RATIO,
+    date_columns: list[str] = DATE_METADATA,
+) -> tuple[pd.DataFrame, int]:
+    """Shrink a cleaned frame and return it with the number of bytes saved.
+
+    Repetitive string columns become categoricals, integers are downcast and
+    known date fields are parsed once.
+    """
+    before = df.memory_usage(deep=True).sum()
+    profile = df.attrs.get("column_profile") or profile_columns(df)
+    for col in df.columns:
+        series = df[col]
+        if col in date_columns and series.dtype == object:
+            df[col] = parse_datetimes(series)
+        elif pd.api.types.is_integer_dtype(series):
+            df[col] = pd.to_numeric(series, downcast="integer")
+        elif (
+            series.dtype == object
+            and profile.get(col) == "scalar"
+            and pd.api.types.infer_dtype(series, skipna=True) == "string"
+            and series.nunique() <= max_unique_ratio * len(series)
+        ):
+            df[col] = series.astype("category")
+    # floats are left alone, float32 can't hold IA byte sizes exactly
+
+    saved = int(before - df.memory_usage(deep=True).sum())
+    print(f"Optimized dtypes, saved {saved / 1024**2:.1f} MiB")
+    return df, saved
+
+
+def clean_collection(
+    df: pd.DataFrame, status=None, keep: list[str] = ()
+) -> tuple[pd.DataFrame, dict]:
+    """Clean a freshly loaded collection frame for analysis.
+
+    status, if given, is called with a short message before every step.
+    Columns in keep survive however sparse they are.
+    Returns the frame and a dict with the bytes saved by optimize_dtypes and
+    the {calendar column prefix: date column} mapping.
+    """
+    status = status or (lambda message: None)
+
+    status("cleaning data...")
+    with stage("dropna cleaning") as current:
+        # drop columns with 80%+ nan
+        filled = df.count() >= COLUMN_MIN_FILL * len(df)
+        df = df.loc[:, filled | df.columns.isin(keep)]
+        df = df.dropna(axis=0, thresh=ROW_MIN_FILL * len(df.columns))
+        # drop mediatype=collections
+        df = df.drop(index=df.index[df["mediatype"] == "collection"])
+        current.record(df)
+    with stage("normalize_list_columns", df):
+        df = normalize_list_columns(df)
+
+    # categoricals, downcast integers and parsed addeddate/publicdate
+    status("optimizing column types...")
+    with stage("optimize dtypes", df):
+        df, saved_bytes = optimize_dtypes(df)
+
+    status("calculating metadata...")
+    # Use 'date' column if it exists, otherwise use 'addeddate'
+    date_column = "date" if "date" in df.columns else "addeddate"
+
+    # every date is parsed once, later stages reuse the calendar columns
+    with stage("date derivation") as current:
+        # keyed by prefix, addeddate has both unprefixed and "added" columns
+        # when there's no date column
+        df = add_calendar_columns(df, date_column)
+        calendar_columns = {"": date_column}
+        for column, prefix in CALENDAR_PREFIXES.items():
+            if column in df.columns:
+                df = add_calendar_columns(df, column, prefix)
+                calendar_columns[prefix] = column
+        current.record(df)
+
+    return df, {"saved_bytes": saved_bytes, "calendar_columns": calendar_columns}
+
+
+def column_to_array(series: pd.Series) -> pa.Array:
+    try:
+        array = pa.array(series, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # mixed value types such as "12" and 12, store everything as strings
+        has_list = profile_column(series) in ("list", "mixed")
+        array = pa.array(
+            series.map(
+                lambda x: [str(v) for v in x]
+                if isinstance(x, list)
+                else [str(x)]
+                if has_list
+                else str(x),
+                na_action="ignore",
+            ),
+            from_pandas=True,
+        )
+    if series.name in CATEGORICAL_METADATA and pa.types.is_string(array.type):
+        array = array.dictionary_encode()
+    return array
+
+
+def frame_to_table(df: pd.DataFrame) -> pa.Table:
+    df = normalize_list_columns(df)
+    return pa.table({col: column_to_array(df[col]) for col in df.columns})
+
+
+def table_to_frame(table: pa.Table) -> pd.DataFrame:
+    # to_pandas turns list columns into numpy arrays, keep them python lists
+    list_cols = [
+        field.name for field in table.schema if pa.types.is_list(field.type)
+    ]
+    df = table.drop_columns(list_cols).to_pandas()
+    for col in list_cols:
+        df[col] = pd.Series(table.column(col).to_pylist(), index=df.index, dtype=object)
+    return df[table.column_names]
+
+
+def concat_tables(tables: list[pa.Table]) -> pa.Table:
+    try:
+        return pa.concat_tables(tables, promote_options="permissive")
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # e.g. a field that is a string in one chunk and a list in another
+        return frame_to_table(
+            pd.concat([table_to_frame(table) for table in tables], ignore_index=True)
+        )
+
+
+def drop_duplicate_rows(table: pa.Table, key: str = "identifier") -> pa.Table:
+    # keeps the first row of every key, like DataFrame.drop_duplicates
+    duplicated = table.column(key).to_pandas().duplicated().to_numpy()
+    if not duplicated.any():
+        return table
+    return table.filter(pa.array(~duplicated))
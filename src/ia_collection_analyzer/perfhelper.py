@@ -0,0 +1,123 @@
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json
+import logging
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from ia_collection_analyzer.constdatas import PERF_LOG_SIZE
+
+logger = logging.getLogger(__name__)
+
+# stages are grouped by trace, usually the collection being worked on
+current_trace: ContextVar[str | None] = ContextVar("current_trace", default=None)
+
+
+def peak_rss_mib() -> float | None:
+    """Peak resident memory of the process so far"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024**2 if sys.platform == "darwin" else 1024), 1)
+
+
+def shape_of(data) -> tuple[int | None, int | None]:
+    """Rows and columns of a DataFrame, Series, Arrow table or list"""
+    shape = getattr(data, "shape", None)
+    if shape is not None:
+        return shape[0], shape[1] if len(shape) > 1 else 1
+    return len(data), None
+
+
+class Stage:
+    """Counters of a running stage, filled in by the instrumented code"""
+
+    def __init__(self, name: str, trace: str | None):
+        self.name = name
+        self.trace = trace
+        self.rows = None
+        self.cols = None
+        self.extra = {}
+
+    def record(self, data=None, **extra):
+        """Take rows/columns from data, and keep any extra fields"""
+        if data is not None:
+            self.rows, self.cols = shape_of(data)
+        self.extra.update(extra)
+
+
+class PerfLog:
+    """The most recent stage records, also logged as JSON lines"""
+
+    def __init__(self, max_records: int):
+        self.entries = deque(maxlen=max_records)
+        self.lock = threading.Lock()
+
+    def add(self, record: dict):
+        with self.lock:
+            self.entries.append(record)
+        logger.info(json.dumps(record, default=str))
+
+    def records(self, trace: str | None = None) -> list[dict]:
+        with self.lock:
+            return [
+                record
+                for record in self.entries
+                if trace is None or record["trace"] == trace
+            ]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+perf_log = PerfLog(PERF_LOG_SIZE)
+
+
+@contextmanager
+def trace(trace_id: str):
+    """Attribute the stages run inside to trace_id"""
+    token = current_trace.set(trace_id)
+    try:
+        yield
+    finally:
+        current_trace.reset(token)
+
+
+@contextmanager
+def stage(name: str, data=None, trace: str | None = None):
+    """Record wall time, peak RSS and the data shape of a pipeline stage"""
+    current = Stage(name, trace or current_trace.get())
+    if data is not None:
+        current.record(data)
+    started_at = time.time()
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield current
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        record = {
+            "stage": current.name,
+            "trace": current.trace,
+            "started_at": round(started_at, 3),
+            "seconds": round(time.perf_counter() - start, 4),
+            "peak_rss_mib": peak_rss_mib(),
+            "rows": current.rows,
+            "cols": current.cols,
+            "thread": threading.current_thread().name,
+            **current.extra,
+        }
+        if failed:
+            record["failed"] = True
+        perf_log.add(record)
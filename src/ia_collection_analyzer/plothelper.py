@@ -0,0 +1,110 @@
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+
+class ListIndex(NamedTuple):
+    """A column exploded once into (row position, element code) pairs"""
+
+    rows: np.ndarray  # row position in the indexed frame, one per element
+    codes: np.ndarray  # element code, position in categories
+    categories: pd.Index
+    length: int  # number of rows of the indexed frame
+
+
+def factorize(values) -> tuple[np.ndarray, pd.Index]:
+    try:
+        codes, categories = pd.factorize(values, sort=True)
+    except TypeError:
+        # unorderable mix such as str and int
+        codes, categories = pd.factorize(values)
+    return codes, pd.Index(categories)
+
+
+def build_list_index(series: pd.Series) -> ListIndex:
+    # a positional index makes explode repeat row positions, not labels
+    exploded = pd.Series(series.to_numpy(dtype=object), copy=False).explode()
+    valid = exploded.notna().to_numpy()
+    codes, categories = factorize(exploded[valid])
+    return ListIndex(exploded.index.to_numpy()[valid], codes, categories, len(series))
+
+
+def subset_list_index(index: ListIndex, positions: np.ndarray) -> ListIndex:
+    """Index of the rows at positions of the indexed frame, numbered in that order"""
+    new_rows = np.full(index.length, -1, dtype=np.int64)
+    new_rows[positions] = np.arange(len(positions))
+    rows = new_rows[index.rows]
+    keep = rows >= 0
+    order = np.argsort(rows[keep], kind="stable")
+    return ListIndex(
+        rows[keep][order], index.codes[keep][order], index.categories, len(positions)
+    )
+
+
+def build_list_indexes(df: pd.DataFrame, profile: dict[str, str]) -> dict[str, ListIndex]:
+    return {
+        col: build_list_index(df[col])
+        for col, kind in profile.items()
+        if kind == "list" and col in df.columns
+    }
+
+
+def category_crosstab(
+    x: pd.Series,
+    y_index: ListIndex,
+    positions: np.ndarray | None = None,
+    normalize: bool = False,
+) -> pd.DataFrame:
+    """Cross-tabulate x against the elements of an indexed column.
+
+    x holds the rows found at positions of the indexed frame (all rows if
+    positions is None). Equivalent to pd.crosstab on the exploded column.
+    """
+    if positions is None:
+        positions = np.arange(y_index.length)
+    x_codes, x_categories = factorize(x)
+    x_by_row = np.full(y_index.length, -1, dtype=np.int64)
+    x_by_row[positions] = x_codes
+
+    pair_x = x_by_row[y_index.rows]
+    keep = pair_x >= 0
+    n_y = max(len(y_index.categories), 1)
+    pairs, counts = np.unique(
+        pair_x[keep] * n_y + y_index.codes[keep], return_counts=True
+    )
+    x_used, x_pos = np.unique(pairs // n_y, return_inverse=True)
+    y_used, y_pos = np.unique(pairs % n_y, return_inverse=True)
+    table = np.zeros((len(x_used), len(y_used)), dtype=np.int64)
+    table[x_pos, y_pos] = counts
+
+    table = pd.DataFrame(
+        table,
+        index=pd.Index(x_categories[x_used], name=x.name),
+        columns=pd.Index(y_index.categories[y_used]),
+    )
+    if normalize:
+        table = table.div(table.sum(axis=1), axis=0) * 100
+    return table
+
+
+def numeric_metrics(x: pd.Series, y: pd.Series) -> pd.DataFrame:
+    return (
+        pd.DataFrame({x.name: x, y.name: y})
+        .groupby(x.name, observed=True)[y.name]
+        .agg(
+            [
+                ("Count", "count"),
+                ("Sum", "sum"),
+                ("Mean", "mean"),
+                ("Median", "median"),
+                ("Min", "min"),
+                ("Max", "max"),
+            ]
+        )
+        .reset_index()
+    )
+
+
+def frame_bytes(frame: pd.DataFrame) -> int:
+    return int(frame.memory_usage(index=True, deep=True).sum())
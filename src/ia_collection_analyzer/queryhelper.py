@@ -0,0 +1,268 @@
+from functools import reduce
+from typing import NamedTuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from pyarrow import acero
+
+from ia_collection_analyzer import iahelper
+from ia_collection_analyzer.constdatas import (
+    CALENDAR_PREFIXES,
+    COLUMN_MIN_FILL,
+    ROW_MIN_FILL,
+)
+
+# calendar columns of a date column, see pdhelper.add_calendar_columns
+CALENDAR_PARTS = {
+    "year": pc.year,
+    "month": pc.month,
+    "day": pc.day,
+    "quarter": pc.quarter,
+    "week": pc.iso_week,
+}
+
+
+class CollectionQuery(NamedTuple):
+    """Projection, null filter and axes of a plot over a cached collection.
+
+    Nothing is read until the query is run, and then only the columns it
+    needs, in batches, with the filter pushed down to the Parquet reader.
+    """
+
+    dataset: ds.Dataset
+    fields: list[str]  # cached columns the query reads
+    filter: pc.Expression
+    x: pc.Expression
+    y: pc.Expression
+    x_name: str
+    y_name: str
+
+
+def open_collection(collection_id, version=None) -> ds.Dataset | None:
+    """The cached collection as a lazy dataset, if its cache is still version"""
+    entry = iahelper.collection_store.get(iahelper.get_cache_key(collection_id))
+    if entry is None or (version is not None and entry["file"] != version):
+        return None
+    return open_cache_file(iahelper.collection_store.path(entry))
+
+
+def cleaned_fields(collection_id, version=None) -> list[str] | None:
+    """The cached fields clean_collection keeps, if the cache is still version"""
+    entry = iahelper.collection_store.get(iahelper.get_cache_key(collection_id))
+    if entry is None or (version is not None and entry["file"] != version):
+        return None
+    if "fill" not in entry["meta"]:
+        return None
+    return iahelper.filled_fields(entry, COLUMN_MIN_FILL)
+
+
+def open_cache_file(filename) -> ds.Dataset:
+    schema = ds.dataset(filename, format="parquet").schema
+    # row groups have dictionaries of their own, which can't be grouped together
+    schema = pa.schema(
+        field.with_type(field.type.value_type)
+        if pa.types.is_dictionary(field.type)
+        else field
+        for field in schema
+    )
+    return ds.dataset(filename, schema=schema, format="parquet")
+
+
+def parse_date_expression(column: pc.Expression) -> pc.Expression:
+    """Timestamps of IA dates ("2012", "2012-08", ISO timestamps), as parse_dates"""
+    formats = [(10, "%Y-%m-%d"), (7, "%Y-%m"), (4, "%Y")]
+    return pc.coalesce(
+        *(
+            pc.strptime(
+                pc.utf8_slice_codeunits(column, 0, length),
+                format=date_format,
+                unit="s",
+                error_is_null=True,
+            )
+            for length, date_format in formats
+        )
+    )
+
+
+def column_expression(
+    schema: pa.Schema, column: str, calendar_columns: dict[str, str]
+) -> tuple[pc.Expression, str] | None:
+    """Expression computing a column of the cleaned frame, and the cached
+    column it reads.
+
+    None if the column can't be computed from the cache, e.g. item
+    details joined after loading.
+    """
+    if column in schema.names:
+        return pc.field(column), column
+    prefixes = {prefix: date_column for date_column, prefix in CALENDAR_PREFIXES.items()}
+    for prefix, date_column in {**prefixes, **calendar_columns}.items():
+        part = column[len(prefix) :]
+        if (
+            column.startswith(prefix)
+            and part in CALENDAR_PARTS
+            and date_column in schema.names
+        ):
+            dates = pc.field(date_column)
+            if not pa.types.is_timestamp(schema.field(date_column).type):
+                dates = parse_date_expression(dates)
+            return CALENDAR_PARTS[part](dates), date_column
+    return None
+
+
+def transform_expression(
+    column: pc.Expression, transform_type: str, params: dict
+) -> pc.Expression | None:
+    """Expression of a transform of transform_data, None if it needs the whole column"""
+    if transform_type == "String Prefix":
+        strings = column.cast(pa.string())
+        return pc.utf8_slice_codeunits(strings, 0, params["prefix_len"])
+    if transform_type in ("Date Quarter", "Date Week"):
+        part = "quarter" if transform_type == "Date Quarter" else "week"
+        dates = parse_date_expression(column.cast(pa.string()))
+        return CALENDAR_PARTS[part](dates)
+    if transform_type == "Value Mapping":
+        strings = column.cast(pa.string())
+        mapping = params["mapping"]
+        if not mapping:
+            return strings
+        # one lookup, so a target that is also a source isn't mapped again.
+        # take is a vector function, choose picks the target row by row
+        position = pc.index_in(strings, value_set=pa.array(map(str, mapping)))
+        targets = [pa.scalar(target) for target in mapping.values()]
+        return pc.if_else(position.is_valid(), pc.choose(position, *targets), strings)
+    # Numeric Bins needs quantiles of the whole column first
+    return None
+
+
+def plan_query(
+    dataset: ds.Dataset,
+    columns: list[str],
+    x: str,
+    y: str,
+    calendar_columns: dict[str, str],
+    transforms: dict[str, list] | None = None,
+    kept: list[str] | None = None,
+) -> CollectionQuery | None:
+    """Plan a plot of x against y over the rows where none of columns is missing.
+
+    transforms, if given, are the TransformStep lists of the transformed
+    columns, replayed in order on the axes. kept, if given, are the cached
+    fields clean_collection keeps (see cleaned_fields), the rows it drops
+    for being too sparse are left out too. Returns None when something can
+    only be computed in memory.
+    """
+    schema = dataset.schema
+    expressions = {}
+    fields = set()
+    for column in dict.fromkeys(columns + [x, y]):
+        planned = column_expression(schema, column, calendar_columns)
+        if planned is None:
+            return None
+        expressions[column] = planned[0]
+        fields.add(planned[1])
+
+    # clean_collection's rules, then column_selector's dropna
+    row_filter = pc.field("mediatype") != "collection"
+    fields.add("mediatype")
+    kept = [name for name in kept or [] if name in schema.names]
+    if kept:
+        filled = reduce(
+            pc.add, (pc.field(name).is_valid().cast(pa.int32()) for name in kept)
+        )
+        row_filter = row_filter & (filled >= ROW_MIN_FILL * len(kept))
+        fields.update(kept)
+    for column in columns:
+        row_filter = row_filter & expressions[column].is_valid()
+
+    axes = {x: expressions[x], y: expressions[y]}
+    for column, steps in (transforms or {}).items():
+        if column not in axes or not steps:
+            continue
+        if column in schema.names and pa.types.is_list(schema.field(column).type):
+            # elements are transformed on the exploded index in memory
+            return None
+        expression = expressions[column]
+        for step in steps:
+            expression = transform_expression(expression, step.transform_type, step.params)
+            if expression is None:
+                return None
+        axes[column] = expression
+    fields = [name for name in schema.names if name in fields]
+    return CollectionQuery(dataset, fields, row_filter, axes[x], axes[y], x, y)
+
+
+def scan_declaration(query: CollectionQuery) -> acero.Declaration:
+    """Scan, filter and project the two axes, on all cores"""
+    return acero.Declaration.from_sequence(
+        [
+            # the scan only reads the fields, and skips row groups the filter rules out
+            acero.Declaration(
+                "scan",
+                acero.ScanNodeOptions(
+                    query.dataset, columns=query.fields, filter=query.filter
+                ),
+            ),
+            acero.Declaration("filter", acero.FilterNodeOptions(query.filter)),
+            acero.Declaration(
+                "project", acero.ProjectNodeOptions([query.x, query.y], ["x", "y"])
+            ),
+        ]
+    )
+
+
+def query_metrics(query: CollectionQuery) -> pd.DataFrame:
+    """numeric_metrics of the query, with an approximate (t-digest) Median"""
+    aggregate = acero.Declaration(
+        "aggregate",
+        acero.AggregateNodeOptions(
+            [
+                ("y", "hash_count", None, "Count"),
+                ("y", "hash_sum", None, "Sum"),
+                ("y", "hash_mean", None, "Mean"),
+                ("y", "hash_approximate_median", None, "Median"),
+                ("y", "hash_min", None, "Min"),
+                ("y", "hash_max", None, "Max"),
+            ],
+            keys=["x"],
+        ),
+    )
+    plan = acero.Declaration.from_sequence([scan_declaration(query), aggregate])
+    metrics = plan.to_table(use_threads=True).to_pandas()
+    metrics = metrics.rename(columns={"x": query.x_name})
+    metrics = metrics[metrics["Count"] > 0].sort_values(query.x_name)
+    return metrics[
+        [query.x_name, "Count", "Sum", "Mean", "Median", "Min", "Max"]
+    ].reset_index(drop=True)
+
+
+def query_crosstab(query: CollectionQuery) -> pd.DataFrame:
+    """category_crosstab of the query, y may be a list column.
+
+    Batches are counted as they are read and only the counts are kept.
+    """
+    partials = []
+    with scan_declaration(query).to_reader(use_threads=True) as reader:
+        for batch in reader:
+            x, y = batch.column("x"), batch.column("y")
+            if pa.types.is_list(y.type):
+                x = x.take(pc.list_parent_indices(y))
+                y = pc.list_flatten(y)
+            pairs = pa.table({"x": x, "y": y}).filter(pc.is_valid(y))
+            partials.append(pairs.group_by(["x", "y"]).aggregate([([], "count_all")]))
+
+    if not partials:
+        return pd.DataFrame(index=pd.Index([], name=query.x_name))
+    counts = (
+        pa.concat_tables(partials, promote_options="permissive")
+        .group_by(["x", "y"])
+        .aggregate([("count_all", "sum")])
+        .to_pandas()
+    )
+    table = counts.pivot(index="x", columns="y", values="count_all_sum")
+    table = table.fillna(0).astype("int64").sort_index().sort_index(axis=1)
+    table.index = pd.Index(table.index.tolist(), name=query.x_name)
+    table.columns = pd.Index(table.columns.tolist())
+    return table
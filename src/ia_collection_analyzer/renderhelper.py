@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+from ia_collection_analyzer.constdatas import (
+    CHART_MAX_POINTS,
+    CHART_TOP_K,
+    TABLE_PAGE_ROWS,
+)
+
+
+def top_categories(
+    counts: pd.DataFrame, k: int = CHART_TOP_K, margins: pd.DataFrame | None = None
+) -> tuple[pd.DataFrame, pd.DataFrame | None]:
+    """Keep the k columns of a crosstab with the most counts, in their order,
+    and sum the others into a single "Other" column.
+
+    margins, the ± of sampled counts, get the same columns, the margin of
+    the "Other" column combining theirs as independent errors.
+    """
+    if len(counts.columns) <= k + 1:
+        return counts, margins
+    top = counts.sum().nlargest(k).index
+    keep = counts.columns.isin(top)
+    other = f"Other ({(~keep).sum()} more)"
+    kept = counts.loc[:, keep].copy()
+    kept[other] = counts.loc[:, ~keep].sum(axis=1)
+    if margins is not None:
+        rest = margins.reindex(columns=counts.columns[~keep], fill_value=0)
+        margins = margins.reindex(columns=counts.columns[keep], fill_value=0)
+        margins[other] = np.sqrt((rest**2).sum(axis=1))
+    return kept, margins
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Positions of threshold points of the series that keep its shape.
+
+    Largest-Triangle-Three-Buckets: the first and last points are kept, and
+    from every bucket of the points in between, the one making the largest
+    triangle with the point kept before it and the average of the next
+    bucket.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    edges = np.append(edges, n)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = end, edges[bucket + 2]
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[bucket + 1] = a
+    return selected
+
+
+def chart_positions(index: pd.Index) -> np.ndarray:
+    """x of every row of a chart, its position where the index isn't numbers or dates"""
+    if pd.api.types.is_datetime64_any_dtype(index) and not index.hasnans:
+        return index.asi8.astype(float)
+    if pd.api.types.is_numeric_dtype(index) and not index.hasnans:
+        return index.to_numpy(dtype=float)
+    return np.arange(len(index), dtype=float)
+
+
+def downsample(frame: pd.DataFrame, max_points: int = CHART_MAX_POINTS) -> pd.DataFrame:
+    """Rows of a chart keeping the shape of each of its columns, about max_points in all"""
+    if len(frame) <= max_points:
+        return frame
+    x = chart_positions(frame.index)
+    columns = frame.select_dtypes("number").columns
+    threshold = max(max_points // max(len(columns), 1), 3)
+    rows = [lttb(x, frame[column].to_numpy(dtype=float), threshold) for column in columns]
+    if not rows:
+        rows = [np.linspace(0, len(frame) - 1, max_points).astype(np.int64)]
+    return frame.iloc[np.unique(np.concatenate(rows))]
+
+
+def page_count(rows: int, page_rows: int = TABLE_PAGE_ROWS) -> int:
+    return max(1, -(-rows // page_rows))
+
+
+def table_page(table: pd.DataFrame, page: int, page_rows: int = TABLE_PAGE_ROWS) -> pd.DataFrame:
+    """Rows of a page of a table, pages counted from 1"""
+    start = (page - 1) * page_rows
+    return table.iloc[start : start + page_rows]
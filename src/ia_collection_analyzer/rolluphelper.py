@@ -0,0 +1,240 @@
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from ia_collection_analyzer import iahelper
+from ia_collection_analyzer.constdatas import (
+    CATEGORICAL_METADATA,
+    ROLLUP_MEASURES,
+    ROLLUP_PREFIXES,
+)
+from ia_collection_analyzer.pdhelper import frame_to_table
+from ia_collection_analyzer.perfhelper import stage
+from ia_collection_analyzer.plothelper import build_list_index
+
+# calendar columns of every date the rollup is keyed by
+ROLLUP_PARTS = ["year", "month"]
+
+
+class Rollup(NamedTuple):
+    """Item counts and measure totals of a cleaned collection, by cell.
+
+    Every prefix of grains has cells of its own, keyed by the calendar
+    parts of its date, the dimensions and a has_<column> flag for every column of
+    flags. Cells with a list name count (item, element) pairs of that
+    list column instead of items.
+    """
+
+    cells: pd.DataFrame
+    grains: dict[str, str]  # {calendar column prefix: date column}
+    dimensions: list[str]  # scalar columns the cells are keyed by
+    lists: list[str]  # list columns with cells of their elements
+    measures: list[str]  # numeric columns with _sum, _min and _max per cell
+    flags: list[str]  # columns the cells tell missing values of
+
+
+class RollupQuery(NamedTuple):
+    """Cells of a plot of x against y, keeping the rows where no column is missing"""
+
+    cells: pd.DataFrame
+    x: str  # cell column of x
+    y: str  # cell column of y, "element" for a list column
+    x_name: str
+    y_name: str
+    measure: str | None  # y, when it is a measure
+
+
+def build_rollup(df: pd.DataFrame, calendar_columns: dict[str, str]) -> Rollup:
+    """Roll a cleaned collection (see clean_collection) up into cells"""
+    profile = df.attrs.get("column_profile", {})
+    categorical = [column for column in CATEGORICAL_METADATA if column in df.columns]
+    lists = [column for column in categorical if profile.get(column) == "list"]
+    dimensions = [column for column in categorical if column not in lists]
+    measures = [
+        column
+        for column in ROLLUP_MEASURES
+        if column in df.columns and pd.api.types.is_numeric_dtype(df[column])
+    ]
+    grains = {
+        prefix: column
+        for prefix, column in calendar_columns.items()
+        if prefix in ROLLUP_PREFIXES
+    }
+    flags = ["identifier"] + measures + lists + list(dict.fromkeys(grains.values()))
+
+    keys = [*ROLLUP_PARTS, *dimensions, *(f"has_{column}" for column in flags)]
+    aggregations = {"count": ("identifier", "size")}
+    for measure in measures:
+        aggregations[f"{measure}_sum"] = (measure, "sum")
+        aggregations[f"{measure}_min"] = (measure, "min")
+        aggregations[f"{measure}_max"] = (measure, "max")
+    list_indexes = {column: build_list_index(df[column]) for column in lists}
+
+    tables = []
+    for prefix in grains:
+        rows = pd.DataFrame(
+            {
+                **{part: df[f"{prefix}{part}"] for part in ROLLUP_PARTS},
+                **{column: df[column] for column in dimensions},
+                **{f"has_{column}": df[column].notna() for column in flags},
+                **{column: df[column] for column in ["identifier"] + measures},
+            }
+        ).reset_index(drop=True)
+        cells = rows.groupby(keys, dropna=False, observed=True).agg(**aggregations)
+        tables.append(cells.reset_index().assign(grain=prefix, list=None, element=None))
+
+        for column, index in list_indexes.items():
+            # one row per element, keyed like the item it belongs to
+            pairs = rows[keys].iloc[index.rows].reset_index(drop=True)
+            pairs["element"] = index.categories.map(str).to_numpy()[index.codes]
+            counts = pairs.groupby(keys + ["element"], dropna=False, observed=True).size()
+            tables.append(
+                counts.rename("count").reset_index().assign(grain=prefix, list=column)
+            )
+
+    cells = pd.concat(tables, ignore_index=True)
+    return Rollup(cells, grains, dimensions, lists, measures, flags)
+
+
+def rollup_column(rollup: Rollup, column: str) -> tuple[str | None, str] | None:
+    """(grain, cell column) of a column of the cleaned frame the cells are keyed by.
+
+    The grain is the calendar prefix of the cells that have it, None if
+    all cells do.
+    """
+    for prefix in rollup.grains:
+        for part in ROLLUP_PARTS:
+            if column == f"{prefix}{part}":
+                return prefix, part
+    if column in rollup.dimensions:
+        return None, column
+    return None
+
+
+def plan_rollup(
+    rollup: Rollup, columns: list[str], x: str, y: str, with_median: bool = True
+) -> RollupQuery | None:
+    """Plan a plot of x against y over the rows where none of columns is missing.
+
+    Returns None when the rollup doesn't cover it: x must be a key of the
+    cells, y a key, a list or a measure, every column a key or a flag, and
+    the dates among them of a single grain. Medians can't be combined from
+    cells, so y can only be a measure when with_median is False.
+    """
+    if not rollup.grains:
+        return None
+    grains = set()
+    keep = []
+    for column in dict.fromkeys(columns + [x, y]):
+        located = rollup_column(rollup, column)
+        if located is not None:
+            if located[0] is not None:
+                grains.add(located[0])
+            keep.append((located[1], "notna"))
+        elif column in rollup.flags:
+            keep.append((f"has_{column}", "flag"))
+        else:
+            return None
+    if len(grains) > 1:
+        return None
+    grain = grains.pop() if grains else next(iter(rollup.grains))
+
+    x_column = rollup_column(rollup, x)
+    if x_column is None:
+        return None
+    measure, cells_list = None, None
+    if y in rollup.lists:
+        y_column, cells_list = "element", y
+    elif y in rollup.measures:
+        if with_median:
+            return None
+        y_column, measure = y, y
+    else:
+        located = rollup_column(rollup, y)
+        if located is None:
+            return None
+        y_column = located[1]
+
+    cells = rollup.cells
+    mask = (cells["grain"] == grain).to_numpy()
+    if cells_list is None:
+        mask &= cells["list"].isna().to_numpy()
+    else:
+        mask &= (cells["list"] == cells_list).to_numpy()
+    for cell_column, kind in keep:
+        values = cells[cell_column]
+        mask &= values.notna().to_numpy() if kind == "notna" else values.to_numpy(bool)
+    return RollupQuery(cells[mask], x_column[1], y_column, x, y, measure)
+
+
+def rollup_crosstab(query: RollupQuery) -> pd.DataFrame:
+    """category_crosstab of a plot the rollup covers, from its cells only"""
+    counts = query.cells.groupby([query.x, query.y], observed=True)["count"].sum()
+    table = counts.unstack(fill_value=0).astype("int64")
+    table.index = pd.Index(table.index.tolist(), name=query.x_name)
+    table.columns = pd.Index(table.columns.tolist())
+    return table.sort_index().sort_index(axis=1)
+
+
+def rollup_metrics(query: RollupQuery) -> pd.DataFrame:
+    """numeric_metrics of a plot the rollup covers, without the Median"""
+    groups = query.cells.groupby(query.x, observed=True)
+    count = groups["count"].sum()
+    total = groups[f"{query.measure}_sum"].sum()
+    metrics = pd.DataFrame(
+        {
+            "Count": count,
+            "Sum": total,
+            "Mean": total / count.replace(0, np.nan),
+            "Min": groups[f"{query.measure}_min"].min(),
+            "Max": groups[f"{query.measure}_max"].max(),
+        }
+    )
+    metrics.index = pd.Index(metrics.index.tolist(), name=query.x_name)
+    return metrics.sort_index().reset_index()
+
+
+def get_rollup_key(collection_id) -> str:
+    return f"rollup_{collection_id}"
+
+
+def read_rollup(collection_id, version: str) -> Rollup | None:
+    """The stored rollup of a collection, if it was built from the cache version"""
+    entry = iahelper.collection_store.get(get_rollup_key(collection_id))
+    if entry is None or entry["meta"].get("source") != version:
+        return None
+    meta = entry["meta"]
+    cells = iahelper.read_collection_cache(iahelper.collection_store.path(entry))
+    # as add_calendar_columns makes them, Parquet gives floats for nullable ints
+    cells = cells.astype({"year": "Int16", "month": "Int8"})
+    return Rollup(
+        cells,
+        meta["grains"],
+        meta["dimensions"],
+        meta["lists"],
+        meta["measures"],
+        meta["flags"],
+    )
+
+
+def write_rollup(collection_id, version: str, rollup: Rollup):
+    meta = {"source": version, **rollup._asdict()}
+    del meta["cells"]
+    iahelper.collection_store.put(
+        get_rollup_key(collection_id), frame_to_table(rollup.cells), meta
+    )
+
+
+def load_rollup(
+    collection_id, version: str, df: pd.DataFrame, calendar_columns: dict[str, str]
+) -> Rollup:
+    """The rollup of a cleaned collection, built and stored next to its cache
+    unless this version of the cache already has one"""
+    rollup = read_rollup(collection_id, version)
+    if rollup is None:
+        with stage("rollup build", df) as current:
+            rollup = build_rollup(df, calendar_columns)
+            current.record(cells=len(rollup.cells))
+        write_rollup(collection_id, version, rollup)
+    return rollup
@@ -0,0 +1,258 @@
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from ia_collection_analyzer.constdatas import (
+    CMS_DEPTH,
+    CMS_WIDTH,
+    CONFIDENCE_Z,
+    HLL_PRECISION,
+    SAMPLE_MIN_STRATUM,
+)
+from ia_collection_analyzer.plothelper import ListIndex, factorize
+
+
+class StratifiedSample(NamedTuple):
+    """Rows drawn without replacement from every stratum of a frame"""
+
+    positions: np.ndarray  # sampled row positions in the frame
+    strata: np.ndarray  # stratum of every sampled row
+    sampled: np.ndarray  # rows sampled from each stratum
+    sizes: np.ndarray  # rows of each stratum in the frame
+    length: int  # number of rows of the frame
+
+    @property
+    def weights(self) -> np.ndarray:
+        """Rows of the frame every sampled row stands for"""
+        return (self.sizes / self.sampled)[self.strata]
+
+
+def stratified_sample(
+    strata: pd.Series,
+    size: int,
+    min_per_stratum: int = SAMPLE_MIN_STRATUM,
+    seed: int = 0,
+) -> StratifiedSample:
+    """Sample about size rows, spread over the strata in proportion to their size.
+
+    Every stratum gets at least min_per_stratum rows (or all of its rows),
+    so small strata still get estimates. Missing values form a stratum.
+    """
+    codes, _ = factorize(strata)
+    codes = np.where(codes < 0, codes.max(initial=-1) + 1, codes)
+    sizes = np.bincount(codes)
+    sampled = np.minimum(
+        sizes,
+        np.maximum(min_per_stratum, np.round(size * sizes / max(len(codes), 1))),
+    ).astype(np.int64)
+
+    # shuffle, group by stratum, and keep the first rows of every stratum
+    order = np.random.default_rng(seed).permutation(len(codes))
+    order = order[np.argsort(codes[order], kind="stable")]
+    starts = np.cumsum(sizes) - sizes
+    rank = np.arange(len(codes)) - np.repeat(starts, sizes)
+    positions = np.sort(order[rank < np.repeat(sampled, sizes)])
+    return StratifiedSample(positions, codes[positions], sampled, sizes, len(codes))
+
+
+def total_variance(
+    sum_u: np.ndarray, sum_u2: np.ndarray, sample: StratifiedSample
+) -> np.ndarray:
+    """Variance of estimated totals, given per-stratum sums of u and u**2.
+
+    sum_u and sum_u2 have one row per estimate and one column per stratum.
+    """
+    n = sample.sampled.astype(np.float64)
+    sizes = sample.sizes.astype(np.float64)
+    s2 = (sum_u2 - sum_u**2 / n) / np.maximum(n - 1, 1)
+    return (sizes**2 * (1 - n / sizes) / n * s2).sum(axis=1)
+
+
+def sample_crosstab(
+    x: pd.Series,
+    y_index: ListIndex,
+    sample: StratifiedSample,
+    positions: np.ndarray | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Estimated category_crosstab of a whole frame from a sample of it.
+
+    x holds all rows of the sampled frame, found at positions of the
+    indexed frame. Returns the estimated counts and the half-widths of
+    their confidence intervals.
+    """
+    rows = sample.positions if positions is None else positions[sample.positions]
+    x_codes, x_categories = factorize(x.iloc[sample.positions])
+    x_by_row = np.full(y_index.length, -1, dtype=np.int64)
+    x_by_row[rows] = x_codes
+    stratum_by_row = np.zeros(y_index.length, dtype=np.int64)
+    stratum_by_row[rows] = sample.strata
+
+    pair_x = x_by_row[y_index.rows]
+    keep = pair_x >= 0
+    n_y = max(len(y_index.categories), 1)
+    n_strata = len(sample.sizes)
+    cells = pair_x[keep] * n_y + y_index.codes[keep]
+    keys, counts = np.unique(
+        cells * n_strata + stratum_by_row[y_index.rows[keep]], return_counts=True
+    )
+    used_cells, cell_pos = np.unique(keys // n_strata, return_inverse=True)
+    by_stratum = np.zeros((len(used_cells), n_strata))
+    by_stratum[cell_pos, keys % n_strata] = counts
+
+    # a row counts 0 or 1 in a cell, so the sums of u and u**2 are the same
+    estimates = by_stratum @ (sample.sizes / sample.sampled)
+    margins = CONFIDENCE_Z * np.sqrt(total_variance(by_stratum, by_stratum, sample))
+    index = pd.MultiIndex.from_arrays(
+        [x_categories[used_cells // n_y], y_index.categories[used_cells % n_y]]
+    )
+    tables = []
+    for values in (estimates, margins):
+        table = pd.Series(values, index=index).unstack(fill_value=0.0)
+        table.index.name = x.name
+        tables.append(table)
+    return tables[0], tables[1]
+
+
+def sample_metrics(x: pd.Series, y: pd.Series, sample: StratifiedSample) -> pd.DataFrame:
+    """Estimated Count and Sum of y per x value over the whole frame, with the
+    mean of y and its confidence interval"""
+    frame = pd.DataFrame(
+        {
+            "x": x.iloc[sample.positions].to_numpy(),
+            "stratum": sample.strata,
+            "y": pd.to_numeric(y.iloc[sample.positions], errors="coerce").to_numpy(
+                dtype=np.float64, na_value=np.nan
+            ),
+        }
+    ).dropna()
+    frame["y2"] = frame["y"] ** 2
+    sums = frame.groupby(["x", "stratum"], observed=True).agg(
+        count=("y", "size"), sum=("y", "sum"), sum2=("y2", "sum")
+    )
+    sums = sums.unstack("stratum", fill_value=0)
+    count, total, total2 = (
+        sums[name].reindex(columns=range(len(sample.sizes)), fill_value=0).to_numpy()
+        for name in ("count", "sum", "sum2")
+    )
+    weights = sample.sizes / sample.sampled
+    est_count = count @ weights
+    est_sum = total @ weights
+    mean = est_sum / est_count
+    # linearized variance of the ratio sum / count
+    ratio = mean[:, None]
+    sum_u = (total - count * ratio) / est_count[:, None]
+    sum_u2 = (total2 - 2 * ratio * total + count * ratio**2) / est_count[:, None] ** 2
+    mean_margin = CONFIDENCE_Z * np.sqrt(total_variance(sum_u, sum_u2, sample))
+
+    return pd.DataFrame(
+        {
+            x.name: sums.index,
+            "Count": est_count,
+            "Count ±": CONFIDENCE_Z * np.sqrt(total_variance(count, count, sample)),
+            "Sum": est_sum,
+            "Mean": mean,
+            "Mean low": mean - mean_margin,
+            "Mean high": mean + mean_margin,
+        }
+    )
+
+
+def sample_value_counts(series: pd.Series, sample: StratifiedSample) -> pd.Series:
+    """Estimated value_counts of a whole column from a sample of it"""
+    weights = pd.Series(sample.weights, index=series.index[sample.positions])
+    counts = weights.groupby(series.iloc[sample.positions], observed=True).sum()
+    return counts.sort_values(ascending=False).round().astype(np.int64)
+
+
+def hash_values(values: pd.Series) -> np.ndarray:
+    """64-bit hashes of the non-missing values, equal values hash alike"""
+    values = values.dropna()
+    return pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+
+
+class HyperLogLog:
+    """Mergeable distinct count estimate in 2**precision one-byte registers"""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, values: pd.Series):
+        hashes = hash_values(values)
+        buckets = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        # the 53 high bits of the rest convert to float exactly
+        rest = (hashes << np.uint64(self.precision)) >> np.uint64(11)
+        zeros = 52 - np.floor(np.log2(np.maximum(rest, 1).astype(np.float64)))
+        ranks = np.where(rest == 0, 64 - self.precision, zeros) + 1
+        ranks = np.minimum(ranks, 64 - self.precision + 1).astype(np.uint8)
+        np.maximum.at(self.registers, buckets, ranks)
+
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        empty = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and empty:
+            # few values yet, count the empty registers instead
+            estimate = m * np.log(m / empty)
+        return int(round(estimate))
+
+
+class CountMinSketch:
+    """Mergeable value frequencies that are never underestimated"""
+
+    # odd multipliers, one per row, spreading the hashes over the columns
+    MULTIPLIERS = np.array(
+        [0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93,
+         0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9],
+        dtype=np.uint64,
+    )
+
+    def __init__(self, width: int = CMS_WIDTH, depth: int = CMS_DEPTH):
+        if width & (width - 1) or depth > len(self.MULTIPLIERS):
+            raise ValueError("width must be a power of two and depth at most 8")
+        self.shift = np.uint64(64 - (width.bit_length() - 1))
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+
+    def columns(self, hashes: np.ndarray) -> np.ndarray:
+        multipliers = self.MULTIPLIERS[: len(self.table), None]
+        return ((hashes[None, :] * multipliers) >> self.shift).astype(np.int64)
+
+    def add(self, values: pd.Series):
+        hashes = hash_values(values)
+        for row, columns in zip(self.table, self.columns(hashes)):
+            row += np.bincount(columns, minlength=len(row))
+        self.total += len(hashes)
+
+    def merge(self, other: "CountMinSketch"):
+        self.table += other.table
+        self.total += other.total
+
+    def estimate(self, values: pd.Series) -> np.ndarray:
+        """Upper bounds of the counts of values, which must not be missing"""
+        columns = self.columns(hash_values(values))
+        return np.take_along_axis(self.table, columns, axis=1).min(axis=0)
+
+
+class ColumnSketch(NamedTuple):
+    distinct: HyperLogLog
+    frequencies: CountMinSketch
+
+
+def sketch_column(series: pd.Series) -> ColumnSketch:
+    distinct, frequencies = HyperLogLog(), CountMinSketch()
+    distinct.add(series)
+    frequencies.add(series)
+    return ColumnSketch(distinct, frequencies)
+
+
+def sketch_value_counts(sketch: ColumnSketch, candidates: pd.Index) -> pd.Series:
+    """value_counts of the candidates according to a column sketch"""
+    candidates = candidates[~candidates.isna()]
+    counts = sketch.frequencies.estimate(pd.Series(candidates))
+    return pd.Series(counts, index=candidates).sort_values(ascending=False)
@@ -1,9 +1,63 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from .getmetadatas import fetch_metadata
-from .constdatas import REQUIRED_METADATA
-from .pdhelper import normalize_list_columns
+from .getmetadatas import (
+    format_progress,
+    get_cached_dataset,
+    start_fetch,
+    start_field_fetch,
+    start_item_fetch,
+)
+from .constdatas import (
+    AGGREGATION_CACHE_BYTES,
+    CHART_TOP_K,
+    REQUIRED_METADATA,
+    SAMPLE_SIZE,
+    SAMPLE_THRESHOLD,
+)
+from .cachehelper import LRUCache
+from .datasethelper import dataset_registry, with_field
+from .iahelper import get_cache_version, get_collection_fields
+from .itemhelper import ITEM_FIELDS, join_items_metadata
+from .jobhelper import aggregation_jobs, job_manager
+from .perfhelper import perf_log, stage
+from .telemetryhelper import request_telemetry, summary_rows
+from .mappinghelper import (
+    code_value_counts,
+    column_codes,
+    compile_mapping,
+    mapping_preview,
+)
+from .queryhelper import (
+    cleaned_fields,
+    open_collection,
+    plan_query,
+    query_crosstab,
+    query_metrics,
+)
+from .renderhelper import downsample, page_count, table_page, top_categories
+from .rolluphelper import plan_rollup, rollup_crosstab, rollup_metrics
+from .samplehelper import (
+    sample_crosstab,
+    sample_metrics,
+    sample_value_counts,
+    sketch_column,
+    sketch_value_counts,
+    stratified_sample,
+)
+from .plothelper import (
+    build_list_index,
+    category_crosstab,
+    frame_bytes,
+    numeric_metrics,
+    subset_list_index,
+)
+from .transformhelper import (
+    TRANSFORM_TYPES,
+    TransformPipeline,
+    TransformResult,
+    TransformStep,
+)
 
 st.title("Internet Archive Collection Analyzer")
 
@@ -23,22 +77,282 @@ if "collection_id" not in st.session_state:
     st.session_state.collection_id = "bilibili_videos"
 if "got_metadata" not in st.session_state:
     st.session_state.got_metadata = False
-if "items_pd" not in st.session_state:
-    st.session_state.items_pd = None
-if "items_length" not in st.session_state:
-    st.session_state.items_length = 0
-if "progress_message" not in st.session_state:
-    st.session_state.progress_message = None
+# the cleaned frame itself lives in the process-wide dataset_registry,
+# sessions only keep the key of the dataset they are looking at
+if "dataset_key" not in st.session_state:
+    st.session_state.dataset_key = None
+# key of the background fetch this session is waiting for, see start_fetch
+if "fetch_job" not in st.session_state:
+    st.session_state.fetch_job = None
+# collection whose item details fetch this session is waiting for
+if "item_job" not in st.session_state:
+    st.session_state.item_job = None
+# (collection, field) of the field fetch this session is waiting for
+if "field_job" not in st.session_state:
+    st.session_state.field_job = None
 if "selected_columns" not in st.session_state:
     st.session_state.selected_columns = []
 if "filtered_pd" not in st.session_state:
     st.session_state.filtered_pd = None
-if "transform_history" not in st.session_state:
-    st.session_state.transform_history = []
-if "transformed_columns" not in st.session_state:
-    st.session_state.transformed_columns = []
-if "original_values" not in st.session_state:
-    st.session_state.original_values = {}
+# transform steps of every column, and the transformed columns computed so far
+if "transforms" not in st.session_state:
+    st.session_state.transforms = TransformPipeline()
+# bumped whenever new data is loaded, so stale aggregation cache entries
+# are never looked up again
+if "dataset_version" not in st.session_state:
+    st.session_state.dataset_version = 0
+# column the filtered rows are stratified by in sampled analysis, None for exact
+if "sampling" not in st.session_state:
+    st.session_state.sampling = None
+# whether plots are aggregated from the on-disk cache instead of the loaded frame
+if "lazy_query" not in st.session_state:
+    st.session_state.lazy_query = False
+# (filter, stratified sample) of the filtered rows
+if "sample" not in st.session_state:
+    st.session_state.sample = None
+# (x, y) of the plot shown, kept while its tables are paged
+if "plotted_axes" not in st.session_state:
+    st.session_state.plotted_axes = None
+if "aggregation_cache" not in st.session_state:
+    st.session_state.aggregation_cache = LRUCache(AGGREGATION_CACHE_BYTES, frame_bytes)
+
+
+def use_dataset(collection_id, key):
+    """Point the session at a registered dataset"""
+    st.session_state.dataset_key = key
+    st.session_state.dataset_version += 1
+    st.session_state.aggregation_cache.clear()
+    st.session_state.got_metadata = True
+    st.session_state.collection_id = collection_id
+    st.session_state.filtered_pd = None
+    st.session_state.selected_columns = []
+    st.session_state.plotted_axes = None
+
+
+def get_dataset():
+    """The shared dataset of the current session"""
+    dataset = dataset_registry.get(st.session_state.dataset_key)
+    if dataset is None:
+        # replaced by a refresh of another session, or evicted to make room
+        # for other collections: use the current version, or load it again
+        collection_id = st.session_state.collection_id
+        key = get_cached_dataset(collection_id)
+        if key is None:
+            # load it again in the background, the collection form polls the fetch
+            st.session_state.fetch_job = start_fetch(collection_id).key
+            st.rerun()
+        dataset = dataset_registry.get(key)
+        if dataset is None:
+            st.error("Failed to reload the collection, please fetch it again.")
+            st.session_state.got_metadata = False
+            st.stop()
+        if key != st.session_state.dataset_key:
+            # the cache was refreshed meanwhile, start over on the new data
+            use_dataset(collection_id, key)
+            st.rerun()
+    return dataset
+
+
+@st.fragment(run_every=1)
+def fetch_progress():
+    """Poll the background fetch of this session until it completes"""
+    job = job_manager.get(st.session_state.fetch_job)
+    collection_id = st.session_state.fetch_job[0]
+    if job is None:
+        st.session_state.fetch_job = None
+        st.rerun()
+    status = job.status()
+
+    st.markdown(f"Getting fresh metadata for collection: **{collection_id}**")
+    st.markdown(format_progress(status))
+    progress = 0 if status["total"] == 0 else min(status["processed"] / status["total"], 1)
+    st.progress(progress)
+    if status["message"]:
+        st.text(status["message"])
+
+    if not job.done():
+        return
+    st.session_state.fetch_job = None
+    if status["state"] == "failed" or job.result is None:
+        st.error(
+            "Failed to fetch metadata for the collection. Please check the collection ID."
+            " If the download was interrupted, press Conform again to resume it."
+        )
+        if status["error"]:
+            st.write(status["error"])
+        return
+    # a reload of the version the session is on keeps its selections
+    if job.result != st.session_state.dataset_key:
+        use_dataset(collection_id, job.result)
+    st.rerun()
+
+
+@st.fragment(run_every=1)
+def item_details_progress():
+    """Poll the item details fetch of this session and join its result"""
+    collection_id = st.session_state.item_job
+    job = job_manager.get(("items", collection_id))
+    if job is None or collection_id != st.session_state.collection_id:
+        st.session_state.item_job = None
+        return
+    status = job.status()
+
+    st.markdown(format_progress(status))
+    progress = 0 if status["total"] == 0 else min(status["processed"] / status["total"], 1)
+    st.progress(progress)
+
+    if not job.done():
+        return
+    st.session_state.item_job = None
+    if status["state"] == "failed":
+        st.error("Failed to fetch the item details.")
+        st.write(status["error"])
+        return
+    # shared frames are read-only, register an extended copy
+    dataset = get_dataset()
+    items_pd = join_items_metadata(dataset["items_pd"], job.result)
+    dataset = {
+        **dataset,
+        "items_pd": items_pd,
+        "list_indexes": {
+            **dataset["list_indexes"],
+            "formats": build_list_index(items_pd["formats"]),
+        },
+    }
+    dataset_registry.put(st.session_state.dataset_key, dataset, frame_bytes(items_pd))
+    st.session_state.dataset_version += 1
+    st.rerun()
+
+
+@st.fragment(run_every=1)
+def field_progress():
+    """Poll the field fetch of this session and join its result"""
+    collection_id, field = st.session_state.field_job
+    job = job_manager.get(("field", collection_id, field))
+    if job is None or collection_id != st.session_state.collection_id:
+        st.session_state.field_job = None
+        return
+    status = job.status()
+
+    st.markdown(format_progress(status))
+    progress = 0 if status["total"] == 0 else min(status["processed"] / status["total"], 1)
+    st.progress(progress)
+
+    if not job.done():
+        return
+    st.session_state.field_job = None
+    version = get_cache_version(collection_id)
+    if status["state"] == "failed" or job.result.empty or version is None:
+        st.error(f"Failed to fetch {field}, please try again.")
+        if status["error"]:
+            st.write(status["error"])
+        return
+    # the cache file changed, register the extended dataset under its new version
+    key = (collection_id, version)
+    dataset = with_field(get_dataset(), field, job.result)
+    dataset_registry.put_latest(key, dataset, frame_bytes(dataset["items_pd"]))
+    st.session_state.dataset_key = key
+    st.session_state.dataset_version += 1
+    st.rerun()
+
+
+def get_list_index(column):
+    """Exploded index of a dataset column, built once and shared"""
+    dataset = get_dataset()
+    return dataset_registry.build_once(
+        dataset,
+        "list_indexes",
+        column,
+        lambda: build_list_index(dataset["items_pd"][column]),
+    )
+
+
+def is_list_column(column):
+    profile = get_dataset()["items_pd"].attrs.get("column_profile", {})
+    return profile.get(column) == "list"
+
+
+def get_filtered_list_index(column):
+    """Exploded index of a list column, restricted to the filtered rows"""
+    positions = get_dataset()["items_pd"].index.get_indexer(
+        st.session_state.filtered_pd.index
+    )
+    return subset_list_index(get_list_index(column), positions)
+
+
+def transform_base_key(column):
+    """Identity of a column of the filtered rows, before any transform"""
+    return (
+        st.session_state.dataset_version,
+        tuple(st.session_state.selected_columns),
+        column,
+    )
+
+
+def evaluate_transforms(column, upto=None):
+    """A column of the filtered rows after its first upto transform steps"""
+    dataset = get_dataset()
+    items_pd = dataset["items_pd"]
+    filtered_pd = st.session_state.filtered_pd
+
+    def base():
+        list_index = get_filtered_list_index(column) if is_list_column(column) else None
+        return TransformResult(filtered_pd[column], list_index)
+
+    def calendar_column(step):
+        # date parts precomputed when the collection was loaded
+        part = {"Date Quarter": "quarter", "Date Week": "week"}.get(step.transform_type)
+        prefixes = [
+            prefix
+            for prefix, date_column in dataset["calendar_columns"].items()
+            if date_column == column
+        ]
+        if part is None or not prefixes or f"{prefixes[0]}{part}" not in items_pd.columns:
+            return None
+        return items_pd.loc[filtered_pd.index, f"{prefixes[0]}{part}"].rename(column)
+
+    pipeline = st.session_state.transforms
+    with stage("transform", filtered_pd, trace=st.session_state.collection_id) as current:
+        current.record(column=column, steps=len(pipeline.steps.get(column, [])[:upto]))
+        return pipeline.evaluate(
+            column, transform_base_key(column), base, upto, calendar_column
+        )
+
+
+def get_column_sketch(column):
+    """Distinct count and frequency sketch of the filtered rows of a column.
+
+    Built once per filter and shared, the filter only depends on the
+    selected columns.
+    """
+    dataset = get_dataset()
+    filtered_pd = st.session_state.filtered_pd
+    trace_id = st.session_state.collection_id
+
+    def build():
+        with stage("sketch", filtered_pd, trace=trace_id):
+            return sketch_column(filtered_pd[column])
+
+    name = (column, tuple(st.session_state.selected_columns))
+    return dataset_registry.build_once(dataset, "sketches", name, build)
+
+
+def get_sample(strata_column):
+    """Stratified sample of the filtered rows, drawn once per filter"""
+    key = (
+        st.session_state.dataset_version,
+        tuple(st.session_state.selected_columns),
+        strata_column,
+    )
+    if st.session_state.sample is None or st.session_state.sample[0] != key:
+        items_pd = get_dataset()["items_pd"]
+        filtered_pd = st.session_state.filtered_pd
+        with stage("sampling", filtered_pd, trace=st.session_state.collection_id) as current:
+            strata = items_pd[strata_column].loc[filtered_pd.index]
+            sample = stratified_sample(strata, SAMPLE_SIZE)
+            current.record(strata=strata_column, sampled=len(sample.positions))
+        st.session_state.sample = (key, sample)
+    return st.session_state.sample[1]
 
 
 @st.fragment
@@ -58,17 +372,28 @@ def collection_input():
         )
     with col2:
         conform_button = st.button("Conform")
+    full_resync = st.checkbox(
+        "Full resync",
+        help="Re-download the whole collection instead of only fetching items added since the last fetch.",
+    )
+
+    if st.session_state.fetch_job is not None and not conform_button:
+        # the download keeps going across reruns, attach to it again
+        fetch_progress()
+        st.stop()
 
     if not conform_button and not st.session_state.got_metadata or collection_id == "":
         st.stop()
 
+    resync_requested = conform_button and full_resync
     if (
         st.session_state.got_metadata
         and collection_id == st.session_state.collection_id
+        and not resync_requested
     ):
-        items_pd = st.session_state.items_pd
+        items_pd = get_dataset()["items_pd"]
         # progress_message
-        progress_message = st.session_state.progress_message
+        progress_message = get_dataset()["progress_message"]
         st.markdown(progress_message)
         st.write("The collection contains the following items:")
         try:
@@ -80,66 +405,28 @@ def collection_input():
 
         return
 
-    # Check if we need to fetch new data
-    if (
-        not st.session_state.got_metadata
-        or collection_id != st.session_state.collection_id
-    ):
-        st.markdown(f"Getting fresh metadata for collection: **{collection_id}**")
-        items, progress_message = fetch_metadata(collection_id)
-        data_transform_text = st.text("Transforming data...")
-        items_pd = pd.DataFrame(items)
-        if items_pd.empty:
-            st.error(
-                "Failed to fetch metadata for the collection. Please check the collection ID."
+    key = None if resync_requested else get_cached_dataset(collection_id)
+    if key is None:
+        # downloads run in the background and are shared between sessions
+        job = start_fetch(collection_id, resync_requested)
+        if job is None:
+            st.warning(
+                "This collection is already being fetched. Press Conform with Full"
+                " resync again once the fetch has finished."
             )
-            st.stop()
-
-        data_transform_text.text("cleaning data...")
-        # drop columns with 80%+ nan
-        items_pd = items_pd.dropna(axis=1, thresh=0.8 * len(items_pd))
-        items_pd = items_pd.dropna(axis=0, thresh=0.7 * len(items_pd.columns))
-        # drop mediatype=collections
-        items_pd = items_pd[items_pd["mediatype"] != "collection"]
-        items_pd = normalize_list_columns(items_pd)
-
-        # drop columns with different types inner.
-        # for col in items_pd.columns:
-        #    items_pd[col] = items_pd[col].apply(lambda x: x if isinstance(x, type(items_pd[col][0])) else np.nan)
-
-        # calculate metadata
-        data_transform_text.text("calculating metadata...")
-        items_pd["addeddate"] = pd.to_datetime(items_pd["addeddate"])
-        # items_pd["publicdate"] = pd.to_datetime(items_pd["publicdate"])
-
-        # Use 'date' column if it exists, otherwise use 'addeddate'
-        date_column = "date" if "date" in items_pd.columns else "addeddate"
-
-        # year, month, and day should be recalculated
-        items_pd["year"] = pd.to_datetime(items_pd[date_column]).dt.year
-        items_pd["month"] = pd.to_datetime(items_pd[date_column]).dt.month
-        items_pd["day"] = pd.to_datetime(items_pd[date_column]).dt.day
-        data_transform_text.text("Data transformation and cleaning complete!")
-
-        # Update cache
-        st.session_state.items_pd = items_pd
-        st.session_state.items_length = len(items_pd)
-    else:
-        st.markdown(f"Using cached metadata for collection: **{collection_id}**")
-        items_pd = st.session_state.items_pd
-
-    st.session_state.got_metadata = True
-    st.session_state.collection_id = collection_id
-    st.session_state.progress_message = progress_message
-    st.session_state.selected_columns = []
+            job = start_fetch(collection_id)
+        st.session_state.fetch_job = job.key
+        fetch_progress()
+        st.stop()
 
+    use_dataset(collection_id, key)
     st.rerun()
 
 
 @st.fragment
 def column_selector():
     """Fragment for selecting columns to analyze"""
-    items_pd = st.session_state.items_pd
+    items_pd = get_dataset()["items_pd"]
 
     st.header("Selecting columns to analyze")
     st.write("Select additional columns you want to analyze:")
@@ -152,13 +439,54 @@ def column_selector():
         "Select columns:", seleactable_columns, default=[]
     )
 
+    # fields skipped at fetch time because they were sparse in the sample
+    fetched_fields, available_fields = get_collection_fields(
+        st.session_state.collection_id
+    )
+    missing_fields = [
+        field
+        for field in available_fields
+        if field not in fetched_fields and field not in items_pd.columns
+    ]
+    if missing_fields:
+        with st.expander("Fetch more fields"):
+            col1, col2 = st.columns([6, 1], vertical_alignment="bottom")
+            with col1:
+                field = st.selectbox("Field to fetch:", missing_fields)
+            with col2:
+                backfill_button = st.button(
+                    "Fetch", disabled=st.session_state.field_job is not None
+                )
+            if backfill_button:
+                start_field_fetch(st.session_state.collection_id, field)
+                st.session_state.field_job = (st.session_state.collection_id, field)
+            if st.session_state.field_job is not None:
+                field_progress()
+
+    if ITEM_FIELDS[0] not in items_pd.columns:
+        with st.expander("Fetch item details"):
+            st.write(
+                f"File counts, sizes and formats ({', '.join(ITEM_FIELDS)}) are only in"
+                " the metadata of each item. They are fetched item by item, which takes"
+                " a while for large collections, and cached for a week."
+            )
+            if st.session_state.item_job is None and st.button("Fetch item details"):
+                start_item_fetch(
+                    st.session_state.collection_id, items_pd["identifier"].tolist()
+                )
+                st.session_state.item_job = st.session_state.collection_id
+            if st.session_state.item_job is not None:
+                item_details_progress()
+
     # Update the filtering code to use cache
     if (
         st.session_state.filtered_pd is None
         or selected_columns != st.session_state.selected_columns
     ):
-        filtered_pd = items_pd[selected_columns + REQUIRED_METADATA]
-        filtered_pd = filtered_pd.dropna(axis=0, how="any")
+        with stage("column filtering", trace=st.session_state.collection_id) as current:
+            filtered_pd = items_pd[selected_columns + REQUIRED_METADATA]
+            filtered_pd = filtered_pd.dropna(axis=0, how="any")
+            current.record(filtered_pd)
 
         # Cache the filtered dataframe and selected columns
         st.session_state.filtered_pd = filtered_pd
@@ -171,6 +499,29 @@ def column_selector():
     st.write(filtered_pd.head(30))
 
 
+def collection_overview():
+    """Headline charts of the collection, from its rollup only"""
+    rollup = get_dataset().get("rollup")
+    if rollup is None:
+        return
+    with st.expander("Overview", expanded=True):
+        by_mediatype = plan_rollup(rollup, REQUIRED_METADATA, "addedyear", "mediatype")
+        if by_mediatype is not None:
+            st.write("Items added per year, by media type:")
+            st.bar_chart(rollup_crosstab(by_mediatype))
+        by_size = plan_rollup(
+            rollup, REQUIRED_METADATA, "addedyear", "item_size", with_median=False
+        )
+        if by_size is not None:
+            st.write("Size added per year (GiB):")
+            sizes = rollup_metrics(by_size).set_index("addedyear")["Sum"]
+            st.bar_chart(sizes / 1024**3)
+        by_language = plan_rollup(rollup, REQUIRED_METADATA, "addedyear", "language")
+        if by_language is not None:
+            st.write("Items per language (10 most common):")
+            st.bar_chart(rollup_crosstab(by_language).sum().nlargest(10))
+
+
 @st.fragment
 def mapping_controls(formatted_values: list, value_counts: dict):
     """Fragment for mapping source/target controls"""
@@ -237,6 +588,48 @@ def mapping_controls(formatted_values: list, value_counts: dict):
                 st.rerun(scope="fragment")
 
 
+def analysis_options():
+    """Choose how large collections are analyzed"""
+    filtered_pd = st.session_state.filtered_pd
+    items_pd = get_dataset()["items_pd"]
+    st.session_state.sampling = None
+    st.session_state.lazy_query = False
+    if len(items_pd) <= SAMPLE_SIZE:
+        return
+    st.session_state.lazy_query = st.toggle(
+        "Query the on-disk cache",
+        help="Aggregate plots with a multi-threaded query over the cached collection,"
+        " reading only the columns it needs, instead of the loaded data."
+        " Numeric Bins transforms and item details are only available in memory,"
+        " the median is approximate.",
+    )
+    if len(filtered_pd) <= SAMPLE_SIZE:
+        return
+    profile = items_pd.attrs.get("column_profile", {})
+    strata_columns = [
+        col
+        for col in dict.fromkeys(
+            ["addedyear", "mediatype"] + st.session_state.selected_columns
+        )
+        if col in items_pd.columns and profile.get(col) != "list"
+    ]
+
+    col1, col2 = st.columns(2, vertical_alignment="bottom")
+    with col1:
+        sampled = st.toggle(
+            "Sampled analysis",
+            value=len(filtered_pd) >= SAMPLE_THRESHOLD,
+            help=f"Show estimates from a stratified sample of {SAMPLE_SIZE} rows at once,"
+            " with 95% confidence intervals, while the exact results are computed.",
+        )
+    with col2:
+        strata_column = st.selectbox(
+            "Stratify sample by:", strata_columns, disabled=not sampled
+        )
+    if sampled and strata_column is not None:
+        st.session_state.sampling = strata_column
+
+
 @st.fragment
 def transform_data():
     """Fragment for transforming data"""
@@ -251,11 +644,15 @@ def transform_data():
         return
 
     selected_columns = st.session_state.selected_columns
-    items_length = st.session_state.items_length
+    pipeline = st.session_state.transforms
+    items_length = len(get_dataset()["items_pd"])
     filtered_pd = st.session_state.filtered_pd
 
     st.header("Transform Column")
-    st.write("Transform an existing column with data transformations")
+    st.write(
+        "Transform an existing column with data transformations,"
+        " the steps of a column are applied in order"
+    )
 
     col1, col2 = st.columns([2, 3], vertical_alignment="bottom")
 
@@ -263,16 +660,31 @@ def transform_data():
         source_col = st.selectbox("Select column to transform:", selected_columns)
 
     with col2:
-        transform_type = st.selectbox(
-            "Select transformation:",
-            [
-                "Value Mapping",
-                "Date Quarter",
-                "Date Week",
-                "String Prefix",
-                "Numeric Bins",
-            ],
-        )
+        transform_type = st.selectbox("Select transformation:", TRANSFORM_TYPES)
+
+    steps = list(pipeline.steps.get(source_col, []))
+    last = len(steps)
+    position = last
+    if steps:
+        st.write("Transform steps of this column:")
+        for number, step in enumerate(steps, 1):
+            st.write(f"{number}. {step.describe()}")
+        col1, col2 = st.columns([5, 1], vertical_alignment="bottom")
+        with col1:
+            position = st.selectbox(
+                "Apply as:",
+                range(last + 1),
+                index=last,
+                format_func=lambda p: "New last step"
+                if p == last
+                else f"Replacement of step {p + 1}",
+                # starts over as a new last step whenever the steps change
+                key=f"apply_as_{source_col}_{last}",
+            )
+        with col2:
+            if position < last and st.button("Remove step"):
+                pipeline.remove_step(source_col, position)
+                st.rerun(scope="fragment")
 
     # Add transformation params based on type
     if transform_type == "String Prefix":
@@ -311,8 +723,34 @@ def transform_data():
             ratio_map = {"1%": 0.01, "0.1%": 0.001, "0.01%": 0.0001}
             threshold = ratio_map[threshold_type]
 
-        # Value analysis with grouping
-        value_counts = filtered_pd[source_col].value_counts()
+        # Value analysis with grouping, list columns count their elements
+        if position > 0:
+            # values as the steps before this one leave them
+            previous = evaluate_transforms(source_col, upto=position)
+            if previous.list_index is not None:
+                value_counts = code_value_counts(
+                    previous.list_index.codes, previous.list_index.categories
+                )
+            else:
+                value_counts = previous.values.value_counts()
+        elif st.session_state.sampling is not None and not is_list_column(source_col):
+            # values seen in the sample, counted by a sketch of the filtered rows
+            sample = get_sample(st.session_state.sampling)
+            candidates = sample_value_counts(filtered_pd[source_col], sample).index
+            sketch = get_column_sketch(source_col)
+            value_counts = sketch_value_counts(sketch, candidates)
+            st.caption(
+                f"About {sketch.distinct.count()} distinct values. Counts are estimated"
+                f" for the {len(candidates)} values found in a sample; values too rare"
+                " to show up in it are left unmapped."
+            )
+        elif is_list_column(source_col):
+            list_index = get_filtered_list_index(source_col)
+            value_counts = code_value_counts(list_index.codes, list_index.categories)
+        else:
+            value_counts = filtered_pd[source_col].value_counts()
+        # categoricals also count the categories that were filtered out
+        value_counts = value_counts[value_counts > 0]
         total_count = value_counts.sum()
 
         small_values = value_counts[value_counts < threshold * total_count]
@@ -359,93 +797,51 @@ def transform_data():
     elif transform_type == "Numeric Bins":
         num_bins = st.number_input("Number of bins:", min_value=2, value=5)
 
-    if st.button("Preview and Apply"):
-        if transform_type == "Date Quarter":
-            new_col = pd.to_datetime(filtered_pd[source_col]).dt.quarter
-        elif transform_type == "Date Week":
-            new_col = pd.to_datetime(filtered_pd[source_col]).dt.isocalendar().week
-        elif transform_type == "String Prefix":
-            new_col = filtered_pd[source_col].str[:prefix_len]
-        elif transform_type == "Numeric Bins":
-            new_col = pd.qcut(filtered_pd[source_col], num_bins, labels=False)
-        elif transform_type == "Value Mapping":
-
-            def safe_map(x):
-                # Convert list to tuple for mapping since lists are unhashable
-                if isinstance(x, list):
-                    # Check if entire list matches any source
-                    str_val = str(x)  # Convert full list to string for matching
-                    if str_val in mapping_dict:
-                        return mapping_dict[str_val]
-
-                    # Try mapping individual elements
-                    mapped = [mapping_dict.get(item, item) for item in x]
-                    return mapped
-                else:
-                    return mapping_dict.get(x, x)
-
-            # Create mapping dictionary
-            mapping_dict = {}
-            for m in st.session_state.mapping_table:
-                for source in m["sources"]:
-                    # Handle both string representations of lists and regular values
-                    mapping_dict[source] = m["target"]
-                    if source.startswith("[") and source.endswith("]"):
-                        # Also add the actual list/string version
-                        try:
-                            mapping_dict[eval(source)] = m["target"]
-                        except:
-                            pass
-
-            # Apply mapping with list handling
-            new_col = filtered_pd[source_col].map(safe_map)
-
-            # Show preview
-            preview_rows = []
-
-            # Get samples for each mapping
-            for mapping in st.session_state.mapping_table:
-                # For each source value in the mapping
-                for source in mapping["sources"]:
-                    matching_rows = filtered_pd[filtered_pd[source_col] == source].head(
-                        1
-                    )
-                    if not matching_rows.empty:
-                        preview_rows.append(matching_rows)
-
-            # Get some unmatched samples too
-            mapped_values = {
-                s for m in st.session_state.mapping_table for s in m["sources"]
-            }
-            unmatched = filtered_pd[~filtered_pd[source_col].isin(mapped_values)].head(
-                1
-            )
-            if not unmatched.empty:
-                preview_rows.append(unmatched)
+    # everything needed to replay the step, in memory or on the cache
+    transform_params = {}
+    if transform_type == "String Prefix":
+        transform_params = {"prefix_len": prefix_len}
+    elif transform_type == "Value Mapping":
+        transform_params = {"mapping": compile_mapping(st.session_state.mapping_table)}
+    elif transform_type == "Numeric Bins":
+        transform_params = {"num_bins": num_bins}
 
-            # Combine samples
-            preview_df = pd.concat(preview_rows)
-            preview_df = pd.DataFrame(
-                {
-                    "Original": preview_df[source_col],
-                    "Transformed": preview_df[source_col].map(safe_map),
-                }
+    if st.button("Preview and Apply"):
+        replaced = steps[position] if position < last else None
+        pipeline.set_step(source_col, TransformStep(transform_type, transform_params), position)
+        try:
+            previous = evaluate_transforms(source_col, upto=position)
+            result = evaluate_transforms(source_col, upto=position + 1)
+        except (AttributeError, TypeError, ValueError) as e:
+            if replaced is None:
+                pipeline.remove_step(source_col, position)
+            else:
+                pipeline.set_step(source_col, replaced, position)
+            st.error(f"Failed to apply {transform_type} to {source_col}: {e}")
+            return
+
+        if transform_type == "Value Mapping":
+            if previous.list_index is not None:
+                codes, categories = previous.list_index.codes, previous.list_index.categories
+                rows = previous.list_index.rows
+            else:
+                codes, categories = column_codes(previous.values)
+                rows = None
+            preview_df = mapping_preview(
+                previous.values,
+                result.values,
+                codes,
+                categories,
+                st.session_state.mapping_table,
+                rows,
             )
-
             st.write("Preview showing examples of each mapping:")
-            st.write(preview_df.T)
-
-            st.session_state.transformed_data = {
-                "source_col": source_col,
-                "transform_type": transform_type,
-                "new_col": new_col,
-            }
-            st.session_state.transformed_columns.append(source_col)
-            st.session_state.transform_history.append(
-                {"source_col": source_col, "transform_type": transform_type}
+        else:
+            preview_df = pd.DataFrame(
+                {"Original": previous.values.head(5), "Transformed": result.values.head(5)}
             )
-            st.session_state.original_values[source_col] = preview_df["Original"]
-
+            st.write("Preview of the first rows:")
+        st.write(preview_df.T)
 
 
 @st.fragment
@@ -465,85 +861,297 @@ def plot_data():
     with col3:
         plot_button = st.button("Plot")
 
-    if plot_button and x_axis != y_axis:
+    if plot_button:
+        st.session_state.plotted_axes = (x_axis, y_axis)
+    if st.session_state.plotted_axes == (x_axis, y_axis) and x_axis != y_axis:
         st.write("Plotting the data...")
         st.write(f"X-axis: {x_axis}, Y-axis: {y_axis}")
 
-        # Create a working copy of the dataframe
-        plot_df = filtered_pd.copy()
-
-        # Replace data with transformed versions if available
+        # Pick transformed versions of the axes if available, no copy needed
+        pipeline = st.session_state.transforms
+        axis_values = {}
+        axis_indexes = {}
+        transform_keys = {}
         for axis, col_name in [("x", x_axis), ("y", y_axis)]:
-            if col_name in st.session_state.transformed_columns:
-                if st.session_state.transformed_data["source_col"] == col_name:
-                    plot_df[col_name] = st.session_state.transformed_data["new_col"]
-                    st.write(f"Using transformed data for {axis}-axis")
-
-        # Continue with plotting logic using plot_df instead of filtered_pd
-        if isinstance(plot_df[y_axis].iloc[0], (int, float, np.int64, np.float64)):
-            all_metrics = (
-                plot_df.groupby(x_axis)[y_axis]
-                .agg(
-                    [
-                        ("Count", "count"),
-                        ("Sum", "sum"),
-                        ("Mean", "mean"),
-                        ("Median", "median"),
-                        ("Min", "min"),
-                        ("Max", "max"),
-                    ]
-                )
-                .reset_index()
-            )
+            axis_values[col_name] = filtered_pd[col_name]
+            if col_name in pipeline.steps:
+                # replayed from the cached steps, only changed steps are recomputed
+                result = evaluate_transforms(col_name)
+                axis_values[col_name] = result.values
+                axis_indexes[col_name] = result.list_index
+                transform_keys[axis] = pipeline.key(col_name, transform_base_key(col_name))
+                st.write(f"Using transformed data for {axis}-axis")
+        transformed_axes = set(transform_keys)
+        x_values, y_values = axis_values[x_axis], axis_values[y_axis]
+
+        trace_id = st.session_state.collection_id
+        cache_key = (
+            st.session_state.dataset_version,
+            tuple(st.session_state.selected_columns),
+            x_axis,
+            y_axis,
+            tuple(sorted(transform_keys.items())),
+            st.session_state.lazy_query,
+        )
 
-            # Display complete aggregated data
-            st.write("Complete aggregation metrics:")
-            # Create multi-line chart (excluding Count since it's often on different scale)
-            metrics_for_plot = all_metrics.drop(columns=["Count", "Sum", "Max"])
-            metrics_for_plot = metrics_for_plot.set_index(x_axis)
+        numeric = pd.api.types.is_numeric_dtype(y_values) or isinstance(
+            y_values.iloc[0], (int, float, np.int64, np.float64)
+        )
+        # counts the rollup covers are answered from its cells, without the
+        # rows. Metrics aren't, they show medians the cells can't give
+        rollup_query = None
+        if not transformed_axes and not numeric:
+            rollup_query = plan_dataset_rollup(x_axis, y_axis)
+        if rollup_query is not None:
+            st.caption("Answered from the rollup built when the collection was loaded.")
+
+        query = None
+        if st.session_state.lazy_query and rollup_query is None:
+            query = plan_collection_query(x_axis, y_axis)
+            if query is None:
+                st.write("This plot can't be queried from the cache, using the loaded data")
+
+        sample = None
+        if st.session_state.sampling is not None and rollup_query is None:
+            sample = get_sample(st.session_state.sampling)
+
+        if numeric:
+            def metrics():
+                with stage("aggregation", x_values, trace=trace_id) as current:
+                    current.record(
+                        kind="numeric", x=x_axis, y=y_axis, lazy=query is not None
+                    )
+                    if query is not None:
+                        return query_metrics(query)
+                    return numeric_metrics(x_values, y_values)
 
-            st.write("Multi-metric trend lines:")
-            st.line_chart(metrics_for_plot)
+            def estimate():
+                with stage("sampled aggregation", trace=trace_id) as current:
+                    current.record(kind="numeric", x=x_axis, y=y_axis)
+                    return sample_metrics(x_values, y_values, sample), None
 
-            st.write(all_metrics)
+            if sample is None:
+                estimate = None
+            refined_result(cache_key, metrics, estimate, show_metrics)
 
         # if y_axis is not numeric, count and plot
         else:
             st.write("Analyzing distribution across categories...")
 
-            # Create mask for list and non-list values
-            is_list_mask = plot_df[y_axis].apply(lambda x: isinstance(x, list))
+            # count over the exploded index codes instead of re-exploding
+            if rollup_query is not None:
+                y_index, positions = None, None
+            elif "y" not in transformed_axes:
+                y_index = get_list_index(y_axis)
+                positions = get_dataset()["items_pd"].index.get_indexer(
+                    filtered_pd.index
+                )
+            else:
+                y_index = axis_indexes[y_axis]
+                if y_index is None:
+                    y_index = build_list_index(y_values)
+                positions = None
+
+            def crosstab():
+                with stage("aggregation", x_values, trace=trace_id) as current:
+                    current.record(
+                        kind="crosstab",
+                        x=x_axis,
+                        y=y_axis,
+                        lazy=query is not None,
+                        rollup=rollup_query is not None,
+                    )
+                    if rollup_query is not None:
+                        counts_df = rollup_crosstab(rollup_query)
+                    elif query is not None:
+                        counts_df = query_crosstab(query)
+                    else:
+                        counts_df = category_crosstab(x_values, y_index, positions)
+                    counts_df.columns.name = y_axis
+                    return counts_df
+
+            def estimate():
+                with stage("sampled aggregation", trace=trace_id) as current:
+                    current.record(kind="crosstab", x=x_axis, y=y_axis)
+                    counts_df, margins = sample_crosstab(
+                        x_values, y_index, sample, positions
+                    )
+                    counts_df.columns.name = y_axis
+                    return counts_df, margins
 
-            # Handle list values
-            list_data = plot_df[is_list_mask][[x_axis, y_axis]].copy()
-            exploded_list = list_data.explode(y_axis)
+            if sample is None:
+                estimate = None
+            refined_result(cache_key, crosstab, estimate, show_crosstab)
 
-            # Handle non-list values
-            non_list_data = plot_df[~is_list_mask][[x_axis, y_axis]]
 
-            # Combine results efficiently
-            expanded_df = pd.concat([exploded_list, non_list_data])
+def plan_dataset_rollup(x_axis, y_axis):
+    """Rollup query of a plot of the filtered rows, None if the rollup doesn't cover it"""
+    rollup = get_dataset().get("rollup")
+    if rollup is None:
+        return None
+    return plan_rollup(
+        rollup, st.session_state.selected_columns + REQUIRED_METADATA, x_axis, y_axis
+    )
 
-            # Create pivot table and plot
-            pivot_table = (
-                pd.crosstab(expanded_df[x_axis], expanded_df[y_axis], normalize="index")
-                * 100
-            )
 
-            st.bar_chart(pivot_table)
+def plan_collection_query(x_axis, y_axis):
+    """Lazy query of a plot over the cache file the dataset was loaded from"""
+    steps = st.session_state.transforms.steps
+    collection_id, version = st.session_state.dataset_key
+    dataset = open_collection(collection_id, version)
+    kept = cleaned_fields(collection_id, version)
+    if dataset is None or kept is None:
+        return None
+    return plan_query(
+        dataset,
+        st.session_state.selected_columns + REQUIRED_METADATA,
+        x_axis,
+        y_axis,
+        get_dataset()["calendar_columns"],
+        {column: steps[column] for column in (x_axis, y_axis) if column in steps},
+        kept,
+    )
+
+
+def show_metrics(all_metrics: pd.DataFrame, margins=None):
+    """Chart and table of numeric_metrics or sample_metrics"""
+    x_axis = all_metrics.columns[0]
+    st.write("Complete aggregation metrics:")
+    # Create multi-line chart (excluding Count since it's often on different scale)
+    metrics_for_plot = all_metrics.drop(
+        columns=["Count", "Count ±", "Sum", "Max"], errors="ignore"
+    )
+    metrics_for_plot = metrics_for_plot.set_index(x_axis)
+
+    st.write("Multi-metric trend lines:")
+    charted = downsample(metrics_for_plot)
+    if len(charted) < len(metrics_for_plot):
+        st.caption(
+            f"Downsampled to {len(charted)} of {len(metrics_for_plot)} points, keeping their shape."
+        )
+    st.line_chart(charted)
+
+    estimated = "Count ±" in all_metrics.columns
+    show_table(all_metrics, f"metrics_{estimated}")
+
+
+def show_crosstab(counts_df: pd.DataFrame, margins: pd.DataFrame | None = None):
+    """Chart and table of category_crosstab or sample_crosstab"""
+    # the less common categories are charted and listed as one
+    categories = len(counts_df.columns)
+    counts_df, margins = top_categories(counts_df, margins=margins)
+    if len(counts_df.columns) < categories:
+        st.caption(
+            f"Showing the {CHART_TOP_K} most common of {categories} categories, "
+            "the others are summed into one."
+        )
+
+    # Create pivot table and plot
+    pivot_table = counts_df.div(counts_df.sum(axis=1), axis=0) * 100
+    charted = downsample(pivot_table)
+    if len(charted) < len(pivot_table):
+        st.caption(
+            f"Downsampled to {len(charted)} of {len(pivot_table)} bars, keeping their shape."
+        )
+    st.bar_chart(charted)
+
+    st.write("Distribution counts:")
+    if margins is None:
+        show_table(counts_df, "crosstab")
+    else:
+        show_table(counts_df.round().astype("int64"), "crosstab_estimate")
+        st.write("± (95% confidence):")
+        show_table(margins.round().astype("int64"), "crosstab_margins")
+
+
+def show_table(table: pd.DataFrame, key: str):
+    """Write a table a page at a time, only that page is sent to the browser"""
+    pages = page_count(len(table))
+    if pages == 1:
+        st.write(table)
+        return
+    # keyed by length too, a new result doesn't start on a page it doesn't have
+    page = st.number_input(
+        f"Page (of {pages}, {len(table)} rows)",
+        min_value=1,
+        max_value=pages,
+        key=f"page_{key}_{len(table)}",
+    )
+    st.write(table_page(table, page))
+
+
+def refined_result(cache_key, compute, estimate, show):
+    """Show a cached aggregation, or its estimate until the exact result is ready.
+
+    Without an estimate the aggregation is computed right away. Otherwise
+    it is computed in the background while the estimate is shown.
+    """
+    aggregation_cache = st.session_state.aggregation_cache
+    result = aggregation_cache.get(cache_key)
+    if result is None and estimate is None:
+        result = aggregation_cache.get_or_compute(cache_key, compute)
+    if result is not None:
+        show(result)
+        return
+
+    # the job runs outside of the session, compute must not touch st.session_state
+    job = aggregation_jobs.submit(
+        (id(aggregation_cache), cache_key),
+        lambda job: aggregation_cache.get_or_compute(cache_key, compute),
+    )
+    placeholder = st.empty()
+    with placeholder.container():
+        st.info("Estimated from a stratified sample, the exact result follows.")
+        show(*estimate())
+    status = st.empty()
+    while not job.done():
+        # each update lets streamlit stop this run if the user moved on
+        status.caption(f"Computing the exact result... `{job.status()['elapsed']:.0f}`s")
+        job.wait(0.5)
+    status.empty()
+    aggregation_jobs.discard(job.key)
+    if job.status()["state"] == "failed":
+        st.error(f"Failed to compute the exact result: {job.status()['error']}")
+        return
+    with placeholder.container():
+        show(job.result)
+
+
+def performance_panel():
+    """Timings of the pipeline stages run for the current collection"""
+    records = perf_log.records(st.session_state.collection_id)
+    if not records:
+        return
+    with st.expander("Performance"):
+        stages_pd = pd.DataFrame(records)
+        stages_pd["started_at"] = pd.to_datetime(stages_pd["started_at"], unit="s")
+        totals = (
+            stages_pd.groupby("stage")["seconds"]
+            .agg(["count", "sum", "max"])
+            .sort_values("sum", ascending=False)
+        )
+        st.write("Total time per stage (seconds):")
+        st.bar_chart(totals["sum"])
+        st.write(totals)
+        st.write("Recent stages:")
+        st.dataframe(stages_pd.iloc[::-1], hide_index=True)
 
-            st.write("Distribution counts:")
-            counts_df = pd.crosstab(expanded_df[x_axis], expanded_df[y_axis])
-            st.write(counts_df)
+        telemetry = request_telemetry.last_summary(st.session_state.collection_id)
+        if telemetry:
+            st.write("HTTP requests of the last fetch:")
+            st.dataframe(pd.DataFrame(summary_rows(telemetry)), hide_index=True)
 
 
 def main():
     collection_input()
     if st.session_state.got_metadata:
+        collection_overview()
         column_selector()
         if st.session_state.filtered_pd is not None:
+            analysis_options()
             transform_data()
             plot_data()
+        performance_panel()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,199 @@
+from bisect import bisect_left
+from collections import Counter, deque
+import json
+import logging
+import random
+import threading
+import time
+import weakref
+
+import requests
+
+from ia_collection_analyzer.constdatas import (
+    TELEMETRY_MAX_SAMPLES,
+    TELEMETRY_SAMPLE_RATE,
+)
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = [0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+
+class Histogram:
+    """Fixed bucket histogram, quantiles are read off the bucket bounds"""
+
+    def __init__(self, bounds: list[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 4) if self.count else 0.0,
+            "max": round(self.max, 4),
+            "p50": round(self.quantile(0.5), 4),
+            "p90": round(self.quantile(0.9), 4),
+            "p99": round(self.quantile(0.99), 4),
+            "buckets": dict(zip(map(str, self.bounds + ["inf"]), self.counts)),
+        }
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+        self.statuses = Counter()
+        self.retries = 0
+        self.redirects = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "bytes": self.bytes,
+            "statuses": {str(status): n for status, n in self.statuses.items()},
+            "retries": self.retries,
+            "redirects": self.redirects,
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+            "latency": self.latency.to_dict(),
+        }
+
+
+class RequestTelemetry:
+    """Counters and latency histograms of the HTTP responses of a session.
+
+    response_hook only updates in-memory counters, and keeps the full
+    record of a sample of the responses. Nothing is written on the request
+    path; emit() logs a summary, usually once a fetch is over.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = TELEMETRY_SAMPLE_RATE,
+        max_samples: int = TELEMETRY_MAX_SAMPLES,
+    ):
+        self.sample_rate = sample_rate
+        self.lock = threading.Lock()
+        self.endpoints: dict[str, EndpointStats] = {}
+        self.samples = deque(maxlen=max_samples)
+        # connections seen so far, pools drop the ones they close
+        self.connections = weakref.WeakSet()
+        self.started_at = time.time()
+        self.summaries = {}
+
+    def response_hook(self, r: requests.Response, *args, **kwargs):
+        # the connection goes back to its pool once the body is read
+        connection = getattr(r.raw, "connection", None)
+        start = time.perf_counter()
+        if kwargs.get("stream"):
+            nbytes = int(r.headers.get("Content-Length") or 0)
+            latency = r.elapsed.total_seconds()
+        else:
+            # read here instead of right after the hooks, to time the body too
+            nbytes = len(r.content)
+            latency = r.elapsed.total_seconds() + time.perf_counter() - start
+        retries = getattr(r.raw, "retries", None)
+        retries = len(retries.history) if retries is not None else 0
+        endpoint = r.url.split("?", 1)[0]
+
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats()
+            stats.requests += 1
+            stats.bytes += nbytes
+            stats.statuses[r.status_code] += 1
+            stats.retries += retries
+            stats.redirects += len(r.history)
+            stats.latency.add(latency)
+            if connection is not None:
+                if connection in self.connections:
+                    stats.reused_connections += 1
+                else:
+                    self.connections.add(connection)
+                    stats.new_connections += 1
+            if self.sample_rate and random.random() < self.sample_rate:
+                self.samples.append(
+                    {
+                        "method": r.request.method,
+                        "url": r.url,
+                        "status": r.status_code,
+                        "bytes": nbytes,
+                        "seconds": round(latency, 4),
+                        "retries": retries,
+                    }
+                )
+
+    def emit(self, label: str) -> dict:
+        """Log and keep a summary of the requests since the last one, then reset.
+
+        Fetches running at the same time share the counters, their requests
+        end up in whichever summary is emitted first.
+        """
+        with self.lock:
+            summary = {
+                "label": label,
+                "since": round(self.started_at, 3),
+                "until": round(time.time(), 3),
+                "endpoints": {
+                    endpoint: stats.to_dict() for endpoint, stats in self.endpoints.items()
+                },
+            }
+            samples = list(self.samples)
+            self.endpoints = {}
+            self.samples.clear()
+            self.started_at = time.time()
+            self.summaries[label] = summary
+        logger.info(json.dumps({"telemetry": summary}))
+        for sample in samples:
+            logger.debug(json.dumps({"request": sample}))
+        return summary
+
+    def last_summary(self, label: str) -> dict | None:
+        with self.lock:
+            return self.summaries.get(label)
+
+
+def summary_rows(summary: dict) -> list[dict]:
+    """One flat row per endpoint of a telemetry summary, for tables"""
+    rows = []
+    for endpoint, stats in summary["endpoints"].items():
+        latency = stats["latency"]
+        rows.append(
+            {
+                "endpoint": endpoint,
+                "requests": stats["requests"],
+                "MiB": round(stats["bytes"] / 1024**2, 2),
+                "statuses": ", ".join(f"{k}: {v}" for k, v in stats["statuses"].items()),
+                "retries": stats["retries"],
+                "new connections": stats["new_connections"],
+                "reused connections": stats["reused_connections"],
+                **{f"{k} s": latency[k] for k in ("mean", "p50", "p90", "p99", "max")},
+            }
+        )
+    return rows
+
+
+request_telemetry = RequestTelemetry()
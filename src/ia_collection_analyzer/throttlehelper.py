@@ -0,0 +1,112 @@
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+import random
+import threading
+import time
+
+import requests
+
+from ia_collection_analyzer.constdatas import BACKOFF_BASE, BACKOFF_MAX
+
+# statuses IA answers with when it is overloaded or rate limiting us
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    """Seconds to wait before retry number attempt (from 1), with jitter"""
+    if retry_after is not None:
+        # spread the clients told to come back at the same moment
+        return min(retry_after, BACKOFF_MAX) + random.uniform(0, 1)
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def retry_after_seconds(response: requests.Response | None) -> float | None:
+    """The Retry-After header of a response in seconds, if it has one"""
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_throttled(response: requests.Response) -> bool:
+    """Whether the response, or an attempt retried before it, was throttled"""
+    if response.status_code in THROTTLE_STATUSES:
+        return True
+    retries = getattr(response.raw, "retries", None)
+    history = retries.history if retries is not None else ()
+    return any(attempt.status in THROTTLE_STATUSES for attempt in history)
+
+
+class AdaptiveLimiter:
+    """AIMD limit on the requests in flight to an endpoint.
+
+    A round of successful responses raises the limit by one, up to
+    max_limit. A throttled or failed request halves it and pauses new
+    requests for the Retry-After delay, or a jittered backoff otherwise.
+    """
+
+    def __init__(self, initial: int, max_limit: int, min_limit: int = 1):
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self.successes = 0
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+        self.local = threading.local()
+
+    @contextmanager
+    def slot(self):
+        """Wait until a request may be sent, and hold a slot while it runs"""
+        if getattr(self.local, "held", False):
+            # redirects are sent from within the request that got them
+            yield
+            return
+        with self.condition:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < self.limit:
+                    break
+                self.condition.wait(timeout=wait if wait > 0 else None)
+            self.in_flight += 1
+        self.local.held = True
+        try:
+            yield
+        finally:
+            self.local.held = False
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+
+    def record_success(self):
+        with self.condition:
+            self.successes += 1
+            if self.successes >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self.successes = 0
+                self.condition.notify_all()
+
+    def record_throttle(self, retry_after: float | None = None):
+        with self.condition:
+            now = time.monotonic()
+            # requests failing together during one pause count as one signal
+            if now >= self.paused_until:
+                self.limit = max(self.min_limit, self.limit // 2)
+            self.successes = 0
+            self.paused_until = max(self.paused_until, now + backoff_delay(1, retry_after))
+
+    def state(self) -> dict:
+        with self.condition:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "paused_for": max(0.0, self.paused_until - time.monotonic()),
+            }
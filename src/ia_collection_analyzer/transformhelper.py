@@ -0,0 +1,213 @@
+import hashlib
+import json
+from typing import Callable, Hashable, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from ia_collection_analyzer.cachehelper import LRUCache
+from ia_collection_analyzer.constdatas import TRANSFORM_CACHE_BYTES
+from ia_collection_analyzer.mappinghelper import (
+    column_codes,
+    list_index_to_column,
+    map_codes,
+    map_column,
+    map_list_index,
+)
+from ia_collection_analyzer.pdhelper import parse_dates
+from ia_collection_analyzer.plothelper import ListIndex, factorize
+
+TRANSFORM_TYPES = [
+    "Value Mapping",
+    "Date Quarter",
+    "Date Week",
+    "String Prefix",
+    "Numeric Bins",
+]
+
+
+class TransformStep(NamedTuple):
+    """One transform of a column, params as picked in transform_data"""
+
+    transform_type: str
+    params: dict
+
+    def describe(self) -> str:
+        if self.transform_type == "String Prefix":
+            return f"String Prefix ({self.params['prefix_len']} characters)"
+        if self.transform_type == "Numeric Bins":
+            return f"Numeric Bins ({self.params['num_bins']} bins)"
+        if self.transform_type == "Value Mapping":
+            return f"Value Mapping ({len(self.params['mapping'])} values)"
+        return self.transform_type
+
+
+class TransformResult(NamedTuple):
+    """A transformed column, and its exploded index if it is a list column"""
+
+    values: pd.Series
+    list_index: ListIndex | None
+
+
+def result_bytes(result: TransformResult) -> int:
+    nbytes = int(result.values.memory_usage(index=True, deep=True))
+    if result.list_index is not None:
+        nbytes += result.list_index.rows.nbytes + result.list_index.codes.nbytes
+    return nbytes
+
+
+def chain_keys(base_key: Hashable, steps: list[TransformStep]) -> list[str]:
+    """Key of the column before the steps and after every step, each hashed
+    from the key of its input and the step.
+
+    Editing a step changes its key and the keys of all the steps after it,
+    the steps before it keep theirs.
+    """
+    key = hashlib.sha1(repr(base_key).encode()).hexdigest()
+    keys = [key]
+    for step in steps:
+        spec = json.dumps([step.transform_type, step.params], sort_keys=True, default=str)
+        key = hashlib.sha1(f"{key}\n{spec}".encode()).hexdigest()
+        keys.append(key)
+    return keys
+
+
+def date_quarter(values: pd.Series, params: dict) -> pd.Series:
+    return parse_dates(values).dt.quarter
+
+
+def date_week(values: pd.Series, params: dict) -> pd.Series:
+    return parse_dates(values).dt.isocalendar().week
+
+
+def string_prefix(values: pd.Series, params: dict) -> pd.Series:
+    return values.str[: params["prefix_len"]]
+
+
+# transforms of single values, applied to the distinct values only where possible
+ELEMENT_TRANSFORMS = {
+    "Date Quarter": date_quarter,
+    "Date Week": date_week,
+    "String Prefix": string_prefix,
+}
+
+
+def transform_categories(
+    categories: pd.Index, transform: Callable[[pd.Series], pd.Series]
+) -> tuple[np.ndarray, pd.Index]:
+    """New code of every category once transformed, and the transformed categories"""
+    transformed = transform(pd.Series(categories.to_numpy(dtype=object), dtype=object))
+    return factorize(transformed.astype(object).where(transformed.notna(), None))
+
+
+def apply_step(
+    previous: TransformResult,
+    step: TransformStep,
+    precomputed: pd.Series | None = None,
+) -> TransformResult:
+    """Apply one step to a column, precomputed is its result if already known"""
+    values, list_index = previous
+    if step.transform_type == "Value Mapping":
+        mapping = step.params["mapping"]
+        if list_index is not None:
+            mapped = map_list_index(list_index, mapping)
+            return TransformResult(list_index_to_column(mapped, values), mapped)
+        return TransformResult(map_column(values, mapping), None)
+
+    if step.transform_type == "Numeric Bins":
+        if list_index is not None:
+            raise ValueError("Numeric Bins can't be applied to a list column")
+        binned = pd.qcut(
+            values, step.params["num_bins"], labels=False, duplicates="drop"
+        )
+        return TransformResult(binned, None)
+
+    if step.transform_type not in ELEMENT_TRANSFORMS:
+        raise ValueError(f"Unknown transform {step.transform_type}")
+    if precomputed is not None:
+        return TransformResult(precomputed, None)
+
+    def transform(series):
+        return ELEMENT_TRANSFORMS[step.transform_type](series, step.params)
+
+    if list_index is not None:
+        # elements that become missing are dropped from their list
+        remap, categories = transform_categories(list_index.categories, transform)
+        codes = remap[list_index.codes]
+        keep = codes >= 0
+        index = ListIndex(list_index.rows[keep], codes[keep], categories, list_index.length)
+        return TransformResult(list_index_to_column(index, values), index)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, categories = column_codes(values)
+        remap, categories = transform_categories(categories, transform)
+        transformed = pd.Categorical.from_codes(
+            map_codes(codes, remap), dtype=pd.CategoricalDtype(categories)
+        )
+        return TransformResult(
+            pd.Series(transformed, index=values.index, name=values.name), None
+        )
+    return TransformResult(transform(values), None)
+
+
+class TransformPipeline:
+    """Ordered transform steps of every column, replayed on demand.
+
+    Every intermediate column is kept in a byte-bounded LRU cache under its
+    chain_keys key, so a replay only computes the steps after the last
+    cached one.
+    """
+
+    def __init__(self, max_bytes: int = TRANSFORM_CACHE_BYTES):
+        self.steps: dict[str, list[TransformStep]] = {}
+        self.cache = LRUCache(max_bytes, sizeof=result_bytes)
+
+    def set_step(self, column: str, step: TransformStep, position: int | None = None):
+        """Append a step to the column, or replace its step at position"""
+        steps = self.steps.setdefault(column, [])
+        if position is None or position >= len(steps):
+            steps.append(step)
+        else:
+            steps[position] = step
+
+    def remove_step(self, column: str, position: int):
+        steps = self.steps.get(column, [])
+        del steps[position]
+        if not steps:
+            del self.steps[column]
+
+    def key(self, column: str, base_key: Hashable) -> str:
+        """Key of the transformed column, changes whenever any of its steps does"""
+        return chain_keys(base_key, self.steps.get(column, []))[-1]
+
+    def evaluate(
+        self,
+        column: str,
+        base_key: Hashable,
+        base: Callable[[], TransformResult],
+        upto: int | None = None,
+        precomputed: Callable[[TransformStep], pd.Series | None] | None = None,
+    ) -> TransformResult:
+        """The column after its first upto steps (all by default).
+
+        base loads the untransformed column, base_key must change whenever
+        it does. precomputed may return the result of a first step that is
+        already known.
+        """
+        steps = self.steps.get(column, [])[:upto]
+        keys = chain_keys(base_key, steps)
+        done, result = 0, None
+        for position in range(len(steps), 0, -1):
+            result = self.cache.get(keys[position])
+            if result is not None:
+                done = position
+                break
+        if result is None:
+            result = base()
+
+        for position in range(done, len(steps)):
+            known = None
+            if position == 0 and precomputed is not None:
+                known = precomputed(steps[0])
+            result = apply_step(result, steps[position], known)
+            self.cache.put(keys[position + 1], result)
+        return result
@@ -0,0 +1,136 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+from ia_collection_analyzer.cachehelper import CacheStore, LRUCache
+from ia_collection_analyzer.plothelper import frame_bytes
+
+
+def make_table(rows):
+    return pa.table({"identifier": [f"item{i}" for i in range(rows)]})
+
+
+def test_cache_store_roundtrip(tmp_path):
+    store = CacheStore(tmp_path, max_bytes=10**9)
+    entry = store.put("collection_x", make_table(3), {"hwm": "2020-01-01"})
+    assert entry["count"] == 3
+    assert store.path(entry).exists()
+
+    reopened = CacheStore(tmp_path, max_bytes=10**9)
+    loaded = reopened.get("collection_x")
+    assert loaded["file"] == entry["file"]
+    assert loaded["meta"] == {"hwm": "2020-01-01"}
+    assert store.get("missing") is None
+
+
+def test_cache_store_content_addressed(tmp_path):
+    store = CacheStore(tmp_path, max_bytes=10**9)
+    first = store.put("a", make_table(3))
+    assert store.put("b", make_table(3))["file"] == first["file"]
+    replaced = store.put("a", make_table(4))
+    assert replaced["file"] != first["file"]
+    # still used by b
+    assert store.path(first).exists()
+    store.remove("b")
+    assert not store.path(first).exists()
+
+
+def test_cache_store_drops_corrupt_entries(tmp_path):
+    store = CacheStore(tmp_path, max_bytes=10**9)
+    entry = store.put("collection_x", make_table(3))
+    with open(store.path(entry), "r+b") as file:
+        file.truncate(entry["size"] // 2)
+    assert store.get("collection_x") is None
+    assert "collection_x" not in store.entries
+
+
+def test_cache_store_evicts_least_recently_used(tmp_path):
+    store = CacheStore(tmp_path, max_bytes=10**9)
+    size = store.put("a", make_table(100))["size"]
+    store.max_bytes = size * 2 + size // 2
+    store.put("b", make_table(101))
+    store.get("a")
+    store.put("c", make_table(102))
+    assert set(store.entries) == {"a", "c"}
+    assert len(list(tmp_path.glob("*.parquet"))) == 2
+
+
+def test_cache_store_reads_dont_write_the_manifest(tmp_path):
+    store = CacheStore(tmp_path, max_bytes=10**9)
+    store.put("a", make_table(3))
+    written = store.manifest_filename.read_bytes()
+    accessed = store.get("a")["last_access"]
+    assert store.manifest_filename.read_bytes() == written
+
+    # kept in memory until the next write
+    store.put("b", make_table(4))
+    assert CacheStore(tmp_path, max_bytes=10**9).entries["a"]["last_access"] == accessed
+
+
+def test_cache_store_sweeps_orphans(tmp_path):
+    (tmp_path / "leftover.parquet").write_bytes(b"partial")
+    (tmp_path / ".crashed.parquet.tmp").write_bytes(b"partial")
+    CacheStore(tmp_path, max_bytes=10**9)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_cache_store_sweeps_legacy_files_and_old_checkpoints(tmp_path):
+    store = CacheStore(tmp_path, max_bytes=10**9)
+    store.put("a", make_table(3))
+    (tmp_path / "0a1b.json").write_text("[]")
+    (tmp_path / "0a1b.meta.json").write_text("{}")
+    for name in ("0a1b.fetch.partial", "0a1b.refresh.partial"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "manifest.json").write_text("{}")
+    os.utime(tmp_path / "0a1b.fetch.partial", (0, 0))
+
+    CacheStore(tmp_path, max_bytes=10**9)
+    assert {path.name for path in tmp_path.iterdir()} == {
+        store.entries["a"]["file"],
+        "0a1b.refresh.partial",
+        "manifest.json",
+    }
+
+
+def test_lru_cache_evicts_least_recently_used():
+    frame = pd.DataFrame({"a": range(100)})
+    cache = LRUCache(frame_bytes(frame) * 2, frame_bytes)
+    cache.put("first", frame)
+    cache.put("second", frame.copy())
+    assert cache.get("first") is frame  # now most recently used
+    cache.put("third", frame.copy())
+    assert cache.get("second") is None
+    assert cache.get("first") is frame
+    assert cache.size <= cache.max_bytes
+
+
+def test_lru_cache_get_or_compute():
+    cache = LRUCache(1024 * 1024, frame_bytes)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return pd.DataFrame({"a": [1]})
+
+    first = cache.get_or_compute(("v1", "x", "y"), compute)
+    assert cache.get_or_compute(("v1", "x", "y"), compute) is first
+    cache.get_or_compute(("v2", "x", "y"), compute)
+    assert len(calls) == 2
+
+
+def test_lru_cache_sizes():
+    cache = LRUCache(100)
+    cache.put("a", "small", nbytes=60)
+    cache.put("b", "too large", nbytes=500)
+    assert cache.get("b") is None and cache.get("a") == "small"
+    cache.put("a", "replaced", nbytes=30)
+    assert cache.size == 30
+
+    # the newest value stays even alone over budget
+    newest = LRUCache(100, keep_newest=True)
+    newest.put("a", "small", nbytes=60)
+    newest.put("b", "too large", nbytes=500)
+    assert list(newest.entries) == ["b"]
+    newest.discard("b")
+    assert newest.size == 0
@@ -0,0 +1,62 @@
+import pandas as pd
+from ia_collection_analyzer.datasethelper import DatasetRegistry, with_field
+
+
+def test_dataset_registry_evicts_least_recently_used():
+    registry = DatasetRegistry(max_bytes=200)
+    registry.put(("a", 1), {"name": "a"}, 100)
+    registry.put(("b", 1), {"name": "b"}, 100)
+    assert registry.get(("a", 1)) == {"name": "a"}  # now most recently used
+    registry.put(("c", 1), {"name": "c"}, 100)
+    assert registry.get(("b", 1)) is None
+    assert registry.get(("a", 1)) is not None
+    assert registry.size == 200
+
+
+def test_dataset_registry_keeps_newest():
+    registry = DatasetRegistry(max_bytes=100)
+    registry.put(("a", 1), {}, 50)
+    registry.put(("b", 1), {}, 500)
+    assert registry.get(("a", 1)) is None
+    assert registry.get(("b", 1)) == {}
+
+
+def test_dataset_registry_put_latest():
+    registry = DatasetRegistry(max_bytes=1000)
+    registry.put(("a", 1), {}, 10)
+    registry.put(("b", 1), {}, 10)
+    registry.put_latest(("a", 2), {}, 10)
+    assert list(registry.entries) == [("b", 1), ("a", 2)]
+    assert registry.size == 20
+
+
+def test_dataset_registry_build_once():
+    registry = DatasetRegistry(max_bytes=1000)
+    dataset = {}
+    builds = []
+
+    def build():
+        builds.append(1)
+        return "index"
+
+    for _ in range(2):
+        index = registry.build_once(dataset, "list_indexes", "language", build)
+    assert index == "index"
+    assert dataset == {"list_indexes": {"language": "index"}}
+    assert len(builds) == 1
+
+
+def test_with_field():
+    items_pd = pd.DataFrame({"identifier": ["a", "b", "c"], "title": ["x", "y", "z"]})
+    items_pd.attrs["column_profile"] = {"identifier": "scalar", "title": "scalar"}
+    dataset = {"items_pd": items_pd, "list_indexes": {}}
+    # a field with both lists and scalars, and an item fetched twice
+    values = pd.DataFrame(
+        {"identifier": ["a", "b", "b"], "subject": [["en", "fr"], "de", "de"]}
+    )
+    extended = with_field(dataset, "subject", values)
+    assert extended["items_pd"]["subject"].tolist()[:2] == [["en", "fr"], ["de"]]
+    assert extended["items_pd"].attrs["column_profile"]["subject"] == "list"
+    assert extended["list_indexes"]["subject"].categories.tolist() == ["de", "en", "fr"]
+    # the shared dataset is left as it is
+    assert "subject" not in items_pd.columns and dataset["list_indexes"] == {}
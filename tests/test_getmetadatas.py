@@ -0,0 +1,30 @@
+import threading
+
+from ia_collection_analyzer import getmetadatas
+from ia_collection_analyzer.jobhelper import JobManager
+
+
+def test_fetches_and_resyncs_of_a_collection_dont_overlap(monkeypatch):
+    monkeypatch.setattr(getmetadatas, "job_manager", JobManager(max_workers=2))
+    release = threading.Event()
+
+    def build(job, collection_id, full_resync=False):
+        release.wait(5)
+        return (collection_id, "resync" if full_resync else "fetch")
+
+    monkeypatch.setattr(getmetadatas, "build_dataset", build)
+
+    fetch = getmetadatas.start_fetch("x")
+    assert getmetadatas.start_fetch("x") is fetch
+    # a resync doesn't silently join the fetch, nor runs next to it
+    assert getmetadatas.start_fetch("x", full_resync=True) is None
+    release.set()
+    assert fetch.wait(5) == ("x", "fetch")
+
+    release.clear()
+    resync = getmetadatas.start_fetch("x", full_resync=True)
+    assert resync.key == ("x", True)
+    # a fetch gets the new items from the resync too
+    assert getmetadatas.start_fetch("x") is resync
+    release.set()
+    assert resync.wait(5) == ("x", "resync")
@@ -1,9 +1,29 @@
+import json
+import re
+from urllib.parse import parse_qsl, urlsplit
+
 import pytest
+import pandas as pd
+import pyarrow as pa
+import requests
+import ia_collection_analyzer.iahelper as iahelper
+from ia_collection_analyzer.cachehelper import CacheStore
+from ia_collection_analyzer.constdatas import REQUIRED_METADATA
 from ia_collection_analyzer.iahelper import (
+    Checkpoint,
+    fetch_search,
     get_collection_items,
     get_item_metadata,
     get_collection_items_metadata,
+    high_water_mark,
+    merge_collections,
+    plan_shards,
+    sample_fields,
+    frame_to_table,
+    read_collection_cache,
+    write_collection_cache,
 )
+from ia_collection_analyzer.pdhelper import clean_collection
 
 
 get_collection_items_tests = [
@@ -41,3 +61,227 @@ def test_get_collection_items_metadata():
     for item_metadata in items_metadata:
         assert isinstance(item_metadata, dict)
         assert collection_id in item_metadata["collection"]
+
+
+def test_high_water_mark():
+    table = pa.table(
+        {
+            "identifier": ["a", "b", "c"],
+            "addeddate": ["2012-08-06T12:00:00Z", "2014-01-02T00:00:00Z", None],
+        }
+    )
+    assert high_water_mark(table) == "2014-01-02T00:00:00Z"
+    assert high_water_mark(pa.table({"identifier": ["c"]})) is None
+
+
+def test_merge_collections():
+    table = pa.table({"identifier": ["b", "a"], "title": ["old", "old"]})
+    new_table = pa.table({"identifier": ["c", "b"], "title": ["new", "new"]})
+    merged = merge_collections(table, new_table)
+    assert merged["identifier"].to_pylist() == ["c", "b", "a"]
+    assert merged["title"].to_pylist() == ["new", "new", "old"]
+
+
+def test_collection_cache_roundtrip(tmp_path):
+    frame = pd.DataFrame(
+        [
+            {"identifier": "a", "mediatype": "texts", "collection": ["x", "y"], "downloads": 3},
+            {"identifier": "b", "mediatype": "web", "collection": "x", "subject": 12},
+            {"identifier": "c", "mediatype": "texts", "collection": ["y"], "subject": "wiki"},
+        ]
+    )
+    cache_filename = tmp_path / "collection.parquet"
+    write_collection_cache(cache_filename, frame_to_table(frame))
+
+    loaded = read_collection_cache(cache_filename)
+    assert isinstance(loaded["mediatype"].dtype, pd.CategoricalDtype)
+    assert loaded["collection"].tolist() == [["x", "y"], ["x"], ["y"]]
+    assert loaded["subject"].tolist()[1:] == ["12", "wiki"]
+
+    projected = read_collection_cache(cache_filename, ["identifier", "downloads", "missing"])
+    assert projected.columns.tolist() == ["identifier", "downloads"]
+
+
+@pytest.mark.parametrize(
+    "first_date, last_date, num_found, shard_size, expected",
+    [
+        (
+            "2020-01-01T00:00:00Z",
+            "2020-01-31T00:00:00Z",
+            30000,
+            10000,
+            [("2020-01-21", "2020-01-31"), ("2020-01-11", "2020-01-21"), ("2020-01-01", "2020-01-11")],
+        ),
+        # never more shards than days in the range
+        ("2020-01-01", "2020-01-03", 100000, 10000, [("2020-01-02", "2020-01-03"), ("2020-01-01", "2020-01-02")]),
+        ("2020-01-01", "2020-01-01", 100000, 10000, [("2020-01-01", "2020-01-01")]),
+    ],
+)
+def test_plan_shards(first_date, last_date, num_found, shard_size, expected):
+    assert plan_shards(first_date, last_date, num_found, shard_size) == expected
+
+
+def test_sample_fields(monkeypatch):
+    sample = [
+        {"identifier": "a", "addeddate": "2020", "mediatype": "texts", "title": "x", "rare": 1},
+        {"identifier": "b", "addeddate": "2020", "mediatype": "texts", "title": "y"},
+        {"identifier": "c", "addeddate": "2020", "mediatype": "texts"},
+    ]
+    monkeypatch.setattr(iahelper.ia, "Search", lambda *args, **kwargs: iter(sample))
+    fields, available = sample_fields("collection:x", sample_size=3, min_fill=0.5)
+    assert fields == ["addeddate", "identifier", "mediatype", "title"]
+    assert available == ["addeddate", "identifier", "mediatype", "rare", "title"]
+
+
+class FakeSearch:
+    """Stands in for ia.Search, serving items newest first and failing once"""
+
+    items = [
+        {"identifier": f"item{i}", "addeddate": f"2020-01-{10 - i:02d}T00:00:00Z"}
+        for i in range(6)
+    ]
+    fail_after = None
+
+    def __init__(self, session, query, **kwargs):
+        self.query = query
+        self.results = self.items
+        if "TO " in query:
+            last = query.split("TO ")[1].rstrip("]").replace("\\", "")
+            self.results = [item for item in self.items if item["addeddate"] <= last]
+        self.num_found = len(self.results)
+
+    def __iter__(self):
+        for i, item in enumerate(self.results):
+            if FakeSearch.fail_after is not None and i == FakeSearch.fail_after:
+                FakeSearch.fail_after = None
+                raise requests.ConnectionError("connection reset")
+            yield item
+
+
+def test_fetch_search_resumes_from_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(iahelper.ia, "Search", FakeSearch)
+    monkeypatch.setattr(iahelper, "CHECKPOINT_SIZE", 2)
+    checkpoint = Checkpoint(tmp_path / "collection.parquet")
+
+    FakeSearch.fail_after = 3
+    assert fetch_search("collection:x", checkpoint, retries=0) is None
+    assert checkpoint.state("collection:x")["count"] == 3
+
+    progress = []
+    resumed = Checkpoint(tmp_path / "collection.parquet")
+    assert fetch_search(
+        "collection:x", resumed, lambda add, total: progress.append((add, total))
+    ) == 6
+    assert progress[:2] == [(0, 6), (3, 6)]
+    # the last saved item is searched again, but neither saved nor counted twice
+    assert sum(add for add, total in progress) == 6
+    assert {total for add, total in progress} == {6}
+    assert resumed.state("collection:x")["count"] == 6
+    assert resumed.state("collection:x")["done"]
+    assert resumed.load_table()["identifier"].to_pylist() == [f"item{i}" for i in range(6)]
+
+
+def test_fetch_search_retries_failed_pages(tmp_path, monkeypatch):
+    monkeypatch.setattr(iahelper.ia, "Search", FakeSearch)
+    monkeypatch.setattr(iahelper, "CHECKPOINT_SIZE", 2)
+    monkeypatch.setattr(iahelper, "backoff_delay", lambda attempt, retry_after: 0)
+    checkpoint = Checkpoint(tmp_path / "collection.parquet")
+
+    FakeSearch.fail_after = 3
+    assert fetch_search("collection:x", checkpoint)
+    assert checkpoint.state("collection:x")["done"]
+    assert checkpoint.load_table()["identifier"].to_pylist() == [f"item{i}" for i in range(6)]
+
+
+class FakeScrapeAdapter(requests.adapters.BaseAdapter):
+    """Answers scrape API requests from items, one page per query"""
+
+    def __init__(self, items):
+        super().__init__()
+        self.items = items
+
+    def send(self, request, **kwargs):
+        params = dict(parse_qsl(urlsplit(request.url).query))
+        results = self.items
+        for start, end in re.findall(r"addeddate:\[(\S+) TO (\S+)\]", params["q"]):
+            start, end = start.replace("\\", ""), end.replace("\\", "")
+            results = [
+                item
+                for item in results
+                if (start == "*" or item["addeddate"][: len(start)] >= start)
+                and item["addeddate"][: len(end)] <= end
+            ]
+        results = sorted(
+            results,
+            key=lambda item: item["addeddate"],
+            reverse=params.get("sorts", "addeddate desc").endswith("desc"),
+        )
+        body = {"total": len(results)}
+        if "total_only" not in params:
+            body.update(items=results[: int(params["count"])], count=len(results))
+        response = requests.Response()
+        response.status_code = 200
+        response.request = request
+        response.url = request.url
+        response._content = json.dumps(body).encode()
+        return response
+
+    def close(self):
+        pass
+
+
+def test_sharded_fetch_shares_one_session(tmp_path, monkeypatch):
+    items = [
+        {"identifier": f"item{i}", "addeddate": f"2020-{1 + i // 28:02d}-{1 + i % 28:02d}T00:00:00Z"}
+        for i in range(60)
+    ]
+    session = iahelper.ThrottledSession()
+    session.host, session.protocol = "fake", "http:"
+    session.mount("http://fake", FakeScrapeAdapter(items))
+    adapters = dict(session.adapters)
+    monkeypatch.setattr(iahelper, "ia_session", session)
+    monkeypatch.setattr(iahelper, "SHARD_SIZE", 10)
+    monkeypatch.setattr(
+        iahelper,
+        "plan_shards",
+        lambda first, last, num_found: plan_shards(first, last, num_found, shard_size=10),
+    )
+
+    checkpoint = Checkpoint(tmp_path / "collection.parquet")
+    assert iahelper.fetch_search_sharded("collection:x", checkpoint, workers=4)
+    assert len(checkpoint.manifest["shards"]) == 6
+    assert sorted(checkpoint.load_table()["identifier"].to_pylist()) == sorted(
+        item["identifier"] for item in items
+    )
+    # searches don't re-mount adapters, their connection pools are kept
+    assert session.adapters == adapters
+
+
+def test_backfilled_fields_survive_reloads(tmp_path, monkeypatch):
+    monkeypatch.setattr(iahelper, "collection_store", CacheStore(tmp_path, max_bytes=10**9))
+    monkeypatch.setattr(iahelper, "CACHE_DIR", tmp_path)
+    items = pd.DataFrame(
+        {
+            "identifier": [f"item{i}" for i in range(10)],
+            "mediatype": "texts",
+            "addeddate": [f"2020-01-{i + 1:02d}" for i in range(10)],
+        }
+    )
+    table = frame_to_table(items)
+    meta = {"fill": {col: 10 for col in table.column_names}, "fields": list(REQUIRED_METADATA)}
+    iahelper.collection_store.put(iahelper.get_cache_key("x"), table, meta)
+
+    def fetch(query, checkpoint, progress_hook, workers, fields):
+        checkpoint.save(query, [{"identifier": "item0", "rare": "yes"}], done=True)
+        return 1
+
+    monkeypatch.setattr(iahelper, "fetch_search_sharded", fetch)
+    assert iahelper.backfill_field("x", "rare")["rare"].notna().sum() == 1
+    assert iahelper.get_backfilled_fields("x") == ["rare"]
+
+    # a 10% filled column is neither skipped on load nor dropped while cleaning
+    frame = iahelper.get_collection_frame("x", min_fill=0.8)
+    assert "rare" in frame.columns
+    cleaned, _ = clean_collection(frame, keep=iahelper.get_backfilled_fields("x"))
+    assert "rare" in cleaned.columns
+    assert "rare" not in clean_collection(frame)[0].columns
@@ -0,0 +1,81 @@
+import pandas as pd
+import requests
+import ia_collection_analyzer.itemhelper as itemhelper
+from ia_collection_analyzer.itemhelper import (
+    ITEM_FIELDS,
+    get_items_metadata,
+    join_items_metadata,
+    summarize_item,
+)
+
+
+def item_metadata(identifier):
+    return {
+        "metadata": {"identifier": identifier},
+        "files": [
+            {"name": "video.mp4", "source": "original", "format": "MPEG4", "size": "300"},
+            {"name": "video.ogv", "source": "derivative", "format": "Ogg Video", "size": "200"},
+            {"name": "meta.xml", "source": "original", "format": "Metadata"},
+        ],
+    }
+
+
+def test_summarize_item():
+    assert summarize_item(item_metadata("a")) == {
+        "files_count": 3,
+        "files_size": 500,
+        "original_files": 2,
+        "original_size": 300,
+        "largest_file": 300,
+        "formats": ["MPEG4", "Metadata", "Ogg Video"],
+    }
+    assert summarize_item({})["files_count"] == 0
+
+
+def test_get_items_metadata_caches_items(tmp_path, monkeypatch):
+    monkeypatch.setattr(itemhelper, "ITEM_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(itemhelper, "backoff_delay", lambda *args: 0)
+    fetched = []
+
+    def get_metadata(identifier):
+        fetched.append(identifier)
+        if identifier == "broken":
+            raise requests.ConnectionError("unreachable")
+        return item_metadata(identifier)
+
+    monkeypatch.setattr(itemhelper.ia_session, "get_metadata", get_metadata)
+    progress = []
+    items = get_items_metadata(
+        ["a", "b", "broken", "a"], lambda add, total: progress.append(add), workers=2
+    )
+    assert items["identifier"].tolist() == ["a", "b"]
+    assert list(items.columns) == ["identifier"] + ITEM_FIELDS
+    assert sum(progress) == 3
+    # the failed item was retried, the others fetched once
+    assert fetched.count("broken") == itemhelper.ITEM_RETRIES + 1
+    assert sorted(set(fetched)) == ["a", "b", "broken"]
+
+    fetched.clear()
+    items = get_items_metadata(["a", "b", "c"])
+    assert fetched == ["c"]
+    assert items["files_count"].tolist() == [3, 3, 3]
+
+    # expired entries are fetched again
+    fetched.clear()
+    get_items_metadata(["a"], ttl=-1)
+    assert fetched == ["a"]
+
+
+def test_join_items_metadata():
+    frame = pd.DataFrame({"identifier": ["a", "b", "c"], "downloads": [1, 2, 3]}, index=[5, 7, 9])
+    frame.attrs["column_profile"] = {"identifier": "scalar", "downloads": "scalar"}
+    items = pd.DataFrame(
+        [{"identifier": "c", **summarize_item(item_metadata("c"))}],
+        columns=["identifier"] + ITEM_FIELDS,
+    )
+    joined = join_items_metadata(frame, items)
+    assert joined.index.tolist() == [5, 7, 9]
+    assert joined["files_count"].isna().tolist() == [True, True, False]
+    assert joined.loc[9, "formats"] == ["MPEG4", "Metadata", "Ogg Video"]
+    assert joined.attrs["column_profile"]["formats"] == "list"
+    assert "files_count" not in frame.columns
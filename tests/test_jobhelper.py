@@ -0,0 +1,50 @@
+import threading
+
+from ia_collection_analyzer.jobhelper import JobManager
+
+
+def test_job_manager_shares_running_job():
+    manager = JobManager(max_workers=2)
+    release = threading.Event()
+    calls = []
+
+    def work(job, value):
+        calls.append(value)
+        job.progress_hook(5, 10)
+        release.wait(5)
+        return value * 2
+
+    first = manager.submit("bilibili_videos", work, 21)
+    second = manager.submit("bilibili_videos", work, 99)
+    assert second is first
+    release.set()
+    assert first.wait(5) == 42
+    assert calls == [21]
+
+    status = manager.get("bilibili_videos").status()
+    assert status["state"] == "done"
+    assert (status["processed"], status["total"]) == (5, 10)
+    # finished jobs are replaced by a new submission
+    assert manager.submit("bilibili_videos", work, 1) is not first
+
+
+def test_job_manager_records_failure():
+    manager = JobManager(max_workers=1)
+
+    def work(job):
+        raise ValueError("no such collection")
+
+    job = manager.submit("missing", work)
+    assert job.wait(5) is None
+    assert job.status()["state"] == "failed"
+    assert "no such collection" in job.status()["error"]
+    assert manager.get("unknown") is None
+
+
+def test_job_manager_discard():
+    manager = JobManager(1, "test-job")
+    job = manager.submit("a", lambda job: 1)
+    assert job.wait(5) == 1
+    manager.discard("a")
+    assert manager.get("a") is None
+    manager.discard("a")
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from ia_collection_analyzer.mappinghelper import (
+    code_value_counts,
+    column_codes,
+    compile_mapping,
+    list_index_to_column,
+    map_column,
+    map_list_index,
+    mapping_preview,
+)
+from ia_collection_analyzer.plothelper import build_list_index, subset_list_index
+
+MAPPING_TABLE = [
+    {"target": "Other", "sources": ["fr", "it"]},
+    {"target": "English", "sources": ["en"]},
+]
+
+
+def test_compile_mapping():
+    table = [{"target": "Early", "sources": [2020, "2021"]}]
+    assert compile_mapping(table) == {"2020": "Early", "2021": "Early"}
+
+
+def test_map_column():
+    series = pd.Series(["en", "fr", None, "de", "it"], name="language")
+    mapped = map_column(series, compile_mapping(MAPPING_TABLE))
+    assert mapped.tolist()[:2] == ["English", "Other"]
+    assert pd.isna(mapped.iloc[2])
+    assert mapped.tolist()[3:] == ["de", "Other"]
+    assert mapped.name == "language"
+
+    # categoricals map their categories, numbers match by their str()
+    years = pd.Series(pd.Categorical([2020, 2021, 2020]))
+    assert map_column(years, {"2020": "early"}).tolist() == ["early", 2021, "early"]
+
+
+def test_map_list_column():
+    series = pd.Series([["en", "fr"], None, "it", [], ["de"]], index=[10, 11, 12, 13, 14])
+    index = map_list_index(build_list_index(series), compile_mapping(MAPPING_TABLE))
+    assert sorted(index.categories) == ["English", "Other", "de"]
+
+    column = list_index_to_column(index, series)
+    assert column.tolist() == [["English", "Other"], None, ["Other"], [], ["de"]]
+    assert column.index.tolist() == [10, 11, 12, 13, 14]
+
+    counts = code_value_counts(index.codes, index.categories)
+    assert counts.to_dict() == {"Other": 2, "English": 1, "de": 1}
+
+
+def test_subset_list_index():
+    index = build_list_index(pd.Series([["en", "fr"], ["de"], None, ["en"]]))
+    subset = subset_list_index(index, np.array([3, 0]))
+    assert subset.rows.tolist() == [0, 1, 1]
+    assert subset.categories[subset.codes].tolist() == ["en", "en", "fr"]
+    assert subset.length == 2
+
+
+def test_mapping_preview():
+    series = pd.Series(["de"] * 50 + ["en"] * 100 + ["fr", "it", "es"])
+    mapped = map_column(series, compile_mapping(MAPPING_TABLE))
+    codes, categories = column_codes(series)
+    preview = mapping_preview(series, mapped, codes, categories, MAPPING_TABLE)
+    # one row per mapped value, and a single unmapped one
+    assert preview["Original"].tolist() == ["fr", "it", "en", "de"]
+    assert preview["Transformed"].tolist() == ["Other", "Other", "English", "de"]
+
+    lists = pd.Series([["de"], ["de", "en"], ["it"]])
+    index = build_list_index(lists)
+    mapped_lists = list_index_to_column(
+        map_list_index(index, compile_mapping(MAPPING_TABLE)), lists
+    )
+    preview = mapping_preview(
+        lists, mapped_lists, index.codes, index.categories, MAPPING_TABLE, index.rows
+    )
+    assert preview.index.tolist() == [2, 1, 0]
@@ -1,6 +1,16 @@
 import pytest
 import pandas as pd
-from ia_collection_analyzer.pdhelper import normalize_list_columns
+import pyarrow as pa
+from ia_collection_analyzer.pdhelper import (
+    add_calendar_columns,
+    clean_collection,
+    parse_dates,
+    concat_tables,
+    drop_duplicate_rows,
+    normalize_list_columns,
+    optimize_dtypes,
+    profile_columns,
+)
 
 @pytest.mark.parametrize(
     "input_df,expected_df",
@@ -60,4 +70,123 @@ from ia_collection_analyzer.pdhelper import normalize_list_columns
 )
 def test_normalize_list_columns(input_df, expected_df):
     result = normalize_list_columns(input_df)
-    pd.testing.assert_frame_equal(result, expected_df)
\ No newline at end of file
+    pd.testing.assert_frame_equal(result, expected_df)
+
+
+def test_normalize_list_columns_late_lists():
+    # the first list only shows up after thousands of scalars
+    df = pd.DataFrame({"subject": ["a"] * 5000 + [["b", "c"]]})
+    result = normalize_list_columns(df)
+    assert result["subject"].iloc[0] == ["a"]
+    assert result["subject"].iloc[-1] == ["b", "c"]
+    assert result.attrs["column_profile"] == {"subject": "list"}
+
+
+def test_profile_columns():
+    df = pd.DataFrame(
+        {
+            "scalar": ["a", 1, None],
+            "list": [["a"], None, ["b", "c"]],
+            "mixed": ["a", ["b"], None],
+            "empty": [None, None, None],
+            "numeric": [1.0, 2.0, None],
+        }
+    )
+    assert profile_columns(df) == {
+        "scalar": "scalar",
+        "list": "list",
+        "mixed": "mixed",
+        "empty": "empty",
+        "numeric": "scalar",
+    }
+
+
+def test_concat_tables():
+    # a field that is scalar in one chunk and a list in the next
+    tables = [
+        pa.table({"identifier": ["a"], "subject": ["x"]}),
+        pa.table({"identifier": ["b"], "subject": [["y", "z"]]}),
+        pa.table({"identifier": ["c"]}),
+    ]
+    result = concat_tables(tables)
+    assert result["subject"].to_pylist() == [["x"], ["y", "z"], None]
+
+
+def test_drop_duplicate_rows():
+    table = pa.table({"identifier": ["a", "b", "a"], "value": [1, 2, 3]})
+    assert drop_duplicate_rows(table)["value"].to_pylist() == [1, 2]
+
+
+def test_optimize_dtypes():
+    df = pd.DataFrame(
+        {
+            "mediatype": ["texts", "texts", "web", "texts"],
+            "identifier": ["a", "b", "c", "d"],
+            "downloads": [1, 20, 300, 4],
+            "addeddate": ["2012-08-06 12:00:00", "2012-08-07T00:00:00Z", None, "2013-01-01"],
+            "subject": [["a"], ["b"], ["a"], ["a"]],
+        }
+    )
+    result, saved = optimize_dtypes(df)
+    assert isinstance(result["mediatype"].dtype, pd.CategoricalDtype)
+    assert result["identifier"].dtype == object
+    assert result["downloads"].dtype == "int16"
+    assert result["addeddate"].tolist()[:2] == [
+        pd.Timestamp("2012-08-06 12:00:00"),
+        pd.Timestamp("2012-08-07"),
+    ]
+    assert result["subject"].dtype == object
+    assert saved > 0
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("2012", pd.Timestamp("2012-01-01")),
+        ("2012-08", pd.Timestamp("2012-08-01")),
+        ("2012-08-06", pd.Timestamp("2012-08-06")),
+        ("2012-08-06T12:00:00Z", pd.Timestamp("2012-08-06 12:00:00")),
+        ("2012-08-06 01:02:03", pd.Timestamp("2012-08-06 01:02:03")),
+        ("c. 1900", pd.NaT),
+        (None, pd.NaT),
+    ],
+)
+def test_parse_dates(value, expected):
+    series = pd.Series(["2000", value, "2000"])
+    result = parse_dates(series)
+    assert result.iloc[1] is expected or result.iloc[1] == expected
+    assert result.iloc[0] == pd.Timestamp("2000-01-01")
+
+
+def test_parse_dates_categorical():
+    series = pd.Series(["2012", "2013-02", "2012"], dtype="category")
+    assert parse_dates(series).dt.year.tolist() == [2012, 2013, 2012]
+
+
+def test_add_calendar_columns():
+    df = pd.DataFrame({"addeddate": ["2012-08-06T12:00:00Z", None]})
+    result = add_calendar_columns(df, "addeddate", "added")
+    assert result["addedyear"].tolist()[0] == 2012
+    assert result["addedquarter"].tolist()[0] == 3
+    assert result["addedweek"].tolist()[0] == 32
+    assert result["addedyear"].dtype == "Int16"
+    assert result["addedmonth"].isna().tolist() == [False, True]
+
+
+def test_clean_collection():
+    df = pd.DataFrame(
+        {
+            "identifier": ["a", "b", "c"],
+            "mediatype": ["movies", "collection", "texts"],
+            "addeddate": ["2012-08-06", "2013-01-01", "2014-05-05"],
+            "language": [["en", "de"], "en", "fr"],
+            "sparse": [None, None, "x"],
+        }
+    )
+    result, info = clean_collection(df)
+    assert result["identifier"].tolist() == ["a", "c"]
+    assert "sparse" not in result.columns
+    assert result["language"].tolist() == [["en", "de"], ["fr"]]
+    assert result["addedyear"].tolist() == [2012, 2014]
+    assert info["calendar_columns"] == {"": "addeddate", "added": "addeddate"}
+    assert result["year"].tolist() == [2012, 2014]
@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+
+from ia_collection_analyzer.perfhelper import perf_log, stage, trace
+
+
+def test_stage_records_shape_and_trace():
+    perf_log.clear()
+    with trace("bilibili_videos"):
+        with stage("dropna cleaning", pd.DataFrame({"a": [1, 2], "b": [3, 4]})) as current:
+            current.record(kind="test")
+    with stage("search paging", trace="other") as current:
+        current.record(rows=7)
+
+    (record,) = perf_log.records("bilibili_videos")
+    assert record["stage"] == "dropna cleaning"
+    assert (record["rows"], record["cols"]) == (2, 2)
+    assert record["kind"] == "test"
+    assert record["seconds"] >= 0
+    assert perf_log.records("other")[0]["rows"] == 7
+    assert len(perf_log.records()) == 2
+
+
+def test_stage_marks_failures():
+    perf_log.clear()
+    with pytest.raises(ValueError):
+        with stage("transform"):
+            raise ValueError("bad input")
+    assert perf_log.records()[0]["failed"] is True
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from ia_collection_analyzer.plothelper import (
+    numeric_metrics,
+    build_list_index,
+    build_list_indexes,
+    category_crosstab,
+)
+
+
+def test_build_list_index():
+    index = build_list_index(pd.Series([["en", "de"], None, "fr", [], ["en"]]))
+    assert index.rows.tolist() == [0, 0, 2, 4]
+    assert index.categories.tolist() == ["de", "en", "fr"]
+    assert index.codes.tolist() == [1, 0, 2, 1]
+    assert index.length == 5
+
+
+def test_build_list_indexes():
+    df = pd.DataFrame({"language": [["en"], ["de"]], "title": ["a", "b"]})
+    indexes = build_list_indexes(df, {"language": "list", "title": "scalar"})
+    assert list(indexes) == ["language"]
+
+
+def test_category_crosstab_matches_pandas():
+    df = pd.DataFrame(
+        {
+            "year": [2020, 2020, 2021, 2021, 2022],
+            "language": [["en", "de"], "en", ["fr"], None, ["de"]],
+        },
+        index=[10, 11, 12, 13, 14],
+    )
+    exploded = df.explode("language")
+    expected = pd.crosstab(exploded["year"], exploded["language"])
+    result = category_crosstab(df["year"], build_list_index(df["language"]))
+    pd.testing.assert_frame_equal(result, expected, check_names=False)
+
+    expected = pd.crosstab(exploded["year"], exploded["language"], normalize="index") * 100
+    result = category_crosstab(df["year"], build_list_index(df["language"]), normalize=True)
+    pd.testing.assert_frame_equal(result, expected, check_names=False)
+
+
+def test_category_crosstab_subset():
+    # only rows 0 and 2 of the indexed frame are plotted
+    index = build_list_index(pd.Series([["a", "b"], ["a"], ["c"]]))
+    result = category_crosstab(pd.Series(["x", "y"], name="x"), index, np.array([0, 2]))
+    assert result.to_dict() == {"a": {"x": 1, "y": 0}, "b": {"x": 1, "y": 0}, "c": {"x": 0, "y": 1}}
+
+
+def test_numeric_metrics():
+    x = pd.Series([2020, 2020, 2021], name="year")
+    y = pd.Series([1, 3, 5], name="downloads")
+    metrics = numeric_metrics(x, y)
+    assert metrics.columns.tolist() == ["year", "Count", "Sum", "Mean", "Median", "Min", "Max"]
+    assert metrics["Mean"].tolist() == [2.0, 5.0]
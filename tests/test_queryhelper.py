@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from ia_collection_analyzer import iahelper
+from ia_collection_analyzer.cachehelper import CacheStore
+from ia_collection_analyzer.constdatas import REQUIRED_METADATA
+from ia_collection_analyzer.pdhelper import clean_collection, frame_to_table
+from ia_collection_analyzer.queryhelper import (
+    cleaned_fields,
+    open_cache_file,
+    open_collection,
+    plan_query,
+    query_crosstab,
+    query_metrics,
+)
+from ia_collection_analyzer.transformhelper import TransformStep
+
+CALENDAR_COLUMNS = {"": "addeddate", "added": "addeddate"}
+COLUMNS = ["language", "identifier", "mediatype", "addeddate"]
+
+
+def cached_collection(tmp_path):
+    frame = pd.DataFrame(
+        {
+            "identifier": [f"item{i}" for i in range(6)],
+            "mediatype": ["movies", "movies", "texts", "collection", "texts", "movies"],
+            "addeddate": [
+                "2020-01-05T10:00:00Z",
+                "2020-06-01T10:00:00Z",
+                "2021-03-01 10:00:00",
+                "2021-04-01T10:00:00Z",
+                "2021-05-01T10:00:00Z",
+                "2022-01-01T10:00:00Z",
+            ],
+            "language": [["en", "de"], "en", "fr", "en", None, ["de"]],
+            "downloads": [10, 20, 30, 40, 50, 60],
+        }
+    )
+    filename = tmp_path / "collection.parquet"
+    table = frame_to_table(frame)
+    # several row groups, each with a dictionary of its own
+    table = table.set_column(1, "mediatype", table.column("mediatype").dictionary_encode())
+    pq.write_table(table, filename, row_group_size=2)
+    return open_cache_file(filename)
+
+
+def test_query_crosstab(tmp_path):
+    dataset = cached_collection(tmp_path)
+    assert not pa.types.is_dictionary(dataset.schema.field("mediatype").type)
+
+    query = plan_query(dataset, COLUMNS, "addedyear", "language", CALENDAR_COLUMNS)
+    assert "downloads" not in query.fields
+    counts = query_crosstab(query)
+    # the collection row and the row without a language are left out
+    expected = pd.DataFrame(
+        [[1, 2, 0], [0, 0, 1], [1, 0, 0]],
+        index=pd.Index([2020, 2021, 2022], name="addedyear"),
+        columns=["de", "en", "fr"],
+    )
+    pd.testing.assert_frame_equal(counts, expected)
+
+
+def test_query_metrics(tmp_path):
+    dataset = cached_collection(tmp_path)
+    query = plan_query(dataset, COLUMNS, "mediatype", "downloads", CALENDAR_COLUMNS)
+    metrics = query_metrics(query)
+    assert metrics.columns.tolist() == [
+        "mediatype", "Count", "Sum", "Mean", "Median", "Min", "Max"
+    ]
+    assert metrics["mediatype"].tolist() == ["movies", "texts"]
+    assert metrics["Count"].tolist() == [3, 1]
+    assert metrics["Sum"].tolist() == [90, 30]
+    np.testing.assert_allclose(metrics["Mean"], [30, 30])
+
+
+def test_query_transforms(tmp_path):
+    dataset = cached_collection(tmp_path)
+    mapping = TransformStep("Value Mapping", {"mapping": {"texts": "Others"}})
+    transforms = {"mediatype": [mapping]}
+    query = plan_query(dataset, COLUMNS, "mediatype", "language", CALENDAR_COLUMNS, transforms)
+    assert query_crosstab(query).index.tolist() == ["Others", "movies"]
+
+    # steps are replayed in order
+    prefix = TransformStep("String Prefix", {"prefix_len": 3})
+    transforms = {"mediatype": [mapping, prefix]}
+    query = plan_query(dataset, COLUMNS, "mediatype", "language", CALENDAR_COLUMNS, transforms)
+    assert query_crosstab(query).index.tolist() == ["Oth", "mov"]
+
+    # values are mapped once, like in memory: movies don't become Others
+    chained = TransformStep("Value Mapping", {"mapping": {"movies": "texts", "texts": "Others"}})
+    query = plan_query(
+        dataset, COLUMNS, "mediatype", "language", CALENDAR_COLUMNS, {"mediatype": [chained]}
+    )
+    assert query_crosstab(query).index.tolist() == ["Others", "texts"]
+
+    transforms = {"addeddate": [TransformStep("Date Quarter", {})]}
+    query = plan_query(dataset, COLUMNS, "addeddate", "language", CALENDAR_COLUMNS, transforms)
+    assert query_crosstab(query).index.tolist() == [1, 2]
+
+    # needs the whole column, list elements, or isn't in the cache
+    transforms = {"downloads": [TransformStep("Numeric Bins", {"num_bins": 5})]}
+    assert plan_query(dataset, COLUMNS, "downloads", "language", {}, transforms) is None
+    transforms = {"language": [TransformStep("Value Mapping", {"mapping": {}})]}
+    assert plan_query(dataset, COLUMNS, "mediatype", "language", {}, transforms) is None
+    assert plan_query(dataset, COLUMNS, "files_count", "language", {}) is None
+
+
+def test_query_drops_the_rows_cleaning_drops(tmp_path, monkeypatch):
+    monkeypatch.setattr(iahelper, "collection_store", CacheStore(tmp_path, max_bytes=10**9))
+    n = 20
+    frame = pd.DataFrame(
+        {
+            "identifier": [f"item{i}" for i in range(n)],
+            "mediatype": ["texts", "movies", "collection", "audio"] * (n // 4),
+            "addeddate": [f"20{10 + i % 3}-01-01" for i in range(n)],
+            # items 0-3 miss both, too sparse to survive cleaning
+            "title": [None if i < 4 else f"title {i}" for i in range(n)],
+            "creator": [None if i < 4 else "someone" for i in range(n)],
+            # dropped as a column, so it doesn't count against any item
+            "rare": ["x" if i % 5 == 0 else None for i in range(n)],
+        }
+    )
+    table = frame_to_table(frame)
+    meta = {"fill": {col: n - table.column(col).null_count for col in table.column_names}}
+    iahelper.collection_store.put(iahelper.get_cache_key("x"), table, meta)
+
+    cleaned, info = clean_collection(iahelper.get_collection_frame("x", min_fill=0.8))
+    rows = cleaned.dropna(subset=REQUIRED_METADATA)
+    expected = pd.crosstab(rows["mediatype"].astype(str), rows["year"])
+
+    kept = cleaned_fields("x")
+    assert "rare" not in kept
+    dataset = open_collection("x")
+    query = plan_query(
+        dataset, REQUIRED_METADATA, "mediatype", "year", CALENDAR_COLUMNS, kept=kept
+    )
+    counts = query_crosstab(query)
+    assert counts.to_numpy().sum() == len(rows) == n - 4 - 4
+    np.testing.assert_array_equal(counts.to_numpy(), expected.to_numpy())
+    # without the cleaning rules, the sparse items are counted
+    query = plan_query(dataset, REQUIRED_METADATA, "mediatype", "year", CALENDAR_COLUMNS)
+    assert query_crosstab(query).to_numpy().sum() > len(rows)
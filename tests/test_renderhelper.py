@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+from ia_collection_analyzer.renderhelper import (
+    downsample,
+    lttb,
+    page_count,
+    table_page,
+    top_categories,
+)
+
+
+def test_top_categories():
+    counts = pd.DataFrame(
+        {"a": [1, 0], "b": [5, 5], "c": [2, 1], "d": [0, 4]}, index=[2020, 2021]
+    )
+    kept, _ = top_categories(counts, k=2)
+    assert kept.columns.tolist() == ["b", "d", "Other (2 more)"]
+    assert kept["Other (2 more)"].tolist() == [3, 1]
+    assert (kept.sum(axis=1) == counts.sum(axis=1)).all()
+
+    margins = pd.DataFrame({"a": [3.0, 0], "b": [1, 1], "c": [4, 0], "d": [1, 1]})
+    _, kept_margins = top_categories(counts, k=2, margins=margins.set_axis(counts.index))
+    assert kept_margins["Other (2 more)"].tolist() == [5.0, 0.0]
+
+    # a single left over category isn't worth an "Other"
+    assert top_categories(counts, k=3)[0] is counts
+
+
+def test_lttb_keeps_the_shape():
+    x = np.arange(1000)
+    y = np.zeros(1000)
+    y[437] = 100
+    y[700] = -50
+    kept = lttb(x, y, 20)
+    assert len(kept) == 20
+    assert kept[0] == 0 and kept[-1] == 999
+    assert 437 in kept and 700 in kept
+    assert (np.diff(kept) > 0).all()
+    assert len(lttb(x[:10], y[:10], 20)) == 10
+
+
+def test_downsample():
+    index = pd.date_range("2000-01-01", periods=5000, freq="D")
+    frame = pd.DataFrame(
+        {"Mean": np.sin(np.arange(5000) / 100), "Min": np.arange(5000)}, index=index
+    )
+    charted = downsample(frame, max_points=200)
+    assert len(charted) <= 200
+    assert charted.index.is_monotonic_increasing
+    assert len(downsample(frame.head(100), max_points=200)) == 100
+
+
+def test_table_pages():
+    table = pd.DataFrame({"n": range(250)})
+    assert page_count(len(table), 100) == 3
+    assert page_count(0, 100) == 1
+    assert table_page(table, 3, 100)["n"].tolist() == list(range(200, 250))
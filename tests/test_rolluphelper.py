@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+from ia_collection_analyzer import iahelper
+from ia_collection_analyzer.cachehelper import CacheStore
+from ia_collection_analyzer.pdhelper import clean_collection
+from ia_collection_analyzer.plothelper import (
+    build_list_index,
+    category_crosstab,
+    numeric_metrics,
+)
+from ia_collection_analyzer.rolluphelper import (
+    build_rollup,
+    load_rollup,
+    plan_rollup,
+    read_rollup,
+    rollup_crosstab,
+    rollup_metrics,
+)
+
+REQUIRED = ["identifier", "mediatype", "addeddate"]
+
+
+def cleaned_collection():
+    rng = np.random.default_rng(0)
+    n = 200
+    frame = pd.DataFrame(
+        {
+            "identifier": [f"item{i}" for i in range(n)],
+            "mediatype": rng.choice(["movies", "texts", "audio"], n),
+            "addeddate": pd.date_range("2019-01-01", periods=n, freq="5D").astype(str),
+            "language": [
+                ["eng", "fre"] if i % 7 == 0 else None if i % 11 == 0 else "eng"
+                for i in range(n)
+            ],
+            "item_size": rng.integers(1, 10**6, n),
+        }
+    )
+    return clean_collection(frame)
+
+
+def test_rollup_matches_the_rows():
+    df, info = cleaned_collection()
+    rollup = build_rollup(df, info["calendar_columns"])
+    assert rollup.lists == ["language"]
+    assert rollup.measures == ["item_size"]
+    # without a date column, addeddate gets both the year and addedyear grains
+    assert rollup.grains == {"": "addeddate", "added": "addeddate"}
+    assert plan_rollup(rollup, REQUIRED, "year", "mediatype") is not None
+
+    columns = REQUIRED + ["language"]
+    rows = df.dropna(subset=columns)
+    query = plan_rollup(rollup, columns, "addedyear", "language")
+    expected = category_crosstab(
+        rows["addedyear"],
+        build_list_index(df["language"]),
+        df.index.get_indexer(rows.index),
+    )
+    pd.testing.assert_frame_equal(
+        rollup_crosstab(query),
+        expected.sort_index().sort_index(axis=1),
+        check_names=False,
+        check_index_type=False,
+    )
+
+    # plots show the median, the rollup can't answer them
+    assert plan_rollup(rollup, REQUIRED, "mediatype", "item_size") is None
+    query = plan_rollup(rollup, REQUIRED, "mediatype", "item_size", with_median=False)
+    expected = numeric_metrics(df["mediatype"], df["item_size"])
+    metrics = rollup_metrics(query)
+    assert metrics.columns.tolist() == [c for c in expected.columns if c != "Median"]
+    assert metrics["mediatype"].tolist() == expected["mediatype"].astype(str).tolist()
+    for name in metrics.columns[1:]:
+        np.testing.assert_allclose(metrics[name], expected[name], err_msg=name)
+
+
+def test_uncovered_plots():
+    df, info = cleaned_collection()
+    df["date"] = df["addeddate"]
+    df["year"], df["month"] = df["addedyear"], df["addedmonth"]
+    rollup = build_rollup(df, {"": "date", "added": "addeddate"})
+    # dates of two grains, an x that isn't a key, a column not in the rollup
+    assert plan_rollup(rollup, REQUIRED, "year", "addedyear") is None
+    assert plan_rollup(rollup, REQUIRED, "language", "mediatype") is None
+    assert plan_rollup(rollup, REQUIRED + ["title"], "year", "mediatype") is None
+    assert plan_rollup(rollup, REQUIRED, "year", "mediatype") is not None
+
+
+def test_stored_rollup(tmp_path, monkeypatch):
+    monkeypatch.setattr(iahelper, "collection_store", CacheStore(tmp_path, max_bytes=10**9))
+    df, info = cleaned_collection()
+    built = load_rollup("demo", "v1", df, info["calendar_columns"])
+    stored = read_rollup("demo", "v1")
+    assert stored.grains == built.grains and stored.lists == built.lists
+    query = plan_rollup(stored, REQUIRED, "addedyear", "mediatype")
+    pd.testing.assert_frame_equal(
+        rollup_crosstab(query),
+        rollup_crosstab(plan_rollup(built, REQUIRED, "addedyear", "mediatype")),
+    )
+    # a refreshed cache has a new version, the rollup is built again
+    assert read_rollup("demo", "v2") is None
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+from ia_collection_analyzer.plothelper import (
+    build_list_index,
+    category_crosstab,
+    numeric_metrics,
+)
+from ia_collection_analyzer.samplehelper import (
+    CountMinSketch,
+    HyperLogLog,
+    sample_crosstab,
+    sample_metrics,
+    sample_value_counts,
+    sketch_column,
+    sketch_value_counts,
+    stratified_sample,
+)
+
+
+def make_frame(n=20000, seed=1):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "year": rng.choice([2020, 2021, 2022, 2023], n, p=[0.1, 0.2, 0.3, 0.4]),
+            "mediatype": pd.Categorical(rng.choice(["movies", "texts"], n, p=[0.9, 0.1])),
+            "language": [["en"] if r < 0.6 else ["de", "en"] for r in rng.random(n)],
+            "downloads": rng.lognormal(3, 1, n),
+        },
+        index=np.arange(n) * 2,
+    )
+
+
+def test_stratified_sample():
+    strata = pd.Series(["a"] * 900 + ["b"] * 90 + ["c"] * 10 + [None] * 50)
+    sample = stratified_sample(strata, 100, min_per_stratum=20)
+    assert sample.sizes.tolist() == [900, 90, 10, 50]
+    # proportional, at least 20 rows, at most the whole stratum
+    assert sample.sampled.tolist() == [86, 20, 10, 20]
+    assert len(sample.positions) == sample.sampled.sum()
+    assert len(np.unique(sample.positions)) == len(sample.positions)
+    assert sample.weights.sum() == len(strata)
+    assert (strata.iloc[sample.positions[sample.strata == 2]] == "c").all()
+
+
+def test_sample_estimates_are_exact_on_a_census():
+    frame = make_frame(2000)
+    sample = stratified_sample(frame["year"], len(frame))
+    y_index = build_list_index(frame["language"])
+
+    counts, margins = sample_crosstab(frame["year"], y_index, sample)
+    expected = category_crosstab(frame["year"], y_index)
+    pd.testing.assert_frame_equal(counts, expected.astype(float), check_names=False)
+    assert (margins == 0).all().all()
+
+    metrics = sample_metrics(frame["mediatype"], frame["downloads"], sample)
+    expected = numeric_metrics(frame["mediatype"], frame["downloads"])
+    np.testing.assert_allclose(metrics["Count"], expected["Count"])
+    np.testing.assert_allclose(metrics["Mean"], expected["Mean"])
+    np.testing.assert_allclose(metrics["Mean high"], metrics["Mean low"])
+
+
+def test_sample_estimates_cover_exact_values():
+    frame = make_frame()
+    sample = stratified_sample(frame["year"], 2000)
+    positions = np.arange(len(frame))
+    counts, margins = sample_crosstab(
+        frame["year"], build_list_index(frame["language"]), sample, positions
+    )
+    expected = category_crosstab(frame["year"], build_list_index(frame["language"]))
+    # 95% intervals, allow a few misses
+    assert ((counts - expected).abs() <= margins * 1.5 + 1e-6).all().all()
+
+    metrics = sample_metrics(frame["mediatype"], frame["downloads"], sample)
+    expected = numeric_metrics(frame["mediatype"], frame["downloads"])["Mean"]
+    assert (metrics["Mean low"] <= expected * 1.05).all()
+    assert (metrics["Mean high"] >= expected * 0.95).all()
+
+    value_counts = sample_value_counts(frame["mediatype"], sample)
+    assert value_counts.index.tolist() == ["movies", "texts"]
+    assert abs(value_counts["movies"] - (frame["mediatype"] == "movies").sum()) < 500
+
+
+def test_hyperloglog():
+    sketch = HyperLogLog(precision=12)
+    sketch.add(pd.Series([f"id{i}" for i in range(50000)]))
+    assert abs(sketch.count() - 50000) < 50000 * 0.05
+
+    small = HyperLogLog(precision=12)
+    small.add(pd.Series(["a", "b", "a", None]))
+    assert small.count() == 2
+    small.merge(sketch)
+    assert small.count() == sketch.count()
+
+
+def test_count_min_sketch_never_underestimates():
+    values = pd.Series(np.random.default_rng(2).zipf(1.5, 20000) % 1000).astype(str)
+    sketch = CountMinSketch(width=256, depth=4)
+    sketch.add(values)
+    expected = values.value_counts()
+    estimates = sketch.estimate(pd.Series(expected.index))
+    assert (estimates >= expected.to_numpy()).all()
+    assert sketch.total == len(values)
+
+    column = sketch_column(pd.Series(["a", "b", "a", None]))
+    counts = sketch_value_counts(column, pd.Index(["b", "a"]))
+    assert counts.to_dict() == {"a": 2, "b": 1}
+    assert column.distinct.count() == 2
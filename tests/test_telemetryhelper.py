@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+import requests
+
+from ia_collection_analyzer.telemetryhelper import (
+    Histogram,
+    RequestTelemetry,
+    summary_rows,
+)
+
+
+def make_response(url, status=200, content=b"{}", seconds=0.2):
+    response = requests.Response()
+    response.url = url
+    response.status_code = status
+    response._content = content
+    response.elapsed = timedelta(seconds=seconds)
+    response.request = requests.Request("POST", url).prepare()
+    return response
+
+
+def test_histogram_quantiles():
+    histogram = Histogram([0.1, 1, 10])
+    for value in [0.05] * 8 + [0.5, 20]:
+        histogram.add(value)
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.9) == 1
+    assert histogram.quantile(0.99) == 20
+    assert histogram.to_dict()["buckets"] == {"0.1": 8, "1": 1, "10": 0, "inf": 1}
+
+
+def test_request_telemetry_counts_and_resets():
+    telemetry = RequestTelemetry(sample_rate=1.0)
+    url = "https://archive.org/services/search/v1/scrape"
+    telemetry.response_hook(make_response(url + "?q=collection:x", content=b"x" * 100))
+    telemetry.response_hook(make_response(url + "?cursor=1", status=503, seconds=2))
+
+    summary = telemetry.emit("x")
+    stats = summary["endpoints"][url]
+    assert stats["requests"] == 2
+    assert stats["bytes"] == 102
+    assert stats["statuses"] == {"200": 1, "503": 1}
+    assert stats["latency"]["max"] >= 2
+    assert telemetry.last_summary("x") is summary
+    assert summary_rows(summary)[0]["requests"] == 2
+    assert telemetry.emit("x")["endpoints"] == {}
@@ -0,0 +1,80 @@
+import threading
+from datetime import timedelta
+
+import requests
+
+from ia_collection_analyzer.throttlehelper import (
+    AdaptiveLimiter,
+    backoff_delay,
+    is_throttled,
+    retry_after_seconds,
+)
+
+
+def make_response(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response.elapsed = timedelta(0)
+    return response
+
+
+def test_backoff_delay():
+    for attempt in range(1, 6):
+        delay = backoff_delay(attempt)
+        assert 2 ** (attempt - 1) <= delay <= 2**attempt
+    assert backoff_delay(10) <= 120
+    assert 30 <= backoff_delay(1, retry_after=30) <= 31
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds(make_response(429, {"Retry-After": "12"})) == 12
+    assert retry_after_seconds(make_response(429)) is None
+    assert retry_after_seconds(None) is None
+    assert retry_after_seconds(
+        make_response(503, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})
+    ) == 0
+
+
+def test_is_throttled():
+    assert is_throttled(make_response(429))
+    assert is_throttled(make_response(503))
+    assert not is_throttled(make_response(200))
+
+
+def test_adaptive_limiter_aimd():
+    limiter = AdaptiveLimiter(initial=4, max_limit=6)
+    for _ in range(4):
+        limiter.record_success()
+    assert limiter.limit == 5
+    limiter.record_throttle(retry_after=0)
+    assert limiter.limit == 2
+    limiter.paused_until = 0
+    limiter.record_throttle(retry_after=0)
+    limiter.record_throttle(retry_after=0)  # same pause, counted once
+    assert limiter.limit == 1
+    for _ in range(100):
+        limiter.record_success()
+    assert limiter.limit == 6
+
+
+def test_adaptive_limiter_caps_in_flight():
+    limiter = AdaptiveLimiter(initial=2, max_limit=2)
+    peak = 0
+    lock = threading.Lock()
+    release = threading.Event()
+
+    def request():
+        nonlocal peak
+        with limiter.slot():
+            with lock:
+                peak = max(peak, limiter.in_flight)
+            release.wait(0.05)
+
+    threads = [threading.Thread(target=request) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert peak == 2
+    assert limiter.in_flight == 0
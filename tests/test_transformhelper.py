@@ -0,0 +1,75 @@
+import pandas as pd
+from ia_collection_analyzer.plothelper import build_list_index
+from ia_collection_analyzer.transformhelper import (
+    TransformPipeline,
+    TransformResult,
+    TransformStep,
+    apply_step,
+    chain_keys,
+)
+
+PREFIX = TransformStep("String Prefix", {"prefix_len": 2})
+MAPPING = TransformStep("Value Mapping", {"mapping": {"en": "English"}})
+
+
+def test_chain_keys():
+    other = TransformStep("String Prefix", {"prefix_len": 3})
+    keys = chain_keys("base", [PREFIX, MAPPING])
+    edited = chain_keys("base", [other, MAPPING])
+    assert len(keys) == 3
+    assert keys[0] == edited[0]
+    assert keys[1] != edited[1] and keys[2] != edited[2]
+    assert chain_keys("other base", [PREFIX])[1] != keys[1]
+
+
+def test_apply_step():
+    series = pd.Series(["english", "french", None], index=[5, 6, 7])
+    prefixed = apply_step(TransformResult(series, None), PREFIX)
+    assert prefixed.values.tolist()[:2] == ["en", "fr"]
+    assert prefixed.values.index.tolist() == [5, 6, 7]
+
+    categorical = pd.Series(pd.Categorical(["english", None, "french"]))
+    prefixed = apply_step(TransformResult(categorical, None), PREFIX).values
+    assert prefixed.cat.categories.tolist() == ["en", "fr"]
+    assert prefixed.isna().tolist() == [False, True, False]
+
+    dates = pd.Series(["2020-02-01", "2021-11-30", "2022"])
+    quarters = apply_step(TransformResult(dates, None), TransformStep("Date Quarter", {}))
+    assert quarters.values.tolist() == [1, 4, 1]
+
+    lists = pd.Series([["english", "french"], None, ["english"]])
+    result = apply_step(TransformResult(lists, build_list_index(lists)), PREFIX)
+    assert result.values.tolist() == [["en", "fr"], None, ["en"]]
+    assert result.list_index.categories.tolist() == ["en", "fr"]
+
+
+def test_pipeline_recomputes_only_downstream_steps():
+    series = pd.Series(["english", "french", "german"])
+    loads = []
+
+    def base():
+        loads.append(1)
+        return TransformResult(series, None)
+
+    pipeline = TransformPipeline()
+    pipeline.set_step("language", PREFIX)
+    pipeline.set_step("language", MAPPING)
+    result = pipeline.evaluate("language", "v1", base)
+    assert result.values.tolist() == ["English", "fr", "ge"]
+    assert len(loads) == 1
+    before = pipeline.evaluate("language", "v1", base, upto=1)
+    assert before.values.tolist() == ["en", "fr", "ge"]
+
+    # the prefixed column is cached, only the mapping runs again
+    key = pipeline.key("language", "v1")
+    pipeline.set_step("language", TransformStep("Value Mapping", {"mapping": {"fr": "French"}}), 1)
+    assert pipeline.key("language", "v1") != key
+    result = pipeline.evaluate("language", "v1", base)
+    assert result.values.tolist() == ["en", "French", "ge"]
+    assert len(loads) == 1
+
+    pipeline.evaluate("language", "v2", base)
+    assert len(loads) == 2
+    pipeline.remove_step("language", 0)
+    pipeline.remove_step("language", 0)
+    assert pipeline.steps == {}